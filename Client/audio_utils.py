@@ -1,22 +1,364 @@
-import pygame
+import os
+import queue
+import shlex
+import shutil
 import subprocess
+import threading
+import time
+from collections import deque
+
+from Logger import Logger
+from yaRException import yaRException, yaRErrorCodes
+
+# Speech capture. AUDIO_CAPTURE_FORMAT is "flac" (lossless) or "opus"
+# (smallest), both downmixed to mono at AUDIO_SAMPLE_RATE and encoded by
+# ffmpeg while recording, or "wav" for the original 48 kHz stereo 32-bit WAV.
+# Without ffmpeg, recordings fall back to WAV.
+# AUDIO_RECORD_COMMAND replaces arecord, e.g. with fake_recorder.py for
+# testing without a microphone; it must write raw S32_LE 48 kHz stereo PCM
+# to stdout.
+AUDIO_CAPTURE_FORMAT = os.getenv("AUDIO_CAPTURE_FORMAT", "flac").lower()
+AUDIO_SAMPLE_RATE = int(os.getenv("AUDIO_SAMPLE_RATE", "16000"))
+AUDIO_OPUS_BITRATE = os.getenv("AUDIO_OPUS_BITRATE", "24k")
+AUDIO_RECORD_COMMAND = os.getenv("AUDIO_RECORD_COMMAND")
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+# Format of the raw PCM coming from the microphone.
+MIC_DEVICE = "dmic_sv"
+MIC_SAMPLE_RATE = 48000
+MIC_CHANNELS = 2
+
+# Capture format -> (file extension, content type). The format name is what
+# the server expects in the X-Audio-Format header.
+AUDIO_FORMATS = {
+    "wav": (".wav", "audio/wav"),
+    "flac": (".flac", "audio/flac"),
+    "opus": (".ogg", "audio/ogg"),
+}
+
+# Playback. The mixer is opened once, at PLAYBACK_SAMPLE_RATE mono (the rate
+# of the server's speech) with a PLAYBACK_MIXER_BUFFER sample buffer, and kept
+# open. With PLAYBACK_STREAM=1 responses play while they download: they are
+# decoded by ffmpeg as they arrive and played in PLAYBACK_BLOCK_MS blocks,
+# starting once PLAYBACK_PREBUFFER_MS of audio is buffered.
+PLAYBACK_STREAM = os.getenv("PLAYBACK_STREAM", "1") == "1"
+PLAYBACK_SAMPLE_RATE = int(os.getenv("PLAYBACK_SAMPLE_RATE", "24000"))
+PLAYBACK_MIXER_BUFFER = int(os.getenv("PLAYBACK_MIXER_BUFFER", "1024"))
+PLAYBACK_PREBUFFER_MS = int(os.getenv("PLAYBACK_PREBUFFER_MS", "300"))
+PLAYBACK_BLOCK_MS = int(os.getenv("PLAYBACK_BLOCK_MS", "100"))
+
+# Formats the server said it accepts, once it has rejected one. Until then
+# the configured format is used.
+_server_formats = None
+_ffmpeg_missing_logged = False
+
+
+def init_mixer():
+    """
+    Open the pygame mixer unless it is open already. Called before every playback, but only the first call opens
+    the audio device, so later responses start without that delay.
+    """
+    # pygame is only needed for playback, so recording and uploading work without it.
+    import pygame
+
+    if not pygame.mixer.get_init():
+        pygame.mixer.init(frequency=PLAYBACK_SAMPLE_RATE, size=-16, channels=1, buffer=PLAYBACK_MIXER_BUFFER)
+
 
 def play_audio(audio_path):
     """
-    Play audio using the pygame library. This function is used to play the response audio after the video and audio files are processed. 
+    Play audio using the pygame library. This function is used to play the response audio after the video and audio files are processed.
 
     Also used to play auditory feedback when the button is pressed.
     """
-    pygame.mixer.init()
+    import pygame
+
+    init_mixer()
     pygame.mixer.music.load(audio_path)
     pygame.mixer.music.play()
     while pygame.mixer.music.get_busy():
         pygame.time.Clock().tick(10)
 
-def record_audio(audio_path):
+
+def set_server_formats(formats):
+    """
+    Remember the audio formats the server accepts, so later recordings use one of them.
+    """
+    global _server_formats
+    _server_formats = [audio_format for audio_format in formats if audio_format in AUDIO_FORMATS]
+
+
+def capture_format():
+    """
+    The format the next recording is captured in: the configured one, unless the server rejected it or ffmpeg,
+    which encodes the compact formats, is not installed.
+    """
+    global _ffmpeg_missing_logged
+    if AUDIO_CAPTURE_FORMAT not in AUDIO_FORMATS:
+        return "wav"
+    if _server_formats is not None and AUDIO_CAPTURE_FORMAT not in _server_formats:
+        return "wav"
+    if AUDIO_CAPTURE_FORMAT != "wav" and not shutil.which(FFMPEG_BINARY):
+        if not _ffmpeg_missing_logged:
+            Logger().logger.warning(f"{FFMPEG_BINARY} not found, recording {AUDIO_CAPTURE_FORMAT} audio as WAV instead.")
+            _ffmpeg_missing_logged = True
+        return "wav"
+    return AUDIO_CAPTURE_FORMAT
+
+
+def audio_format_of(audio_path):
+    """
+    The capture format of an audio file, from its extension. Unknown extensions count as WAV.
+    """
+    extension = os.path.splitext(audio_path)[1].lower()
+    for audio_format, (format_extension, _) in AUDIO_FORMATS.items():
+        if extension == format_extension:
+            return audio_format
+    return "wav"
+
+
+def _recorder_command(raw):
+    if AUDIO_RECORD_COMMAND:
+        return shlex.split(AUDIO_RECORD_COMMAND)
+    command = ["arecord", "-D", MIC_DEVICE, f"-c{MIC_CHANNELS}", "-r", str(MIC_SAMPLE_RATE), "-f", "S32_LE"]
+    return command + (["-t", "raw"] if raw else ["-t", "wav", "-V", "mono", "-v"])
+
+
+# ffmpeg muxer of each compact format.
+_MUXERS = {"flac": "flac", "opus": "ogg"}
+
+
+def _encoder_command(audio_format):
+    command = [
+        FFMPEG_BINARY, "-nostdin", "-v", "error", "-y",
+        "-f", "s32le", "-ar", str(MIC_SAMPLE_RATE), "-ac", str(MIC_CHANNELS), "-i", "pipe:0",
+        "-ac", "1", "-ar", str(AUDIO_SAMPLE_RATE),
+    ]
+    if audio_format == "opus":
+        command += ["-c:a", "libopus", "-b:a", AUDIO_OPUS_BITRATE, "-application", "voip"]
+    else:
+        command += ["-c:a", "flac", "-sample_fmt", "s16"]
+    # Written to stdout, which is not seekable, so ffmpeg never goes back to patch a header: the file only
+    # grows while recording and can be uploaded in chunks before it is complete.
+    return command + ["-f", _MUXERS[audio_format], "pipe:1"]
+
+
+class AudioRecording:
+    """
+    A recording in progress. Behaves like the arecord process it used to be: call terminate() to stop
+    recording and wait() for the file to be complete, then check returncode.
+
+    For compact formats arecord (or AUDIO_RECORD_COMMAND) pipes raw PCM into ffmpeg, which downmixes,
+    resamples and encodes it as it arrives, so the file is ready as soon as recording stops. Those files are
+    append-only while recording; a WAV file's header is only filled in when arecord stops.
+    """
+
+    def __init__(self, path, recorder, encoder=None):
+        self.path = path
+        self.recorder = recorder
+        self.encoder = encoder
+
+    def terminate(self):
+        # Stopping the recorder closes the pipe, and ffmpeg finishes the file at end of input.
+        self.recorder.terminate()
+
+    def wait(self, timeout=None):
+        self.recorder.wait(timeout)
+        if self.encoder is not None:
+            return self.encoder.wait(timeout)
+        return self.recorder.returncode
+
+    @property
+    def append_only(self):
+        # Whether the file only grows while recording, so it can be uploaded before it is complete.
+        return self.encoder is not None
+
+    @property
+    def returncode(self):
+        if self.encoder is not None:
+            return self.encoder.returncode
+        return self.recorder.returncode
+
+
+def record_audio(audio_path, audio_format=None):
     """
     Record audio using the built in arecord command. Starting a new process to record audio to prevent blocking the main thread.
+
+    The extension of audio_path is replaced to match the capture format; the path actually written is
+    the `path` of the returned recording.
+
+    Raises:
+        yaRException: If the recorder or, for compact formats, ffmpeg could not be started.
+    """
+    audio_format = audio_format or capture_format()
+    extension, _ = AUDIO_FORMATS[audio_format]
+    audio_path = os.path.splitext(audio_path)[0] + extension
+
+    try:
+        if audio_format == "wav":
+            process = subprocess.Popen(_recorder_command(raw=False) + [audio_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return AudioRecording(audio_path, process)
+        recorder = subprocess.Popen(_recorder_command(raw=True), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        Logger().logger.error(f"Could not start recording: {e}")
+        raise yaRException(yaRErrorCodes.AUDIO_RECORDING_FAILED)
+
+    try:
+        with open(audio_path, "wb") as audio_file:
+            encoder = subprocess.Popen(_encoder_command(audio_format), stdin=recorder.stdout, stdout=audio_file, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        # Without the encoder nothing reads the recorder's output; do not leave it running.
+        recorder.terminate()
+        recorder.wait()
+        Logger().logger.error(f"Could not start {FFMPEG_BINARY} to encode {audio_format}: {e}")
+        raise yaRException(yaRErrorCodes.AUDIO_RECORDING_FAILED)
+    finally:
+        # Only ffmpeg should hold the read end, so it sees end of input when the recorder exits.
+        recorder.stdout.close()
+    return AudioRecording(audio_path, recorder, encoder)
+
+
+def transcode_to_wav(audio_path):
+    """
+    Convert a compact recording to 16-bit WAV, for servers that do not accept the compact formats.
+
+    Returns:
+        str: Path of the WAV file.
+    """
+    wav_path = os.path.splitext(audio_path)[0] + ".wav"
+    command = [FFMPEG_BINARY, "-nostdin", "-v", "error", "-y", "-i", audio_path, "-c:a", "pcm_s16le", wav_path]
+    subprocess.run(command, check=True)
+    return wav_path
+
+
+class StreamingPlayback:
+    """
+    Play an MP3 while it is still downloading.
+
+    One thread feeds the downloaded bytes to ffmpeg (and to save_path, if given), another reads the decoded PCM
+    in blocks into a jitter buffer, and play() queues those blocks on a mixer channel. Playback starts once
+    PLAYBACK_PREBUFFER_MS of audio is buffered; if the download falls behind, playback pauses until that much is
+    buffered again, instead of stuttering block by block. Needs ffmpeg.
+
+    Usage:
+        StreamingPlayback(save_path="response.mp3").play(response.iter_content(chunk_size=4096))
     """
-    command = ["arecord", "-D", "dmic_sv", "-c2", "-r", "48000", "-f", "S32_LE", "-t", "wav", "-V", "mono", "-v", audio_path]
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return process
+
+    def __init__(self, save_path=None, prebuffer_ms=PLAYBACK_PREBUFFER_MS, block_ms=PLAYBACK_BLOCK_MS):
+        self.save_path = save_path
+        self.prebuffer_ms = prebuffer_ms
+        self.block_ms = block_ms
+        self.underruns = 0
+        self.first_sound_after = None
+        self.error = None
+        self._blocks = queue.Queue()
+
+    def _decoder_command(self, frequency, channels):
+        return [
+            FFMPEG_BINARY, "-nostdin", "-v", "error", "-f", "mp3", "-i", "pipe:0",
+            "-f", "s16le", "-ac", str(channels), "-ar", str(frequency), "pipe:1",
+        ]
+
+    def _feed(self, chunks, decoder):
+        save_file = open(self.save_path, "wb") if self.save_path else None
+        try:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if save_file:
+                    save_file.write(chunk)
+                decoder.stdin.write(chunk)
+                decoder.stdin.flush()
+        except Exception as e:
+            # A broken download plays as far as it got.
+            self.error = e
+        finally:
+            if save_file:
+                save_file.close()
+            try:
+                decoder.stdin.close()
+            except OSError:
+                pass
+
+    def _decode(self, decoder, block_bytes):
+        while True:
+            block = decoder.stdout.read(block_bytes)
+            if not block:
+                break
+            self._blocks.put(block)
+        # End of stream.
+        self._blocks.put(None)
+
+    def _buffer(self, buffered, count):
+        """
+        Move blocks from the decoder into `buffered`, waiting until it holds `count` blocks. Returns False once
+        the stream has ended.
+        """
+        while len(buffered) < count:
+            block = self._blocks.get()
+            if block is None:
+                return False
+            buffered.append(block)
+        return True
+
+    def _take_decoded(self, buffered):
+        """
+        Move the blocks decoded so far into `buffered`, without waiting. Returns False once the stream has ended.
+        """
+        while True:
+            try:
+                block = self._blocks.get_nowait()
+            except queue.Empty:
+                return True
+            if block is None:
+                return False
+            buffered.append(block)
+
+    def play(self, chunks):
+        """
+        Download and play. Returns when playback is complete.
+
+        Args:
+            chunks: Iterable of MP3 bytes, e.g. response.iter_content().
+        """
+        import pygame
+
+        started = time.monotonic()
+        init_mixer()
+        frequency, size, channels = pygame.mixer.get_init()
+        block_bytes = frequency * channels * abs(size) // 8 * self.block_ms // 1000
+        prebuffer_blocks = max(1, self.prebuffer_ms // self.block_ms)
+
+        decoder = subprocess.Popen(
+            self._decoder_command(frequency, channels),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        )
+        threading.Thread(target=self._feed, args=(chunks, decoder), daemon=True).start()
+        threading.Thread(target=self._decode, args=(decoder, block_bytes), daemon=True).start()
+
+        channel = pygame.mixer.find_channel(True)
+        buffered = deque()
+        more = self._buffer(buffered, prebuffer_blocks)
+        playing = False
+        while buffered or more:
+            if more:
+                more = self._take_decoded(buffered)
+            if not channel.get_busy():
+                if playing and more and len(buffered) < prebuffer_blocks:
+                    # The download fell behind and everything buffered has played: buffer up again.
+                    self.underruns += 1
+                    more = self._buffer(buffered, prebuffer_blocks)
+                if buffered:
+                    channel.play(pygame.mixer.Sound(buffer=buffered.popleft()))
+                    if not playing:
+                        playing = True
+                        self.first_sound_after = time.monotonic() - started
+            if buffered and channel.get_queue() is None:
+                # A channel holds one queued sound, which starts the moment the current one ends.
+                channel.queue(pygame.mixer.Sound(buffer=buffered.popleft()))
+            time.sleep(self.block_ms / 4000)
+
+        while channel.get_busy():
+            pygame.time.Clock().tick(50)
+        decoder.wait()
+        decoder.stdout.close()
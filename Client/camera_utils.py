@@ -0,0 +1,155 @@
+"""
+On-device frame preselection: while the button is held, frames are scored for sharpness and only the sharpest
+one is kept, so the Pi can upload a single JPEG instead of the whole video.
+
+Try it without a camera:
+
+    python3 camera_utils.py --seconds 3
+"""
+import argparse
+import io
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+# FRAME_PRESELECT=1 uploads the sharpest frame instead of the video. Frames are scored every
+# FRAME_SAMPLE_INTERVAL seconds, downscaled by FRAME_SCORE_STEP in each direction first, and the kept
+# frame is sent as a JPEG of FRAME_JPEG_QUALITY.
+FRAME_PRESELECT = os.getenv("FRAME_PRESELECT", "0") == "1"
+FRAME_SAMPLE_INTERVAL = float(os.getenv("FRAME_SAMPLE_INTERVAL", "0.1"))
+FRAME_SCORE_STEP = int(os.getenv("FRAME_SCORE_STEP", "4"))
+FRAME_JPEG_QUALITY = int(os.getenv("FRAME_JPEG_QUALITY", "90"))
+
+
+def sharpness(frame, step=FRAME_SCORE_STEP):
+    """
+    Variance of the Laplacian of a frame's luma, the same measure the server uses. Higher is sharper.
+
+    Args:
+        frame (numpy.ndarray): An (H, W, 3) or (H, W, 4) RGB(X) frame, or an (H, W) grayscale one.
+        step (int): Only every step-th pixel in each direction is scored.
+    """
+    pixels = frame[::step, ::step]
+    if pixels.ndim == 3:
+        gray = pixels[..., 0] * 0.299 + pixels[..., 1] * 0.587 + pixels[..., 2] * 0.114
+    else:
+        gray = pixels.astype(np.float32)
+    laplacian = gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4 * gray[1:-1, 1:-1]
+    return float(laplacian.var())
+
+
+def encode_jpeg(frame, quality=FRAME_JPEG_QUALITY):
+    """
+    Encode an RGB(X) frame as JPEG bytes.
+    """
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(frame[..., :3])).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class FrameSelector:
+    """
+    Keep the sharpest frame from a camera while recording.
+
+    A background thread calls `camera.capture_array()` every `interval` seconds and keeps a copy of the frame
+    only when it beats the best score so far, so memory stays at one frame. With Picamera2 the frames come
+    from the main stream, which in the default XBGR8888 format holds RGBX pixels.
+
+    Usage:
+        selector = FrameSelector(picam2)
+        selector.start()
+        ...
+        jpeg = selector.stop()
+    """
+
+    def __init__(self, camera, interval=FRAME_SAMPLE_INTERVAL):
+        self.camera = camera
+        self.interval = interval
+        self.best_frame = None
+        self.best_score = -1.0
+        self.frames_scored = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.best_frame, self.best_score, self.frames_scored = None, -1.0, 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.offer(self.camera.capture_array())
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def offer(self, frame):
+        """
+        Score a frame and keep it if it is the sharpest so far.
+        """
+        score = sharpness(frame)
+        self.frames_scored += 1
+        if score > self.best_score:
+            self.best_score = score
+            self.best_frame = frame.copy()
+
+    def stop(self):
+        """
+        Stop sampling and return the sharpest frame as JPEG bytes, or None if no frame was captured.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.best_frame is None:
+            return None
+        jpeg = encode_jpeg(self.best_frame)
+        self.best_frame = None
+        return jpeg
+
+
+class FakeCamera:
+    """
+    Stand-in for Picamera2 that returns synthetic RGBX frames, blurred most of the time like a camera being
+    moved around, for testing FrameSelector without a camera.
+    """
+
+    def __init__(self, width=640, height=480, sharp_every=7, seed=0):
+        self.width = width
+        self.height = height
+        self.sharp_every = sharp_every
+        self.frames = 0
+        rng = np.random.default_rng(seed)
+        self._scene = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+    def capture_array(self, name="main"):
+        self.frames += 1
+        scene = np.roll(self._scene, self.frames * 3, axis=1)
+        if self.frames % self.sharp_every:
+            # Box blur of growing width, cheap enough without OpenCV.
+            radius = 1 + self.frames % self.sharp_every
+            scene = scene.astype(np.float32)
+            for axis in (0, 1):
+                scene = sum(np.roll(scene, shift, axis=axis) for shift in range(-radius, radius + 1)) / (2 * radius + 1)
+            scene = scene.astype(np.uint8)
+        alpha = np.full((self.height, self.width, 1), 255, dtype=np.uint8)
+        return np.concatenate([scene, alpha], axis=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preselect the sharpest frame from a fake camera.")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--output", default="best_frame.jpg")
+    args = parser.parse_args()
+
+    selector = FrameSelector(FakeCamera())
+    selector.start()
+    time.sleep(args.seconds)
+    jpeg = selector.stop()
+    with open(args.output, "wb") as output:
+        output.write(jpeg)
+    print(f"Scored {selector.frames_scored} frames, best sharpness {selector.best_score:.1f}, "
+          f"wrote {len(jpeg)} bytes to {args.output}")
@@ -0,0 +1,67 @@
+"""
+Stand-in for arecord that writes synthetic speech-like PCM to stdout, for testing capture without a microphone:
+
+    AUDIO_RECORD_COMMAND="python3 fake_recorder.py" python3 main.py
+
+The output has the microphone's format (raw S32_LE, 48 kHz, stereo) and is written in real time until the
+process is terminated, or for --seconds if given.
+"""
+import argparse
+import math
+import signal
+import struct
+import sys
+import time
+
+# The microphone's format, as captured by audio_utils.
+MIC_SAMPLE_RATE = 48000
+MIC_CHANNELS = 2
+
+# Samples written per chunk; 20 ms at 48 kHz.
+CHUNK_FRAMES = 960
+
+
+def speech_like_samples(start, count, sample_rate=MIC_SAMPLE_RATE):
+    """
+    A harmonic series with a gliding pitch, gated into syllable-length bursts, scaled to 32-bit.
+    """
+    samples = []
+    for index in range(start, start + count):
+        t = index / sample_rate
+        pitch = 140 + 30 * math.sin(2 * math.pi * 0.5 * t)
+        phase = 2 * math.pi * pitch * t
+        signal_value = sum(math.sin(harmonic * phase) / harmonic for harmonic in range(1, 6))
+        envelope = max(0.0, math.sin(2 * math.pi * 4 * t))
+        samples.append(int(0.3 * 2147483647 * signal_value * envelope / 2.3))
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic S32_LE 48 kHz stereo PCM to stdout.")
+    parser.add_argument("--seconds", type=float, help="Stop after this long; default runs until terminated")
+    args = parser.parse_args(argv)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    output = sys.stdout.buffer
+    total = int(args.seconds * MIC_SAMPLE_RATE) if args.seconds else None
+    written, start_time = 0, time.monotonic()
+    try:
+        while total is None or written < total:
+            count = CHUNK_FRAMES if total is None else min(CHUNK_FRAMES, total - written)
+            frames = []
+            for sample in speech_like_samples(written, count):
+                frames.extend([sample] * MIC_CHANNELS)
+            output.write(struct.pack(f"<{len(frames)}i", *frames))
+            output.flush()
+            written += count
+            # Keep to real time, like a microphone.
+            delay = start_time + written / MIC_SAMPLE_RATE - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    except BrokenPipeError:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
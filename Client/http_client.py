@@ -0,0 +1,117 @@
+"""
+One long-lived HTTP session for everything the Pi sends to the server, so repeat interactions reuse a warm
+keep-alive connection instead of opening a new one (and doing a new TLS handshake) every time.
+
+Server settings are read from the environment once, when this module is imported.
+"""
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from urllib3.exceptions import NewConnectionError
+
+load_dotenv()
+
+VIDEO_PROCESSING_URL = os.getenv("VIDEO_PROCESSING_URL")
+API_TOKEN = os.getenv("API_TOKEN")
+
+# Requests give up connecting after HTTP_CONNECT_TIMEOUT seconds, and waiting for the next bytes of the answer
+# after HTTP_READ_TIMEOUT seconds (which has to cover the server's processing before the first byte). Failed
+# connections and 502/503/504 answers are retried HTTP_RETRIES times, after a random delay of up to
+# HTTP_BACKOFF * 2^attempt seconds, capped at HTTP_BACKOFF_MAX. POSTs are not idempotent, so they are only retried
+# when they cannot have reached the server: see request().
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))
+
+TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+RETRY_STATUSES = {502, 503, 504}
+# A gateway timeout may come after the server processed the request.
+RETRY_STATUSES_NOT_IDEMPOTENT = {502, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Errors that mean the server could not be reached, as opposed to an answer it gave.
+NETWORK_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    The shared requests session, created on first use. Its pool holds a few connections, since chunks of a
+    resumable upload are sent from several threads at once.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def backoff_delay(attempt):
+    """
+    Seconds to wait before retry number attempt (from 0). Random between 0 and the exponential bound, so Pis
+    that lost the network together do not all come back at the same moment.
+    """
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF * 2 ** attempt))
+
+
+def never_sent(error):
+    """
+    Whether a network error happened before the request could reach the server: the connection was refused, its
+    host not found or connecting timed out. Other ConnectionErrors, like "Connection aborted", and read timeouts
+    can come after the body was sent, when the server may be processing it.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError) or not error.args:
+        return False
+    # requests wraps urllib3's MaxRetryError, whose reason is the error of the last attempt.
+    reason = getattr(error.args[0], "reason", error.args[0])
+    return isinstance(reason, NewConnectionError)
+
+
+def request(method, url, rewind=(), retries=HTTP_RETRIES, **kwargs):
+    """
+    Send a request through the shared session, retrying failed connections and overloaded servers.
+
+    Only idempotent methods are retried after a read timeout, a dropped connection or a 504, since the server may
+    have processed the request already; other methods only when it was never_sent().
+
+    Args:
+        rewind: File objects sent in the body, seeked back to the start before each retry.
+        retries: How often to retry.
+        kwargs: Passed on to requests, with the default timeout unless one is given.
+
+    Raises:
+        requests.ConnectionError, requests.Timeout: If the server could not be reached on any attempt.
+    """
+    kwargs.setdefault("timeout", TIMEOUT)
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    retry_statuses = RETRY_STATUSES if idempotent else RETRY_STATUSES_NOT_IDEMPOTENT
+    for attempt in range(retries + 1):
+        for body_file in rewind:
+            body_file.seek(0)
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except NETWORK_ERRORS as e:
+            if attempt == retries or not (idempotent or never_sent(e)):
+                raise
+        else:
+            if response.status_code not in retry_statuses or attempt == retries:
+                return response
+            # Return the connection to the pool before waiting.
+            response.close()
+        time.sleep(backoff_delay(attempt))
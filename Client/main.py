@@ -4,10 +4,12 @@ from picamera2 import Picamera2
 from libcamera import controls
 from picamera2.encoders import H264Encoder
 from picamera2.outputs import FileOutput
-from request_handler import upload_video_and_handle_response
+from request_handler import upload_video_and_handle_response, upload_frame_and_handle_response, start_offline_uploads
 from yaRException import yaRException
 from Logger import Logger
-from audio_utils import play_audio, record_audio
+from audio_utils import audio_format_of, init_mixer, record_audio
+from camera_utils import FRAME_PRESELECT, FrameSelector
+from upload_session import UPLOAD_SESSIONS, UploadSession
 
 
 ####################### RPI GPIO SETUP #######################
@@ -20,7 +22,7 @@ GPIO.setup(button_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 
 ###################### Buffer Variables ######################
 video_path = 'video.h264'
-audio_path = 'recording3.wav'
+audio_path = 'recording3.wav'  # The extension follows the capture format, see audio_utils
 ##############################################################
 
 
@@ -28,9 +30,25 @@ audio_path = 'recording3.wav'
 picam2 = Picamera2()
 picam2.start(show_preview=False)
 picam2.set_controls({"AfMode": controls.AfModeEnum.Continuous})
+# With FRAME_PRESELECT=1 no video is recorded; the sharpest frame is kept instead.
+frame_selector = FrameSelector(picam2) if FRAME_PRESELECT else None
 ##############################################################
 
 
+def start_upload_session(audio_process):
+    """
+    Open an upload session and start sending the video (unless only a frame is kept) and the audio while they
+    are recorded. Returns None if the server could not open one; the recording is then uploaded whole.
+    """
+    session = UploadSession.open("rpi-frame" if frame_selector else "rpi", audio_format_of(audio_process.path))
+    if session is None:
+        return None
+    if not frame_selector:
+        session.add_file("video", video_path)
+    session.add_file("audio", audio_process.path, follow=audio_process.append_only)
+    return session
+
+
 def main():
     """
     The main function that runs the game loop. This function is responsible for handling the game loop and the button press event. 
@@ -39,9 +57,16 @@ def main():
     # Initialise the Logger. Read the Logger class in Logger.py for more information.
     Logger(log_to_file=True).info("Starting yaR....")
 
+    # Open the audio output now, so the first response does not wait for it.
+    init_mixer()
+
+    # Upload recordings queued while the server was unreachable, including those from before a restart.
+    start_offline_uploads()
+
     # Variables
     is_recording = False
     audio_process = None  # Declare audio_process variable
+    upload_session = None
 
     try:
         while True:
@@ -49,16 +74,30 @@ def main():
                 if not is_recording:
                     Logger().info("Button pressed. Starting camera and audio recording...")
 
-                    audio_process = record_audio()
-                    encoder = H264Encoder()
-                    output = FileOutput(video_path)
-                    picam2.start_recording(encoder, output)
+                    try:
+                        audio_process = record_audio(audio_path)
+                    except yaRException:
+                        # Already logged in record_audio. Wait for the next press.
+                        time.sleep(1)
+                        continue
+                    if frame_selector:
+                        frame_selector.start()
+                    else:
+                        encoder = H264Encoder()
+                        output = FileOutput(video_path)
+                        picam2.start_recording(encoder, output)
+                    if UPLOAD_SESSIONS:
+                        # Upload while recording, so only the last chunks are left when the button is released.
+                        upload_session = start_upload_session(audio_process)
                     is_recording = True
                     time.sleep(1)
                 else:
                     Logger().info("Button pressed. Stopping recording and camera...")
 
-                    picam2.stop_recording()
+                    if frame_selector:
+                        frame_jpeg = frame_selector.stop()
+                    else:
+                        picam2.stop_recording()
                     audio_process.terminate()
                     audio_process.wait()
                     
@@ -70,14 +109,16 @@ def main():
                         # raise yaRException(yaRErrorCodes.AUDIO_RECORDING_FAILED)
                     
                     try:
-                        mp3_path = upload_video_and_handle_response(video_path, audio_path)
+                        if frame_selector:
+                            # The response plays while it downloads, see PLAYBACK_STREAM in audio_utils.
+                            upload_frame_and_handle_response(frame_jpeg, audio_process.path, upload_session, play=True)
+                        else:
+                            upload_video_and_handle_response(video_path, audio_process.path, upload_session, play=True)
                     except yaRException as e:
                         # Exception handling for the upload_video_and_handle_response function. Already logged in the function.
                         pass
                     
-                    if mp3_path:
-                        play_audio(mp3_path)
-                    
+                    upload_session = None
                     is_recording = False
                     time.sleep(1)  # Debounce delay to avoid multiple button presses
             else:
@@ -86,7 +127,10 @@ def main():
         Logger().info("Stopping gracefully... Press Ctrl+C again to force stop.")
 
         if is_recording:
-            picam2.stop_recording()
+            if frame_selector:
+                frame_selector.stop()
+            else:
+                picam2.stop_recording()
             picam2.close()
             audio_process.terminate()
             audio_process.wait()
@@ -0,0 +1,103 @@
+"""
+Recordings made while the server could not be reached, kept on disk until they can be uploaded.
+
+Each recording is a directory holding its media file, its audio and an entry.json describing how to upload
+them, so queued recordings survive a restart of the Pi.
+"""
+import json
+import os
+import shutil
+import time
+
+# Queued recordings live in OFFLINE_QUEUE_DIR. At most OFFLINE_QUEUE_MAX are kept; the oldest is dropped to
+# make room for a new one.
+OFFLINE_QUEUE_DIR = os.getenv("OFFLINE_QUEUE_DIR", "offline_queue")
+OFFLINE_QUEUE_MAX = int(os.getenv("OFFLINE_QUEUE_MAX", "20"))
+
+ENTRY_FILE = "entry.json"
+
+
+class OfflineQueue:
+    """
+    A first in, first out queue of recordings on disk.
+
+    Usage:
+        queue = OfflineQueue()
+        queue.put("rpi", ("video", "video.h264", video_file, "video/mp4"), "recording3.flac")
+        for entry in queue.entries():
+            ...  # upload entry["media"] and entry["audio_path"]
+            queue.remove(entry)
+    """
+
+    def __init__(self, directory=OFFLINE_QUEUE_DIR, max_entries=OFFLINE_QUEUE_MAX):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def put(self, device_type, media, audio_path):
+        """
+        Queue a recording. The files are moved into the queue, the recorder overwrites them next time anyway.
+
+        media is the (field name, file name, file object or bytes, content type) of the video or frame.
+
+        Returns:
+            str: The directory of the queued recording.
+        """
+        field, file_name, content, content_type = media
+        entry_dir = os.path.join(self.directory, str(time.time_ns()))
+        os.makedirs(entry_dir)
+
+        media_path = os.path.join(entry_dir, file_name)
+        if isinstance(content, bytes):
+            with open(media_path, "wb") as media_file:
+                media_file.write(content)
+        else:
+            shutil.move(content.name, media_path)
+        queued_audio_path = os.path.join(entry_dir, os.path.basename(audio_path))
+        shutil.move(audio_path, queued_audio_path)
+
+        entry = {
+            "device_type": device_type,
+            "field": field,
+            "file_name": file_name,
+            "content_type": content_type,
+            "audio": os.path.basename(audio_path),
+        }
+        # Written last, so a directory without it is an incomplete entry and is skipped.
+        with open(os.path.join(entry_dir, ENTRY_FILE), "w") as entry_file:
+            json.dump(entry, entry_file)
+
+        for stale in self._entry_dirs()[:-self.max_entries]:
+            shutil.rmtree(stale, ignore_errors=True)
+        return entry_dir
+
+    def _entry_dirs(self):
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(name for name in os.listdir(self.directory) if name.isdigit())
+        return [os.path.join(self.directory, name) for name in names]
+
+    def entries(self):
+        """
+        The queued recordings, oldest first. Each is a dict with the device type, the media as a path, the
+        audio path and the directory.
+        """
+        entries = []
+        for entry_dir in self._entry_dirs():
+            try:
+                with open(os.path.join(entry_dir, ENTRY_FILE)) as entry_file:
+                    entry = json.load(entry_file)
+            except (OSError, ValueError):
+                continue
+            entries.append({
+                "dir": entry_dir,
+                "device_type": entry["device_type"],
+                "media": (entry["field"], entry["file_name"], os.path.join(entry_dir, entry["file_name"]), entry["content_type"]),
+                "audio_path": os.path.join(entry_dir, entry["audio"]),
+            })
+        return entries
+
+    def __len__(self):
+        return len(self._entry_dirs())
+
+    def remove(self, entry):
+        shutil.rmtree(entry["dir"], ignore_errors=True)
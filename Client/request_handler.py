@@ -1,59 +1,218 @@
 import os
-import requests
-from dotenv import load_dotenv
+import shutil
+import threading
 from Logger import Logger
+from audio_utils import AUDIO_FORMATS, FFMPEG_BINARY, PLAYBACK_STREAM, StreamingPlayback, audio_format_of, play_audio, set_server_formats, transcode_to_wav
+from http_client import API_TOKEN, NETWORK_ERRORS, VIDEO_PROCESSING_URL, never_sent, request
+from offline_queue import OfflineQueue
+from upload_session import UploadSessionLost
 from yaRException import yaRException, yaRErrorCodes
 from pathlib import Path
 
-load_dotenv()
+# Queued recordings are retried every OFFLINE_RETRY_INTERVAL seconds, and right after any upload succeeds.
+OFFLINE_RETRY_INTERVAL = float(os.getenv("OFFLINE_RETRY_INTERVAL", "30"))
 
-def upload_video_and_handle_response(video_path, audio_path):
-    url = os.getenv("VIDEO_PROCESSING_URL")
-    token = os.getenv("API_TOKEN")
+offline_queue = OfflineQueue()
+_network_back = threading.Event()
 
-    if not url:
+def _server_config():
+    if not VIDEO_PROCESSING_URL:
         Logger().logger.error("API URL or token not found in environment variables.")
         raise yaRException(yaRErrorCodes.VIDEO_UPLOAD_URL_NOT_FOUND)
 
-    if not token:
+    if not API_TOKEN:
         Logger().logger.error("API token not found in environment variables.")
         raise yaRException(yaRErrorCodes.VIDEO_UPLOAD_TOKEN_NOT_FOUND)
-    
-    headers = {"X-Token": token}
-    video_file_name = Path(video_path).name
-    audio_file_name = Path(audio_path).name
 
-    if not Path(video_path).is_file():
-        Logger().logger.error(f"The video file {video_path} does not exist.")
-        raise yaRException(yaRErrorCodes.VIDEO_FILE_NOT_FOUND_WHILE_UPLOAD)
-    
+    return VIDEO_PROCESSING_URL, API_TOKEN
+
+def _check_audio_file(audio_path):
     if not Path(audio_path).is_file():
         Logger().logger.error(f"The audio file {audio_path} does not exist.")
         raise yaRException(yaRErrorCodes.AUDIO_FILE_NOT_FOUND_WHILE_UPLOAD)
-    
-    with open(video_path, "rb") as video_file, open(audio_path, "rb") as audio_file:
-        files = {
-            "video": (video_file_name, video_file, "video/mp4"),
-            "audio": (audio_file_name, audio_file, "audio/wav")
-        }
-        response = requests.post(url, headers=headers, files=files, stream=True)
 
+def _post_and_save_response(device_type, media, audio_path, mp3_path, queue_offline=True, play=False):
+    """
+    Send one upload and save the spoken response.
+
+    media is the (field name, file name, file object or bytes, content type) of the video or frame.
+    The server is told how the audio is encoded; a server that does not accept the format answers 415
+    with the formats it does accept. Later recordings then use one of those, and this one is sent again
+    as WAV.
+
+    If the server can not be reached even after retries, the recording is queued on disk and uploaded
+    once the network is back (unless queue_offline is False, then the network error is raised). A recording
+    whose answer timed out, or whose connection broke after it was sent, is neither sent again nor queued:
+    the server may already be processing it.
+
+    With play=True the response is also played, see _save_response.
+    """
+    url, token = _server_config()
+    audio_format = audio_format_of(audio_path)
+    headers = {"X-Token": token, "X-Device-Type": device_type, "X-Audio-Format": audio_format}
+    field, file_name, content, content_type = media
+
+    try:
+        with open(audio_path, "rb") as audio_file:
+            files = {
+                field: (file_name, content, content_type),
+                "audio": (Path(audio_path).name, audio_file, AUDIO_FORMATS[audio_format][1])
+            }
+            rewind = [audio_file] + ([content] if hasattr(content, "seek") else [])
+            response = request("POST", url, rewind=rewind, headers=headers, files=files, stream=True)
+    except NETWORK_ERRORS as e:
+        if not never_sent(e):
+            Logger().logger.error(f"No answer from the server, which may have the recording: {e}")
+            raise yaRException(yaRErrorCodes.VIDEO_PROCESSING_FAILED)
+        if not queue_offline:
+            raise
+        Logger().logger.error(f"Server unreachable, queueing the recording: {e}")
+        offline_queue.put(device_type, media, audio_path)
+        raise yaRException(yaRErrorCodes.UPLOAD_QUEUED_OFFLINE)
+
+    if response.status_code == 415 and audio_format != "wav":
+        accepted = response.headers.get("X-Accept-Audio-Format", "wav")
+        response.close()
+        Logger().logger.warning(f"Server does not accept {audio_format} audio, only {accepted}. Sending WAV instead.")
+        set_server_formats([name.strip() for name in accepted.split(",")])
+        if hasattr(content, "seek"):
+            content.seek(0)
+        return _post_and_save_response(device_type, media, transcode_to_wav(audio_path), mp3_path, queue_offline, play)
+
+    return _save_response(response, mp3_path, play)
+
+def _save_response(response, mp3_path, play=False):
+    """
+    Save the spoken response to mp3_path. With play=True it is also played: while it downloads if
+    PLAYBACK_STREAM is on, otherwise once it is saved. Returns when playback is complete.
+    """
     if response.status_code == 200:
-        mp3_path = video_path.rsplit(".", 1)[0] + ".mp3"
-        with open(mp3_path, "wb") as mp3_file:
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:  
-                    mp3_file.write(chunk)
-        Logger().logger.info(f"MP3 saved to {mp3_path}")
+        if play and PLAYBACK_STREAM and shutil.which(FFMPEG_BINARY):
+            playback = StreamingPlayback(save_path=mp3_path)
+            playback.play(response.iter_content(chunk_size=4096))
+            Logger().logger.info(f"Response played from {playback.first_sound_after or 0:.2f}s, with {playback.underruns} underruns. Saved to {mp3_path}")
+        else:
+            with open(mp3_path, "wb") as mp3_file:
+                for chunk in response.iter_content(chunk_size=4096):
+                    if chunk:
+                        mp3_file.write(chunk)
+            Logger().logger.info(f"MP3 saved to {mp3_path}")
+            if play:
+                play_audio(mp3_path)
+        # The server is reachable, so queued recordings can go too.
+        _network_back.set()
         return mp3_path
     else:
         Logger().logger.error(f"Error: {response.status_code} - {response.text}")
         raise yaRException(yaRErrorCodes.VIDEO_PROCESSING_FAILED)
 
+def _complete_session(session, mp3_path, play=False):
+    """
+    Complete an upload session that was fed while recording. Returns None if the session was lost, so the
+    caller uploads the recording whole instead.
+    """
+    try:
+        response = session.complete()
+    except UploadSessionLost as e:
+        Logger().logger.warning(f"Upload session lost, uploading the whole recording: {e}")
+        return None
+    except NETWORK_ERRORS as e:
+        Logger().logger.error(f"No answer from the server, which may have the recording: {e}")
+        raise yaRException(yaRErrorCodes.VIDEO_PROCESSING_FAILED)
+    return _save_response(response, mp3_path, play)
+
+def upload_video_and_handle_response(video_path, audio_path, session=None, play=False):
+    """
+    Upload the video and audio and save the spoken response, playing it too with play=True.
+    """
+    if not Path(video_path).is_file():
+        Logger().logger.error(f"The video file {video_path} does not exist.")
+        raise yaRException(yaRErrorCodes.VIDEO_FILE_NOT_FOUND_WHILE_UPLOAD)
+    _check_audio_file(audio_path)
+
+    mp3_path = video_path.rsplit(".", 1)[0] + ".mp3"
+    if session is not None and _complete_session(session, mp3_path, play):
+        return mp3_path
+    with open(video_path, "rb") as video_file:
+        media = ("video", Path(video_path).name, video_file, "video/mp4")
+        return _post_and_save_response("rpi", media, audio_path, mp3_path, play=play)
+
+def upload_frame_and_handle_response(frame_jpeg, audio_path, session=None, play=False):
+    """
+    Upload the sharpest frame, picked on the Pi while recording, instead of the whole video.
+    The server then skips frame selection.
+
+    With an upload session the audio is already on its way; only the frame is added before completing it.
+    """
+    if not frame_jpeg:
+        Logger().logger.error("No frame was captured while recording.")
+        raise yaRException(yaRErrorCodes.FRAME_NOT_CAPTURED)
+    _check_audio_file(audio_path)
+
+    mp3_path = audio_path.rsplit(".", 1)[0] + ".mp3"
+    if session is not None:
+        try:
+            session.add_bytes("image", frame_jpeg)
+        except UploadSessionLost as e:
+            Logger().logger.warning(f"Upload session lost, uploading the whole recording: {e}")
+            session = None
+    if session is not None and _complete_session(session, mp3_path, play):
+        return mp3_path
+    media = ("image", "frame.jpg", frame_jpeg, "image/jpeg")
+    return _post_and_save_response("rpi-frame", media, audio_path, mp3_path, play=play)
+
+def upload_offline_queue():
+    """
+    Upload queued recordings, oldest first, until the queue is empty or the server is unreachable again.
+    Their answers are stored on the board by the server; the spoken response is not played this late.
+
+    Returns:
+        int: Number of recordings uploaded.
+    """
+    uploaded = 0
+    for entry in offline_queue.entries():
+        field, file_name, media_path, content_type = entry["media"]
+        mp3_path = os.path.join(entry["dir"], "response.mp3")
+        try:
+            with open(media_path, "rb") as media_file:
+                media = (field, file_name, media_file, content_type)
+                _post_and_save_response(entry["device_type"], media, entry["audio_path"], mp3_path, queue_offline=False)
+        except NETWORK_ERRORS as e:
+            # Only errors from before the recording was sent get here, see _post_and_save_response.
+            Logger().logger.info(f"Server still unreachable, {len(offline_queue)} recordings queued: {e}")
+            break
+        except (yaRException, OSError) as e:
+            # Retrying would fail the same way, or after a timeout have the recording answered twice.
+            Logger().logger.error(f"Dropping queued recording {entry['dir']}: {e}")
+        else:
+            uploaded += 1
+            Logger().logger.info(f"Queued recording {entry['dir']} uploaded.")
+        offline_queue.remove(entry)
+    return uploaded
+
+def _upload_offline_queue_forever():
+    while True:
+        _network_back.wait(OFFLINE_RETRY_INTERVAL)
+        _network_back.clear()
+        if len(offline_queue):
+            try:
+                upload_offline_queue()
+            except yaRException as e:
+                Logger().logger.error(e)
+
+def start_offline_uploads():
+    """
+    Upload queued recordings in the background: every OFFLINE_RETRY_INTERVAL seconds, and as soon as any upload
+    succeeds.
+    """
+    thread = threading.Thread(target=_upload_offline_queue_forever, daemon=True)
+    thread.start()
+    return thread
+
 
 if __name__ == "__main__":
     Logger(log_to_file=True).info("Starting yaR....")
     try:
         upload_video_and_handle_response("video.mp4", "audio.wav")
     except yaRException as e:
-        Logger().logger.error(e)
\ No newline at end of file
+        Logger().logger.error(e)
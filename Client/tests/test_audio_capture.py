@@ -0,0 +1,99 @@
+"""
+Capture tests with fake_recorder.py standing in for the microphone. From the Client folder:
+
+    python3 -m unittest discover tests
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import audio_utils
+from yaRException import yaRException
+
+CLIENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_RECORDER = f"{sys.executable} {os.path.join(CLIENT_DIR, 'fake_recorder.py')} --seconds 1"
+
+
+def flac_stream_info(data):
+    """
+    Sample rate and channels from the STREAMINFO block that follows the "fLaC" marker.
+    """
+    info = int.from_bytes(data[18:21], "big")
+    return info >> 4, ((info >> 1) & 0x7) + 1
+
+
+def opus_head(data):
+    """
+    Channels and input sample rate from the OpusHead packet of an Ogg Opus file.
+    """
+    head = data.index(b"OpusHead")
+    return data[head + 9], int.from_bytes(data[head + 12:head + 16], "little")
+
+
+@unittest.skipUnless(shutil.which(audio_utils.FFMPEG_BINARY), "needs ffmpeg")
+class CompactCaptureTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = mock.patch.object(audio_utils, "AUDIO_RECORD_COMMAND", FAKE_RECORDER)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, audio_format):
+        recording = audio_utils.record_audio(os.path.join(self.directory, "recording.wav"), audio_format)
+        recording.wait(timeout=30)
+        self.assertEqual(recording.returncode, 0)
+        self.assertTrue(recording.append_only)
+        with open(recording.path, "rb") as audio_file:
+            return recording.path, audio_file.read()
+
+    def test_records_mono_flac(self):
+        path, data = self.record("flac")
+
+        self.assertTrue(path.endswith(".flac"))
+        self.assertEqual(data[:4], b"fLaC")
+        self.assertEqual(flac_stream_info(data), (audio_utils.AUDIO_SAMPLE_RATE, 1))
+        # A second of 16-bit mono, compressed.
+        self.assertLess(len(data), audio_utils.AUDIO_SAMPLE_RATE * 2)
+
+    def test_records_mono_opus(self):
+        path, data = self.record("opus")
+
+        self.assertTrue(path.endswith(".ogg"))
+        self.assertEqual(data[:4], b"OggS")
+        self.assertEqual(opus_head(data), (1, audio_utils.AUDIO_SAMPLE_RATE))
+
+
+class MissingFfmpegTests(unittest.TestCase):
+    def test_captures_wav_without_ffmpeg(self):
+        with mock.patch.object(audio_utils, "AUDIO_CAPTURE_FORMAT", "flac"), \
+                mock.patch.object(audio_utils.shutil, "which", return_value=None):
+            self.assertEqual(audio_utils.capture_format(), "wav")
+
+    def test_stops_the_recorder_when_ffmpeg_does_not_start(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        recorders = []
+        popen = subprocess.Popen
+
+        def track(*args, **kwargs):
+            process = popen(*args, **kwargs)
+            recorders.append(process)
+            return process
+
+        with mock.patch.object(audio_utils, "AUDIO_RECORD_COMMAND", FAKE_RECORDER.replace(" --seconds 1", "")), \
+                mock.patch.object(audio_utils, "FFMPEG_BINARY", os.path.join(directory, "no-ffmpeg")), \
+                mock.patch.object(audio_utils.subprocess, "Popen", side_effect=track):
+            with self.assertRaises(yaRException):
+                audio_utils.record_audio(os.path.join(directory, "recording.wav"), "flac")
+
+        self.assertEqual(len(recorders), 1)
+        self.assertIsNotNone(recorders[0].poll())
+
+
+if __name__ == "__main__":
+    unittest.main()
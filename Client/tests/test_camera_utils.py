@@ -0,0 +1,119 @@
+import io
+import threading
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from camera_utils import FakeCamera, FrameSelector, encode_jpeg, sharpness
+
+
+class RecordingCamera(FakeCamera):
+    """
+    A FakeCamera remembering the frames it returned, and signalling once it has returned `wanted` of them.
+    """
+
+    def __init__(self, wanted=0, **kwargs):
+        super().__init__(**kwargs)
+        self.captured = []
+        self.wanted = wanted
+        self.enough = threading.Event()
+
+    def capture_array(self, name="main"):
+        frame = super().capture_array(name)
+        self.captured.append(frame)
+        if len(self.captured) >= self.wanted:
+            self.enough.set()
+        return frame
+
+
+class SharpnessTests(unittest.TestCase):
+    def test_scores_the_sharp_frames_of_the_fake_camera_highest(self):
+        camera = FakeCamera(width=160, height=120, sharp_every=7)
+        scores = [sharpness(camera.capture_array()) for _ in range(14)]
+
+        # Frames 7 and 14 are the sharp ones.
+        self.assertEqual(set(np.argsort(scores)[-2:]), {6, 13})
+
+    def test_accepts_grayscale_frames(self):
+        frame = np.zeros((40, 40), dtype=np.uint8)
+        frame[::2] = 255
+
+        self.assertGreater(sharpness(frame, step=1), 0)
+        self.assertEqual(sharpness(np.full((40, 40), 128, dtype=np.uint8), step=1), 0)
+
+
+class FrameSelectorTests(unittest.TestCase):
+    def test_keeps_the_sharpest_frame_offered(self):
+        camera = FakeCamera(width=160, height=120, sharp_every=7)
+        selector = FrameSelector(camera)
+        frames = [camera.capture_array() for _ in range(10)]
+
+        for frame in frames:
+            selector.offer(frame)
+
+        self.assertEqual(selector.frames_scored, 10)
+        self.assertTrue(np.array_equal(selector.best_frame, frames[6]))
+        self.assertEqual(selector.best_score, sharpness(frames[6]))
+
+    def test_keeps_a_copy_of_the_frame(self):
+        selector = FrameSelector(FakeCamera(width=160, height=120))
+        frame = FakeCamera(width=160, height=120, sharp_every=1).capture_array()
+
+        selector.offer(frame)
+        frame[:] = 0
+
+        self.assertGreater(selector.best_frame.max(), 0)
+
+    def test_samples_the_camera_until_stopped(self):
+        camera = RecordingCamera(wanted=8, width=160, height=120, sharp_every=7)
+        selector = FrameSelector(camera, interval=0)
+
+        selector.start()
+        self.assertTrue(camera.enough.wait(5))
+        jpeg = selector.stop()
+
+        self.assertEqual(selector.frames_scored, len(camera.captured))
+        self.assertIsNone(selector.best_frame)
+        self.assertEqual(selector.best_score, max(sharpness(frame) for frame in camera.captured))
+        image = Image.open(io.BytesIO(jpeg))
+        self.assertEqual((image.format, image.mode, image.size), ("JPEG", "RGB", (160, 120)))
+
+    def test_start_forgets_the_previous_recording(self):
+        selector = FrameSelector(FakeCamera(width=160, height=120))
+        selector.offer(FakeCamera(width=160, height=120, sharp_every=1).capture_array())
+        selector.stop()
+        camera = RecordingCamera(wanted=1, width=160, height=120, sharp_every=100)
+        selector.camera = camera
+
+        selector.start()
+        self.assertTrue(camera.enough.wait(5))
+        selector.stop()
+
+        self.assertEqual(selector.frames_scored, len(camera.captured))
+        self.assertEqual(selector.best_score, max(sharpness(frame) for frame in camera.captured))
+
+    def test_stop_without_frames_returns_none(self):
+        selector = FrameSelector(FakeCamera())
+
+        self.assertIsNone(selector.stop())
+
+
+class EncodeJpegTests(unittest.TestCase):
+    def test_drops_the_padding_channel(self):
+        # A smooth RGBX frame, which survives JPEG compression.
+        frame = np.zeros((48, 64, 4), dtype=np.uint8)
+        frame[..., 0] = np.arange(64) * 4
+        frame[..., 1] = np.arange(48)[:, None] * 5
+        frame[..., 2] = 100
+        frame[..., 3] = 255
+
+        image = Image.open(io.BytesIO(encode_jpeg(frame, quality=95)))
+
+        self.assertEqual((image.mode, image.size), ("RGB", (64, 48)))
+        difference = np.abs(np.asarray(image, dtype=np.int16) - frame[..., :3]).mean()
+        self.assertLess(difference, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import socket
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+import http_client
+from http_client import never_sent, request
+
+
+def closed_port_url():
+    """
+    A URL nothing listens on, so connecting is refused.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/"
+
+
+class AbortingServer:
+    """
+    Reads each request and hangs up without answering, like a server that crashed while processing it.
+    """
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen()
+        self.url = f"http://127.0.0.1:{self.sock.getsockname()[1]}/"
+        self.requests = 0
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self.sock.accept()
+            except OSError:
+                return
+            with connection:
+                data = b""
+                while b"\r\n\r\n" not in data:
+                    chunk = connection.recv(65536)
+                    if not chunk:
+                        break
+                    data += chunk
+                self.requests += 1
+
+    def close(self):
+        self.sock.close()
+
+
+class NeverSentTests(unittest.TestCase):
+    def test_refused_connection_was_never_sent(self):
+        with self.assertRaises(requests.ConnectionError) as raised:
+            requests.post(closed_port_url(), data=b"body", timeout=5)
+
+        self.assertTrue(never_sent(raised.exception))
+
+    def test_connect_timeout_was_never_sent(self):
+        self.assertTrue(never_sent(requests.ConnectTimeout("timed out connecting")))
+
+    def test_aborted_connection_may_have_been_sent(self):
+        server = AbortingServer()
+        self.addCleanup(server.close)
+
+        with self.assertRaises(requests.ConnectionError) as raised:
+            requests.post(server.url, data=b"body", timeout=5)
+
+        self.assertIn("Connection aborted", str(raised.exception))
+        self.assertFalse(never_sent(raised.exception))
+
+    def test_read_timeout_may_have_been_sent(self):
+        self.assertFalse(never_sent(requests.ReadTimeout("timed out reading")))
+
+
+@mock.patch.object(http_client, "backoff_delay", return_value=0)
+class RequestRetryTests(unittest.TestCase):
+    def setUp(self):
+        self.server = AbortingServer()
+        self.addCleanup(self.server.close)
+
+    def test_retries_a_post_that_was_never_sent(self, _):
+        url = closed_port_url()
+        with mock.patch.object(http_client.get_session(), "request", wraps=http_client.get_session().request) as send:
+            with self.assertRaises(requests.ConnectionError):
+                request("POST", url, retries=2, data=b"body")
+
+        self.assertEqual(send.call_count, 3)
+
+    def test_retries_a_post_whose_connection_timed_out(self, _):
+        with mock.patch.object(http_client.get_session(), "request", side_effect=requests.ConnectTimeout("timed out")) as send:
+            with self.assertRaises(requests.ConnectTimeout):
+                request("POST", self.server.url, retries=2, data=b"body")
+
+        self.assertEqual(send.call_count, 3)
+
+    def test_does_not_retry_a_post_after_the_connection_broke(self, _):
+        with self.assertRaises(requests.ConnectionError):
+            request("POST", self.server.url, retries=2, data=b"body")
+
+        self.assertEqual(self.server.requests, 1)
+
+    def test_does_not_retry_a_post_after_a_read_timeout(self, _):
+        with mock.patch.object(http_client.get_session(), "request", side_effect=requests.ReadTimeout("timed out")) as send:
+            with self.assertRaises(requests.ReadTimeout):
+                request("POST", self.server.url, retries=2, data=b"body")
+
+        self.assertEqual(send.call_count, 1)
+
+    def test_retries_a_get_after_the_connection_broke(self, _):
+        with self.assertRaises(requests.ConnectionError):
+            request("GET", self.server.url, retries=2)
+
+        self.assertEqual(self.server.requests, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+"""
+Playback tests with a fake pygame mixer, which plays sounds by letting their duration pass, SPEED times faster than
+real time. From the Client folder:
+
+    python3 -m unittest discover tests
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+
+import audio_utils
+from audio_utils import StreamingPlayback, init_mixer
+
+SAMPLE_RATE = 24000
+SPEED = 4
+
+
+class FakeSound:
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+
+class FakeChannel:
+    """
+    A mixer channel holding a playing sound and at most one queued sound, like pygame's. It records what it
+    played.
+    """
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.played = []
+        self.ends_at = 0.0
+        self.queued = None
+
+    def _start(self, sound, at):
+        self.played.append(sound.buffer)
+        self.ends_at = at + len(sound.buffer) / self.bytes_per_second
+
+    def _advance(self):
+        if self.queued is not None and time.monotonic() >= self.ends_at:
+            sound, self.queued = self.queued, None
+            self._start(sound, self.ends_at)
+
+    def get_busy(self):
+        self._advance()
+        return time.monotonic() < self.ends_at
+
+    def get_queue(self):
+        self._advance()
+        return self.queued
+
+    def play(self, sound):
+        self.queued = None
+        self._start(sound, time.monotonic())
+
+    def queue(self, sound):
+        if self.get_busy():
+            self.queued = sound
+        else:
+            self.play(sound)
+
+
+class FakeMixer:
+    def __init__(self):
+        self.settings = None
+        self.inits = []
+        self.channel = None
+        self.Sound = FakeSound
+
+    def get_init(self):
+        return self.settings
+
+    def init(self, frequency, size, channels, buffer):
+        self.inits.append((frequency, size, channels, buffer))
+        self.settings = (frequency, size, channels)
+        self.channel = FakeChannel(frequency * channels * abs(size) // 8 * SPEED)
+
+    def find_channel(self, force=False):
+        return self.channel
+
+
+class FakeClock:
+    def tick(self, framerate):
+        time.sleep(1 / framerate)
+
+
+def fake_pygame():
+    return types.SimpleNamespace(mixer=FakeMixer(), time=types.SimpleNamespace(Clock=FakeClock))
+
+
+class InitMixerTests(unittest.TestCase):
+    def test_opens_the_mixer_once(self):
+        pygame = fake_pygame()
+
+        with mock.patch.dict(sys.modules, {"pygame": pygame}):
+            init_mixer()
+            init_mixer()
+
+        self.assertEqual(pygame.mixer.inits, [
+            (audio_utils.PLAYBACK_SAMPLE_RATE, -16, 1, audio_utils.PLAYBACK_MIXER_BUFFER),
+        ])
+
+
+@unittest.skipUnless(shutil.which(audio_utils.FFMPEG_BINARY), "needs ffmpeg")
+@mock.patch.object(audio_utils, "PLAYBACK_SAMPLE_RATE", SAMPLE_RATE)
+class StreamingPlaybackTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        mp3_path = os.path.join(cls.directory, "response.mp3")
+        subprocess.run([
+            audio_utils.FFMPEG_BINARY, "-v", "error", "-f", "lavfi", "-i",
+            f"sine=frequency=440:duration=4:sample_rate={SAMPLE_RATE}", "-ac", "1", mp3_path,
+        ], check=True)
+        with open(mp3_path, "rb") as mp3_file:
+            cls.mp3 = mp3_file.read()
+        # What the whole response decodes to from a pipe, for comparing with what was played.
+        cls.pcm = subprocess.run(
+            StreamingPlayback()._decoder_command(SAMPLE_RATE, 1),
+            input=cls.mp3, check=True, stdout=subprocess.PIPE,
+        ).stdout
+        # About two seconds of audio, more than the decoder needs before it starts.
+        cls.half = len(cls.mp3) // 2 // 1024 * 1024
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.pygame = fake_pygame()
+        patcher = mock.patch.dict(sys.modules, {"pygame": self.pygame})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def chunks(self, stall_at=None, stall=0.0, fail_at=None):
+        """
+        The MP3 in 1 KiB chunks, as a download would deliver it, pausing or breaking off at a byte offset.
+        """
+        for start in range(0, len(self.mp3), 1024):
+            if start == stall_at:
+                time.sleep(stall)
+            if start == fail_at:
+                raise OSError("connection reset")
+            yield self.mp3[start:start + 1024]
+
+    def played(self):
+        return b"".join(self.pygame.mixer.channel.played)
+
+    def test_plays_and_saves_the_whole_response(self):
+        save_path = os.path.join(self.directory, "saved.mp3")
+        playback = StreamingPlayback(save_path=save_path)
+
+        playback.play(self.chunks())
+
+        self.assertEqual(self.played(), self.pcm)
+        self.assertEqual(playback.underruns, 0)
+        self.assertIsNone(playback.error)
+        self.assertLess(playback.first_sound_after, 0.5)
+        with open(save_path, "rb") as saved:
+            self.assertEqual(saved.read(), self.mp3)
+
+    def test_buffers_up_again_when_the_download_falls_behind(self):
+        playback = StreamingPlayback(prebuffer_ms=200, block_ms=100)
+
+        # Longer than the buffered half takes to play.
+        playback.play(self.chunks(stall_at=self.half, stall=2 / SPEED + 0.5))
+
+        self.assertEqual(playback.underruns, 1)
+        self.assertEqual(self.played(), self.pcm)
+
+    def test_plays_a_broken_download_as_far_as_it_got(self):
+        playback = StreamingPlayback()
+
+        playback.play(self.chunks(fail_at=self.half))
+
+        self.assertIsInstance(playback.error, OSError)
+        played = self.played()
+        self.assertTrue(0 < len(played) < len(self.pcm))
+        # Cut-off MP3 frames decode slightly differently, so only compare the start.
+        self.assertEqual(played[:len(played) // 2], self.pcm[:len(played) // 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+
+import requests
+
+from upload_session import UploadSession, UploadSessionLost
+
+SESSION_URL = "http://server/video_processing/upload/sessions/abc/"
+
+
+def answer(status_code, body=None):
+    response = mock.Mock(status_code=status_code, text="")
+    response.json.return_value = body or {}
+    return response
+
+
+class CompleteTests(unittest.TestCase):
+    """
+    complete() with the HTTP session replaced: post() answers the completion, get() the status query.
+    """
+
+    def complete(self, post, get=None):
+        session = UploadSession("rpi-frame", SESSION_URL, 1024)
+        session.http = mock.Mock()
+        session.http.post.side_effect = post
+        session.http.get.side_effect = get or [answer(200, {"offsets": {"image": 3, "audio": 5}})]
+        return session, session.complete
+
+    def test_returns_the_answer(self):
+        response = answer(200)
+        _, complete = self.complete([response])
+
+        self.assertIs(complete(), response)
+
+    def test_connect_failure_loses_the_session(self):
+        _, complete = self.complete([requests.ConnectTimeout("timed out connecting")])
+
+        with self.assertRaises(UploadSessionLost):
+            complete()
+
+    def test_gone_session_is_lost(self):
+        for status_code in (404, 410):
+            _, complete = self.complete([answer(status_code)])
+
+            with self.assertRaises(UploadSessionLost):
+                complete()
+
+    def test_sends_again_after_a_read_timeout_while_the_session_is_open(self):
+        response = answer(200)
+        session, complete = self.complete([requests.ReadTimeout("timed out"), response])
+
+        self.assertIs(complete(), response)
+        self.assertEqual(session.http.post.call_count, 2)
+
+    def test_read_timeout_after_the_session_was_taken_is_not_lost(self):
+        session, complete = self.complete([requests.ReadTimeout("timed out")], get=[answer(404)])
+
+        with self.assertRaises(requests.ReadTimeout):
+            complete()
+        self.assertEqual(session.http.post.call_count, 1)
+
+    def test_read_timeout_is_not_lost_when_the_status_is_unknown(self):
+        _, complete = self.complete(
+            [requests.ReadTimeout("timed out")], get=[requests.ConnectionError("network down")]
+        )
+
+        with self.assertRaises(requests.ReadTimeout):
+            complete()
+
+    def test_second_completion_finding_the_session_taken_is_not_lost(self):
+        session, complete = self.complete([requests.ReadTimeout("timed out"), answer(404)])
+
+        with self.assertRaises(requests.ReadTimeout):
+            complete()
+        self.assertEqual(session.http.post.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,302 @@
+"""
+Resumable upload sessions: the video and audio are sent in chunks while the button is still held, so when it is
+released only the last few chunks are left to upload before the server starts answering.
+
+The server keeps each part as an append-only file. Every chunk names the offset it starts at; the server only
+accepts it if that is where the part ends, and otherwise answers 409 with the offset to continue from. After a
+dropped connection the uploader asks the server for its offsets and resumes there, so nothing is sent twice and
+nothing recorded is lost. On completion the client sends each part's size and sha256, and the server only answers
+if its copies match. If they do not, or the session itself is gone (server restarted, session expired), the
+recording is uploaded whole the usual way.
+"""
+import hashlib
+import os
+import threading
+import time
+
+import requests
+from http_client import API_TOKEN, HTTP_CONNECT_TIMEOUT, TIMEOUT, VIDEO_PROCESSING_URL, backoff_delay, get_session, never_sent
+from Logger import Logger
+
+# UPLOAD_SESSIONS=1 uploads while recording. Sessions live under UPLOAD_SESSION_URL, which defaults to
+# "sessions/" below VIDEO_PROCESSING_URL. A part's file is checked for new bytes every UPLOAD_POLL_INTERVAL
+# seconds and sent in chunks of at most UPLOAD_CHUNK_BYTES; a session is given up after UPLOAD_MAX_FAILURES
+# failed chunk requests in a row.
+UPLOAD_SESSIONS = os.getenv("UPLOAD_SESSIONS", "0") == "1"
+UPLOAD_SESSION_URL = os.getenv("UPLOAD_SESSION_URL")
+UPLOAD_POLL_INTERVAL = float(os.getenv("UPLOAD_POLL_INTERVAL", "0.25"))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(256 * 1024)))
+UPLOAD_MAX_FAILURES = int(os.getenv("UPLOAD_MAX_FAILURES", "5"))
+
+# (connect, read) timeouts of the chunk requests, in seconds.
+CHUNK_TIMEOUT = (HTTP_CONNECT_TIMEOUT, 30)
+
+
+class UploadSessionLost(Exception):
+    """
+    The session can not be completed; the recording has to be uploaded whole instead.
+    """
+
+
+def _sessions_url():
+    if UPLOAD_SESSION_URL:
+        return UPLOAD_SESSION_URL.rstrip("/") + "/"
+    return (VIDEO_PROCESSING_URL or "").rstrip("/") + "/sessions/"
+
+
+class PartUploader:
+    """
+    Upload one part of a session from a file, chunk by chunk.
+
+    With follow=True the file is tailed while it is still being written, as the H.264 video and the FLAC or Opus
+    audio are; otherwise it is only read once finish() is called, for files that are rewritten when they are
+    closed, like WAV.
+    """
+
+    def __init__(self, session, part, path, follow=True):
+        self.session = session
+        self.part = part
+        self.path = path
+        self.follow = follow
+        self.offset = 0
+        self.failures = 0
+        self.error = None
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        if not self.follow:
+            self._finished.wait()
+        try:
+            while True:
+                # Checked before reading, so the last read after finish() sees the complete file.
+                finished = self._finished.is_set()
+                data = self._read()
+                if data:
+                    self._send(data)
+                elif finished:
+                    return
+                else:
+                    self._finished.wait(UPLOAD_POLL_INTERVAL)
+        except Exception as e:
+            self.error = e
+
+    def _read(self):
+        try:
+            with open(self.path, "rb") as part_file:
+                part_file.seek(self.offset)
+                return part_file.read(self.session.chunk_size)
+        except FileNotFoundError:
+            # Not created yet, the recorder is still starting.
+            return b""
+
+    def _send(self, data):
+        while True:
+            try:
+                self.offset = self.session.put_chunk(self.part, self.offset, data)
+                self.failures = 0
+                return
+            except UploadSessionLost:
+                raise
+            except (requests.RequestException, ValueError) as e:
+                self.failures += 1
+                if self.failures >= UPLOAD_MAX_FAILURES:
+                    raise UploadSessionLost(f"{self.part} upload failed {self.failures} times: {e}")
+                Logger().logger.warning(f"Chunk of {self.part} at {self.offset} failed, resuming: {e}")
+                time.sleep(backoff_delay(self.failures))
+                try:
+                    server_offset = self.session.offsets()[self.part]
+                except (requests.RequestException, ValueError, KeyError):
+                    continue
+                if server_offset != self.offset:
+                    # Some of the chunk arrived after all, or an earlier chunk was lost: read again from there.
+                    self.offset = server_offset
+                    return
+
+    def finish(self):
+        """
+        Upload the rest of the file and wait for it.
+
+        Raises:
+            UploadSessionLost: If the part could not be uploaded.
+        """
+        self._finished.set()
+        self._thread.join()
+        if self.error is not None:
+            raise UploadSessionLost(str(self.error)) from self.error
+
+    def digest(self):
+        """
+        The size and sha256 of what was uploaded, for completing the session.
+        """
+        digest = hashlib.sha256()
+        remaining = self.offset
+        with open(self.path, "rb") as part_file:
+            while remaining > 0:
+                block = part_file.read(min(remaining, 1024 * 1024))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+        return {"size": self.offset, "sha256": digest.hexdigest()}
+
+
+class UploadSession:
+    """
+    A session on the server that the parts of one recording are uploaded to while recording.
+
+    Usage:
+        session = UploadSession.open("rpi", "flac")
+        session.add_file("video", "video.h264")
+        session.add_file("audio", "recording3.flac")
+        ...  # recording
+        response = session.complete()
+    """
+
+    def __init__(self, device_type, session_url, chunk_size):
+        self.device_type = device_type
+        self.url = session_url
+        self.chunk_size = chunk_size
+        self.uploaders = []
+        # Size and sha256 of the parts added as bytes.
+        self.digests = {}
+        # Chunks go over the shared keep-alive connections.
+        self.http = get_session()
+        self.headers = {"X-Token": API_TOKEN}
+
+    @classmethod
+    def open(cls, device_type, audio_format="wav"):
+        """
+        Open a session on the server.
+
+        Returns:
+            UploadSession: The session, or None if the server could not open one. The recording is then
+            uploaded whole once it is complete.
+        """
+        if not API_TOKEN or not (UPLOAD_SESSION_URL or VIDEO_PROCESSING_URL):
+            return None
+        headers = {"X-Token": API_TOKEN, "X-Device-Type": device_type, "X-Audio-Format": audio_format}
+        try:
+            response = get_session().post(_sessions_url(), headers=headers, timeout=CHUNK_TIMEOUT)
+            if response.status_code != 201:
+                Logger().logger.warning(f"Upload session not opened: {response.status_code} - {response.text}")
+                return None
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            Logger().logger.warning(f"Upload session not opened: {e}")
+            return None
+        chunk_size = min(UPLOAD_CHUNK_BYTES, int(body.get("chunk_size", UPLOAD_CHUNK_BYTES)))
+        return cls(device_type, _sessions_url() + body["session_id"] + "/", chunk_size)
+
+    def add_file(self, part, path, follow=True):
+        """
+        Start uploading a part from a file, see PartUploader.
+        """
+        self.uploaders.append(PartUploader(self, part, path, follow))
+
+    def add_bytes(self, part, data):
+        """
+        Upload a part that is already complete, e.g. the frame picked on the Pi.
+
+        Raises:
+            UploadSessionLost: If it could not be uploaded.
+        """
+        offset = 0
+        try:
+            while offset < len(data):
+                offset = self.put_chunk(part, offset, data[offset:offset + self.chunk_size])
+        except requests.RequestException as e:
+            raise UploadSessionLost(f"{part} upload failed: {e}") from e
+        self.digests[part] = {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+    def put_chunk(self, part, offset, data):
+        """
+        Append a chunk to a part.
+
+        Returns:
+            int: The offset to continue from: after the chunk, or where the server says the part ends.
+
+        Raises:
+            UploadSessionLost: If the server no longer knows the session.
+        """
+        response = self.http.put(
+            f"{self.url}parts/{part}/",
+            data=data,
+            headers={**self.headers, "X-Upload-Offset": str(offset), "Content-Type": "application/octet-stream"},
+            timeout=CHUNK_TIMEOUT,
+        )
+        if response.status_code == 404:
+            raise UploadSessionLost("The server no longer knows the upload session.")
+        if response.status_code == 409:
+            return int(response.json()["offset"])
+        if response.status_code != 200:
+            if response.status_code < 500:
+                raise UploadSessionLost(f"{part} rejected: {response.status_code} - {response.text}")
+            response.raise_for_status()
+        return int(response.json()["offset"])
+
+    def offsets(self):
+        """
+        Bytes of each part the server has received.
+        """
+        response = self.http.get(self.url, headers=self.headers, timeout=CHUNK_TIMEOUT)
+        if response.status_code in (404, 410):
+            raise UploadSessionLost("The server no longer knows the upload session.")
+        response.raise_for_status()
+        return response.json()["offsets"]
+
+    def _still_open(self):
+        # Whether the server evidently has not started completing the session; when in doubt, it has.
+        try:
+            self.offsets()
+        except (UploadSessionLost, requests.RequestException, ValueError, KeyError):
+            return False
+        return True
+
+    def complete(self):
+        """
+        Upload what is left of every part, then ask the server to answer the recording.
+
+        If the request fails after it was sent, the server may be answering it already, so the recording must not
+        be uploaded again. The session's status tells: while it is still open the completion is sent once more,
+        otherwise the error is raised.
+
+        Returns:
+            requests.Response: The streamed response, as for a whole upload.
+
+        Raises:
+            UploadSessionLost: If a part could not be uploaded, the session is gone or the server rejected it.
+            requests.RequestException: If the server may have taken the completion without answering.
+        """
+        parts = dict(self.digests)
+        for uploader in self.uploaders:
+            uploader.finish()
+            try:
+                parts[uploader.part] = uploader.digest()
+            except OSError as e:
+                raise UploadSessionLost(f"{uploader.part} could not be read: {e}") from e
+
+        error = None
+        for attempt in range(2):
+            try:
+                response = self.http.post(
+                    self.url + "complete/", headers=self.headers, json={"parts": parts}, stream=True, timeout=TIMEOUT
+                )
+            except requests.RequestException as e:
+                if never_sent(e):
+                    raise UploadSessionLost(f"Completing the upload session failed: {e}") from e
+                if error is not None or not self._still_open():
+                    raise
+                Logger().logger.warning(f"Completing the upload session got no answer, sending it again: {e}")
+                error = e
+                continue
+            if response.status_code in (404, 410):
+                if error is not None:
+                    # The first completion was taken after all.
+                    raise error
+                raise UploadSessionLost("The server no longer knows the upload session.")
+            # 409: the server's copy of a part does not match what was recorded. Neither is answered.
+            if response.status_code in (400, 409):
+                raise UploadSessionLost(f"Upload session not completed: {response.status_code} - {response.text}")
+            return response
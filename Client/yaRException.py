@@ -7,6 +7,8 @@ class yaRErrorCodes(Enum):
     VIDEO_FILE_NOT_FOUND_WHILE_UPLOAD = auto()
     AUDIO_FILE_NOT_FOUND_WHILE_UPLOAD = auto()
     VIDEO_PROCESSING_FAILED = auto()
+    FRAME_NOT_CAPTURED = auto()
+    UPLOAD_QUEUED_OFFLINE = auto()
 
 
 class yaRErrorCodesMapping:
@@ -19,7 +21,9 @@ class yaRErrorCodesMapping:
         yaRErrorCodes.VIDEO_UPLOAD_TOKEN_NOT_FOUND: "API token not found in environment variables.",
         yaRErrorCodes.VIDEO_FILE_NOT_FOUND_WHILE_UPLOAD: "The video file does not exist.",
         yaRErrorCodes.AUDIO_FILE_NOT_FOUND_WHILE_UPLOAD: "The audio file does not exist.",
-        yaRErrorCodes.VIDEO_PROCESSING_FAILED: "Video processing failed."
+        yaRErrorCodes.VIDEO_PROCESSING_FAILED: "Video processing failed.",
+        yaRErrorCodes.FRAME_NOT_CAPTURED: "No frame was captured while recording.",
+        yaRErrorCodes.UPLOAD_QUEUED_OFFLINE: "The server could not be reached. The recording is queued for upload."
     }
 
 
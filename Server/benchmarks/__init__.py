@@ -0,0 +1,5 @@
+# benchmarks/__init__.py
+
+# Load tests and micro-benchmarks for the server, runnable without API keys
+# or Firebase credentials. Run modules from the Server directory, e.g.
+# `python -m benchmarks.load_test --help`.
@@ -0,0 +1,136 @@
+"""
+Cold-start time of a server worker.
+
+Every run starts a fresh interpreter and times the steps a worker takes
+before it can serve: Django setup, importing the utils package and the
+views, and optionally the warm-up hook before them. Firebase is replaced by
+the in-memory fakes, so no credentials are needed.
+
+    cd Server
+    python -m benchmarks.cold_start --repeat 5
+
+The "warm_up" variant shows what is left for each worker to do after the
+hook ran before forking: its import_views time is the per-worker cost.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PHASES = ["django_setup", "import_utils", "warm_up", "import_views", "process"]
+
+
+def _child(warm):
+    """
+    Run the start-up steps in this (fresh) process and print their timings.
+    """
+    timings = {}
+
+    def step(name, function):
+        start_time = time.perf_counter()
+        function()
+        timings[name] = time.perf_counter() - start_time
+
+    from .fake_firebase import install_fake_firebase
+
+    install_fake_firebase()
+    if SERVER_DIR not in sys.path:
+        sys.path.insert(0, SERVER_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.settings")
+
+    import django
+
+    step("django_setup", django.setup)
+    step("import_utils", lambda: __import__("video_processing.utils"))
+    if warm:
+        from video_processing.utils.warmup import warm_up
+
+        step("warm_up", warm_up)
+    step("import_views", lambda: __import__("video_processing.views"))
+    print(json.dumps(timings))
+
+
+def run_once(warm):
+    """
+    Start one fresh interpreter and time its start-up.
+
+    Returns:
+        dict: Seconds per phase, plus "process" for the whole interpreter run.
+    """
+    command = [sys.executable, "-m", "benchmarks.cold_start", "--child"]
+    if warm:
+        command.append("--warm-up")
+    environment = dict(os.environ, PYTHONPATH=SERVER_DIR, WARM_UP="0")
+    # The views open the job database relative to the working directory.
+    with tempfile.TemporaryDirectory(prefix="yar-cold-") as workdir:
+        start_time = time.perf_counter()
+        result = subprocess.run(
+            command, cwd=workdir, env=environment, capture_output=True, text=True
+        )
+        elapsed = time.perf_counter() - start_time
+    if result.returncode != 0:
+        raise Exception(f"Cold start run failed: {result.stderr.strip()}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process"] = elapsed
+    return timings
+
+
+def measure_cold_start(repeat=3):
+    """
+    Time worker start-up with and without the warm-up hook.
+
+    Returns:
+        dict: Median seconds per phase, by variant ("cold" and "warm_up").
+    """
+    results = {}
+    for variant, warm in (("cold", False), ("warm_up", True)):
+        runs = [run_once(warm) for _ in range(repeat)]
+        results[variant] = {
+            phase: statistics.median(run[phase] for run in runs)
+            for phase in PHASES
+            if phase in runs[0]
+        }
+    return results
+
+
+def print_cold_start(results):
+    print(f"{'cold start':<18}" + "".join(f"{phase:>14}" for phase in PHASES))
+    for variant, timings in results.items():
+        print(
+            f"{variant:<18}"
+            + "".join(
+                f"{timings[phase]:>14.3f}" if phase in timings else f"{'-':>14}"
+                for phase in PHASES
+            )
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per variant")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warm-up", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(args.warm_up)
+        return 0
+
+    results = measure_cold_start(args.repeat)
+    print_cold_start(results)
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+"""
+Micro-benchmarks and memory profiles of the CPU-heavy server stages.
+
+Generates a matrix of clips (resolution x length x codec) and times
+extract_and_find_least_blurry_frame, find_least_blurry_frame,
+variance_of_laplacian and extract_audio on each, recording wall time, CPU
+time and peak memory (Python allocations via tracemalloc, and process RSS).
+
+    cd Server
+    python -m benchmarks.cpu_stages --save baseline.json
+    python -m benchmarks.cpu_stages --compare baseline.json
+
+Frame selection honours the usual FRAME_* and FOCUS_* variables, so two
+settings can be compared by saving a baseline with one and comparing with
+the other.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from .fake_firebase import install_fake_firebase
+from .media import generate_video
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESOLUTIONS = {"240p": (320, 240), "480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+CODECS = {"h264": ("libx264", ".mp4"), "mpeg4": ("mpeg4", ".mp4"), "vp9": ("libvpx-vp9", ".webm")}
+
+# Frames written out for find_least_blurry_frame.
+DIRECTORY_FRAMES = 30
+
+# variance_of_laplacian calls per timed sample, so a sample is not just
+# timer noise.
+LAPLACIAN_CALLS = 20
+
+# Metrics compared against the baseline, with the minimum absolute change
+# that counts as a regression, so tiny cases do not flag on noise.
+COMPARED_METRICS = {
+    "wall_seconds": 0.005,
+    "cpu_seconds": 0.005,
+    "peak_python_bytes": 1024 * 1024,
+    "peak_rss_bytes": 4 * 1024 * 1024,
+}
+
+
+class RssSampler:
+    """
+    Track the peak resident set size of this process while a block runs.
+
+    Reads /proc/self/statm every few milliseconds on Linux. Elsewhere the
+    process-wide ru_maxrss is used, which only grows, so the reported peak
+    is an upper bound.
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _rss(self):
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * self._page_size
+        except OSError:
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._rss())
+
+    def __enter__(self):
+        self.peak = self._rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+
+def measure(function, repeat):
+    """
+    Time a function and profile its memory.
+
+    The function runs `repeat` times for timing, then once more under
+    tracemalloc, which would otherwise slow down the timed runs.
+
+    Returns:
+        dict: Median wall and CPU seconds, peak Python allocation and peak RSS.
+    """
+    wall_times, cpu_times, peak_rss = [], [], 0
+    function()  # Warm up caches and lazy imports.
+    for _ in range(repeat):
+        with RssSampler() as sampler:
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            function()
+            wall_times.append(time.perf_counter() - wall_start)
+            cpu_times.append(time.process_time() - cpu_start)
+        peak_rss = max(peak_rss, sampler.peak)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_python = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "wall_seconds": statistics.median(wall_times),
+        "cpu_seconds": statistics.median(cpu_times),
+        "peak_python_bytes": peak_python,
+        "peak_rss_bytes": peak_rss,
+    }
+
+
+def build_clips(directory, resolutions, lengths, codecs):
+    """
+    Generate the clip matrix, skipping codecs this ffmpeg lacks.
+
+    Returns:
+        dict: Clip path by name, e.g. "720p-5s-h264".
+    """
+    clips = {}
+    for resolution in resolutions:
+        width, height = RESOLUTIONS[resolution]
+        for seconds in lengths:
+            for codec in codecs:
+                encoder, extension = CODECS[codec]
+                name = f"{resolution}-{seconds:g}s-{codec}"
+                try:
+                    clips[name] = generate_video(
+                        os.path.join(directory, name + extension),
+                        seconds,
+                        width,
+                        height,
+                        codec=encoder,
+                        audio=True,
+                    )
+                except Exception as e:
+                    print(f"Skipping {name}: {e}", file=sys.stderr)
+    return clips
+
+
+def run_benchmarks(clips, workdir, repeat, stages):
+    """
+    Run every selected stage on every clip.
+
+    Returns:
+        dict: Measurements by case name, e.g. "frame_selection/720p-5s-h264".
+    """
+    import cv2
+
+    from video_processing.utils import video_processing as stages_module
+
+    results = {}
+
+    def record(case, function):
+        print(f"  {case}", file=sys.stderr)
+        results[case] = measure(function, repeat)
+
+    for name, clip in clips.items():
+        if "frame_selection" in stages:
+            frames_dir = os.path.join(workdir, "selected", name)
+            record(
+                f"frame_selection/{name}",
+                lambda: stages_module.extract_and_find_least_blurry_frame(clip, frames_dir),
+            )
+
+        if "frame_directory" in stages or "laplacian" in stages:
+            frames_dir = os.path.join(workdir, "frames", name)
+            os.makedirs(frames_dir, exist_ok=True)
+            capture = cv2.VideoCapture(clip)
+            gray = None
+            for index in range(DIRECTORY_FRAMES):
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                cv2.imwrite(os.path.join(frames_dir, f"frame-{index:03d}.jpg"), frame)
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            capture.release()
+
+            if "frame_directory" in stages:
+                record(
+                    f"frame_directory/{name}",
+                    lambda: stages_module.find_least_blurry_frame(frames_dir),
+                )
+            # The Laplacian only depends on the resolution, so one clip
+            # per resolution is enough.
+            resolution = name.split("-")[0]
+            if "laplacian" in stages and gray is not None and f"laplacian/{resolution}" not in results:
+
+                def laplacian(gray=gray):
+                    for _ in range(LAPLACIAN_CALLS):
+                        stages_module.variance_of_laplacian(gray)
+
+                record(f"laplacian/{resolution}", laplacian)
+
+        if "audio" in stages:
+            for mode in ("copy", "speech"):
+
+                def extract(mode=mode):
+                    os.remove(stages_module.extract_audio(clip, mode))
+
+                record(f"audio_{mode}/{name}", extract)
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Flag measurements that got worse than the baseline by more than `threshold`.
+
+    Returns:
+        list: (case, metric, baseline value, current value) for each regression.
+    """
+    regressions = []
+    for case, current in sorted(results.items()):
+        previous = baseline.get("results", {}).get(case)
+        if previous is None:
+            continue
+        for metric, minimum_change in COMPARED_METRICS.items():
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            if after > before * (1 + threshold) and after - before > minimum_change:
+                regressions.append((case, metric, before, after))
+    return regressions
+
+
+def _format(metric, value):
+    if metric.endswith("_bytes"):
+        return f"{value / (1024 * 1024):.1f} MiB"
+    return f"{value * 1000:.1f} ms"
+
+
+def print_results(results, baseline=None):
+    print(f"{'case':<34}{'wall':>11}{'cpu':>11}{'python peak':>13}{'rss peak':>12}")
+    for case, stats in sorted(results.items()):
+        line = (
+            f"{case:<34}{_format('wall_seconds', stats['wall_seconds']):>11}"
+            f"{_format('cpu_seconds', stats['cpu_seconds']):>11}"
+            f"{_format('peak_python_bytes', stats['peak_python_bytes']):>13}"
+            f"{_format('peak_rss_bytes', stats['peak_rss_bytes']):>12}"
+        )
+        previous = (baseline or {}).get("results", {}).get(case)
+        if previous and previous.get("wall_seconds"):
+            change = stats["wall_seconds"] / previous["wall_seconds"] - 1
+            line += f"  {change:+.0%} wall"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--resolutions", default="240p,480p,720p,1080p")
+    parser.add_argument("--lengths", default="2,5", help="Clip lengths in seconds")
+    parser.add_argument("--codecs", default="h264,mpeg4,vp9")
+    parser.add_argument(
+        "--stages",
+        default="frame_selection,frame_directory,laplacian,audio",
+        help="Any of frame_selection, frame_directory, laplacian and audio",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case")
+    parser.add_argument("--quick", action="store_true", help="Only 480p, 2 s, h264, 3 runs")
+    parser.add_argument("--save", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", help="Compare against a JSON baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.15,
+        help="Relative slowdown or growth flagged as a regression",
+    )
+    parser.add_argument("--workdir", help="Where clips and outputs go; default a temp dir")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.quick:
+        args.resolutions, args.lengths, args.codecs, args.repeat = "480p", "2", "h264", 3
+    for name in ("save", "compare"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    # The stages live in the Django app, whose package imports Firebase.
+    install_fake_firebase()
+    if SERVER_DIR not in sys.path:
+        sys.path.insert(0, SERVER_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.settings")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="yar-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    clips = build_clips(
+        os.path.join(workdir, "clips"),
+        args.resolutions.split(","),
+        [float(length) for length in args.lengths.split(",")],
+        args.codecs.split(","),
+    )
+    if not clips:
+        print("No clips could be generated", file=sys.stderr)
+        return 1
+
+    print(f"Benchmarking {len(clips)} clips", file=sys.stderr)
+    results = run_benchmarks(clips, workdir, args.repeat, set(args.stages.split(",")))
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(
+                {
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "machine": {
+                        "platform": platform.platform(),
+                        "python": platform.python_version(),
+                        "cpus": os.cpu_count(),
+                    },
+                    "settings": {
+                        name: value
+                        for name, value in os.environ.items()
+                        if name.startswith(("FRAME_", "FOCUS_", "AUDIO_"))
+                    },
+                    "results": results,
+                },
+                baseline_file,
+                indent=2,
+            )
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for case, metric, before, after in regressions:
+            print(
+                f"REGRESSION {case} {metric}: {_format(metric, before)} -> {_format(metric, after)}"
+            )
+        if baseline.get("machine", {}).get("platform") != platform.platform():
+            print("Note: the baseline was recorded on a different platform", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import copy
+import sys
+import threading
+import types
+
+from .latency import Latency
+
+# Module the server imports its Firebase handles from.
+FIREBASE_CONFIG_MODULE = "video_processing.config.firebase_config"
+
+# Stands in for firestore.SERVER_TIMESTAMP in stored documents.
+SERVER_TIMESTAMP = "SERVER_TIMESTAMP"
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._client, f"{self.path}/{name}")
+
+    def get(self):
+        self._client.round_trip("reads")
+        return self._client.snapshot(self)
+
+    def set(self, data, merge=False):
+        self._client.round_trip("writes")
+        self._client.write(self.path, data, merge)
+
+
+class FakeCollection:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+
+    def document(self, document_id):
+        return FakeDocument(self._client, f"{self.path}/{document_id}")
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference.path, data, merge))
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise Exception("A batch may contain at most 500 writes")
+        self._client.round_trip("commits")
+        for path, data, merge in self._writes:
+            self._client.write(path, data, merge)
+        self._client.count("writes", len(self._writes))
+
+
+class FakeFirestore:
+    """
+    In-memory stand-in for the parts of the Firestore client the server uses.
+
+    Documents are kept in a dict keyed by path. Every round trip (get, set,
+    batch commit, get_all) sleeps for a sampled latency and is counted.
+
+    Args:
+        latency (Latency or str): Latency of one round trip.
+    """
+
+    def __init__(self, latency="fixed:0"):
+        self.latency = latency if isinstance(latency, Latency) else Latency.parse(latency)
+        self.documents = {}
+        self.counts = {"round_trips": 0, "reads": 0, "writes": 0, "commits": 0}
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, references):
+        references = list(references)
+        self.round_trip("reads", len(references))
+        return [self.snapshot(reference) for reference in references]
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def round_trip(self, name, amount=1):
+        self.latency.sleep()
+        with self._lock:
+            self.counts["round_trips"] += 1
+            self.counts[name] += amount
+
+    def snapshot(self, reference):
+        with self._lock:
+            return FakeSnapshot(reference, self.documents.get(reference.path))
+
+    def write(self, path, data, merge=False):
+        with self._lock:
+            if merge and path in self.documents:
+                self.documents[path].update(copy.deepcopy(data))
+            else:
+                self.documents[path] = copy.deepcopy(data)
+
+
+class PreconditionFailed(Exception):
+    """
+    Raised like google.api_core.exceptions.PreconditionFailed.
+    """
+
+    code = 412
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def public_url(self):
+        return f"https://storage.local/{self.bucket.name}/{self.name}"
+
+    def upload_from_string(
+        self, data, content_type=None, if_generation_match=None, predefined_acl=None
+    ):
+        self.bucket.upload(self.name, data, if_generation_match, predefined_acl)
+
+    def upload_from_filename(self, filename, content_type=None, **kwargs):
+        with open(filename, "rb") as upload_file:
+            self.upload_from_string(upload_file.read(), content_type, **kwargs)
+
+    def make_public(self):
+        self.bucket.round_trip()
+        self.bucket.public.add(self.name)
+
+
+class FakeBucket:
+    """
+    In-memory stand-in for a google.cloud.storage Bucket.
+
+    Objects are kept in a dict keyed by name. Uploads honour
+    if_generation_match=0 and predefined_acl="publicRead" like the real
+    bucket, and every request sleeps for a sampled latency.
+
+    Args:
+        latency (Latency or str): Latency of one request.
+        name (str): Bucket name used in public URLs.
+    """
+
+    def __init__(self, latency="fixed:0", name="local-bucket"):
+        self.latency = latency if isinstance(latency, Latency) else Latency.parse(latency)
+        self.name = name
+        self.objects = {}
+        self.public = set()
+        self.counts = {"requests": 0, "uploads": 0, "bytes": 0, "precondition_failures": 0}
+        self._lock = threading.Lock()
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def round_trip(self):
+        self.latency.sleep()
+        with self._lock:
+            self.counts["requests"] += 1
+
+    def upload(self, name, data, if_generation_match=None, predefined_acl=None):
+        self.round_trip()
+        with self._lock:
+            if if_generation_match == 0 and name in self.objects:
+                self.counts["precondition_failures"] += 1
+                raise PreconditionFailed(f"{name} already exists")
+            self.objects[name] = bytes(data)
+            self.counts["uploads"] += 1
+            self.counts["bytes"] += len(data)
+            if predefined_acl == "publicRead":
+                self.public.add(name)
+
+
+def install_fake_firebase(firestore_latency="fixed:0", storage_latency="fixed:0"):
+    """
+    Make the server use in-memory Firebase fakes instead of the real project.
+
+    Must be called before any `video_processing` module is imported, since
+    they import the handle getters from the Firebase config module.
+
+    Args:
+        firestore_latency (Latency or str): Latency of a Firestore round trip.
+        storage_latency (Latency or str): Latency of a Storage request.
+
+    Returns:
+        tuple: The FakeFirestore and FakeBucket in use.
+    """
+    db = FakeFirestore(firestore_latency)
+    bucket = FakeBucket(storage_latency)
+    module = types.ModuleType(FIREBASE_CONFIG_MODULE)
+    module.get_app = lambda: None
+    module.get_db = lambda: db
+    module.get_bucket = lambda: bucket
+    module.server_timestamp = lambda: SERVER_TIMESTAMP
+    module.db = db
+    module.bucket = bucket
+    sys.modules[FIREBASE_CONFIG_MODULE] = module
+    return db, bucket
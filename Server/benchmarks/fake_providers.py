@@ -0,0 +1,233 @@
+import itertools
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .latency import Latency
+
+# Canned content. With vary_content the transcript and answer carry a
+# request number, so the response caches do not turn the run into cache hits.
+TRANSCRIPT = "What is in front of me right now?"
+ANSWER = (
+    "You are facing a wooden desk with a laptop on it. "
+    "To the left there is a mug, about an arm's length away. "
+    "The path ahead of you is clear."
+)
+
+
+class ProviderHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-ins for the OpenAI and Anthropic endpoints the server calls.
+
+    - POST /v1/audio/translations returns a JSON transcript;
+    - POST /v1/audio/speech streams audio bytes in chunks;
+    - POST /v1/messages answers like the Anthropic Messages API, streamed as
+      server-sent events when the request asks for it.
+
+    Latencies come from the server's `latency` dict.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = self._read_body()
+        self.server.count(self.path)
+        if self.path.endswith("/audio/translations"):
+            self._transcribe()
+        elif self.path.endswith("/audio/speech"):
+            self._speak(json.loads(body or b"{}"))
+        elif self.path.endswith("/messages"):
+            self._answer(json.loads(body or b"{}"))
+        else:
+            self._send_json({"error": f"Unknown path {self.path}"}, status=404)
+
+    def _transcribe(self):
+        self.server.latency["stt"].sleep()
+        self._send_json({"text": self.server.text(TRANSCRIPT)})
+
+    def _speak(self, payload):
+        # Roughly 16 kB of 64 kbit/s MP3 per second of speech, ~15 chars/s.
+        size = max(4096, len(payload.get("input", "")) * 1100)
+        self._start_chunked("audio/mpeg")
+        self.server.latency["tts"].sleep()
+        audio = os.urandom(size)
+        for start in range(0, size, 4096):
+            self._write_chunk(audio[start:start + 4096])
+            self.server.latency["tts_chunk"].sleep()
+        self._end_chunked()
+
+    def _answer(self, payload):
+        model = payload.get("model", "claude-3-haiku-20240307")
+        text = self.server.text(ANSWER)
+        words = text.split(" ")
+        usage = {"input_tokens": 1000, "output_tokens": len(words)}
+
+        if not payload.get("stream"):
+            self.server.latency["vision"].sleep()
+            self._send_json(
+                {
+                    "id": "msg_local",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": model,
+                    "content": [{"type": "text", "text": text}],
+                    "stop_reason": "end_turn",
+                    "stop_sequence": None,
+                    "usage": usage,
+                }
+            )
+            return
+
+        def event(name, data):
+            self._write_chunk(
+                f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+            )
+
+        self._start_chunked("text/event-stream")
+        self.server.latency["vision"].sleep()
+        event(
+            "message_start",
+            {
+                "type": "message_start",
+                "message": {
+                    "id": "msg_local",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": model,
+                    "content": [],
+                    "stop_reason": None,
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": usage["input_tokens"], "output_tokens": 1},
+                },
+            },
+        )
+        event(
+            "content_block_start",
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+        )
+        for index, word in enumerate(words):
+            delta = word if index == 0 else f" {word}"
+            event(
+                "content_block_delta",
+                {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": delta}},
+            )
+            self.server.latency["vision_token"].sleep()
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event(
+            "message_delta",
+            {
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": usage["output_tokens"]},
+            },
+        )
+        event("message_stop", {"type": "message_stop"})
+        self._end_chunked()
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    """
+    A local HTTP server standing in for OpenAI and Anthropic.
+
+    Args:
+        port (int): Port to listen on, 0 for any free port.
+        latency (dict): Latency per step: "stt" (whole transcription),
+            "tts" (first audio byte), "tts_chunk" (between audio chunks),
+            "vision" (first token or whole answer) and "vision_token"
+            (between streamed tokens). Values are Latency objects or specs.
+        vary_content (bool): Number every transcript and answer, so they are
+            never served from the server's response caches.
+    """
+
+    daemon_threads = True
+
+    DEFAULT_LATENCY = {
+        "stt": "lognormal:0.6:0.3",
+        "tts": "lognormal:0.3:0.3",
+        "tts_chunk": "fixed:0.01",
+        "vision": "lognormal:0.8:0.4",
+        "vision_token": "fixed:0.02",
+    }
+
+    def __init__(self, port=0, latency=None, vary_content=True):
+        super().__init__(("127.0.0.1", port), ProviderHandler)
+        specs = dict(self.DEFAULT_LATENCY, **(latency or {}))
+        self.latency = {
+            name: spec if isinstance(spec, Latency) else Latency.parse(spec)
+            for name, spec in specs.items()
+        }
+        self.vary_content = vary_content
+        self.requests = {}
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def text(self, text):
+        return f"{text} ({next(self._counter)})" if self.vary_content else text
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def start(self):
+        """
+        Serve in a background thread.
+
+        Returns:
+            FakeProviderServer: self, for chaining.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def environment(self):
+        """
+        Environment variables pointing the server's clients at this stand-in.
+
+        Returns:
+            dict: Variables to set before the server's modules are imported.
+        """
+        return {
+            "OPENAI_BASE_URL": f"{self.base_url}/v1",
+            "ANTHROPIC_BASE_URL": self.base_url,
+            "OPENAI_API_KEY": "local",
+            "ANTHROPIC_API_KEY": "local",
+        }
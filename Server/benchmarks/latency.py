@@ -0,0 +1,73 @@
+import math
+import random
+import time
+
+
+class Latency:
+    """
+    A latency distribution used by the local stand-ins.
+
+    Specs are written "<kind>:<parameters>" in seconds:
+
+    - "fixed:0.5" always waits 0.5 s;
+    - "uniform:0.2:0.8" waits between 0.2 and 0.8 s;
+    - "normal:0.5:0.1" has mean 0.5 s and standard deviation 0.1 s;
+    - "lognormal:0.5:0.4" has median 0.5 s and shape 0.4, a long right tail
+      like real provider latencies;
+    - "exp:0.5" is exponential with mean 0.5 s.
+
+    Samples are never negative.
+
+    Args:
+        kind (str): One of the kinds above.
+        params (tuple): Parameters of the distribution.
+        rng (random.Random): Optional random generator, for reproducible runs.
+    """
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+
+    def __init__(self, kind="fixed", params=(0.0,), rng=None):
+        if self.KINDS.get(kind) != len(params):
+            raise Exception(f"Invalid latency '{kind}' with parameters {params}")
+        self.kind = kind
+        self.params = tuple(float(param) for param in params)
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def parse(cls, spec, rng=None):
+        """
+        Build a Latency from a spec such as "lognormal:0.5:0.4".
+
+        A bare number is a fixed latency.
+        """
+        kind, *params = str(spec).split(":")
+        if not params:
+            kind, params = "fixed", [kind]
+        return cls(kind, params, rng)
+
+    def sample(self):
+        """
+        Returns:
+            float: A latency in seconds.
+        """
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = self.rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = self.rng.gauss(*self.params)
+        elif self.kind == "lognormal":
+            median, shape = self.params
+            value = self.rng.lognormvariate(math.log(median) if median > 0 else 0, shape)
+        else:
+            value = self.rng.expovariate(1 / self.params[0]) if self.params[0] else 0
+        return max(0.0, value)
+
+    def sleep(self):
+        """
+        Wait for a sampled latency.
+        """
+        time.sleep(self.sample())
+
+    def __repr__(self):
+        return ":".join([self.kind] + [f"{param:g}" for param in self.params])
@@ -0,0 +1,434 @@
+"""
+End-to-end load test of the upload route against local stand-ins.
+
+By default the server runs in this process, wired to a FakeProviderServer
+for OpenAI and Anthropic and to in-memory Firestore and Storage fakes, so
+no API keys or credentials are needed and nothing is billed:
+
+    cd Server
+    python -m benchmarks.load_test --concurrency 8 --requests 200
+
+Pass --url to load an already running server instead; it must then be
+configured with the fakes' environment itself (see --serve-fakes). Its
+stage percentiles then also cover any traffic it served before the run.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import requests
+
+from .cold_start import measure_cold_start, print_cold_start
+from .fake_providers import FakeProviderServer
+from .media import generate_video, generate_wav
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGE_ORDER = (
+    "request",
+    "save",
+    "audio_extraction",
+    "frame_selection",
+    "stt",
+    "vision",
+    "tts_first_byte",
+    "tts_complete",
+    "storage_upload",
+    "firestore_write",
+)
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of numbers, 0.0 if empty.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server_in_process(providers, port, firestore_latency, storage_latency):
+    """
+    Start the Django app in this process, wired to the local stand-ins.
+
+    Must run before anything imports `video_processing`.
+
+    Args:
+        providers (FakeProviderServer): Running provider stand-in.
+        port (int): Port for the app, 0 for any free port.
+        firestore_latency (str): Latency spec of a Firestore round trip.
+        storage_latency (str): Latency spec of a Storage request.
+
+    Returns:
+        tuple: Base URL of the app, the FakeFirestore and the FakeBucket.
+    """
+    from .fake_firebase import install_fake_firebase
+
+    os.environ.update(providers.environment())
+    db, bucket = install_fake_firebase(firestore_latency, storage_latency)
+
+    if SERVER_DIR not in sys.path:
+        sys.path.insert(0, SERVER_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "server.settings")
+    import django
+    from django.core.wsgi import get_wsgi_application
+
+    django.setup()
+    httpd = make_server(
+        "127.0.0.1",
+        port,
+        get_wsgi_application(),
+        server_class=_ThreadingWSGIServer,
+        handler_class=_QuietHandler,
+    )
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_address[1]}", db, bucket
+
+
+def drain_background_work(timeout=120):
+    """
+    Wait for the in-process job queue and Firestore writer to finish.
+    """
+    from video_processing.utils import get_job_queue
+    from video_processing.utils.firebase_utils import query_writer
+
+    get_job_queue().join(timeout=timeout)
+    query_writer.flush()
+
+
+def _sharp_frame_jpeg(video_path):
+    """
+    Encode a sharp frame of a generated clip, standing in for the frame a
+    Pi picks itself. The clips are sharp in the last 30% of every second.
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(video_path)
+    capture.set(cv2.CAP_PROP_POS_MSEC, 850)
+    ok, frame = capture.read()
+    capture.release()
+    if not ok:
+        raise Exception(f"Could not read a frame from {video_path}")
+    ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise Exception("Error encoding frame")
+    return buffer.tobytes()
+
+
+def generate_clips(directory, seconds, width, height):
+    """
+    Generate one upload per device type.
+
+    Returns:
+        dict: Multipart files per device type, as (name, bytes, content type) tuples.
+    """
+
+    def read(path):
+        with open(path, "rb") as media_file:
+            return media_file.read()
+
+    rpi_video = generate_video(os.path.join(directory, "rpi.mp4"), seconds, width, height)
+    rpi_audio = generate_wav(os.path.join(directory, "rpi.wav"), seconds)
+    clips = {
+        "rpi": {
+            "video": ("video.mp4", read(rpi_video), "video/mp4"),
+            "audio": ("audio.wav", read(rpi_audio), "audio/wav"),
+        }
+    }
+    try:
+        clips["rpi-frame"] = {
+            "image": ("frame.jpg", _sharp_frame_jpeg(rpi_video), "image/jpeg"),
+            "audio": clips["rpi"]["audio"],
+        }
+    except Exception as e:
+        print(f"Skipping rpi-frame uploads: {e}", file=sys.stderr)
+    try:
+        android_video = generate_video(
+            os.path.join(directory, "android.mp4"), seconds, width, height, audio=True
+        )
+        clips["android"] = {"video": ("video.mp4", read(android_video), "video/mp4")}
+    except Exception as e:
+        print(f"Skipping android uploads: {e}", file=sys.stderr)
+    return clips
+
+
+def run_load(upload_url, clips, devices, concurrency, total, boards):
+    """
+    Send `total` uploads with `concurrency` in flight, cycling through devices.
+
+    Returns:
+        tuple: One result dict per request, and the wall time of the run.
+    """
+    sessions = threading.local()
+
+    def upload(index):
+        device = devices[index % len(devices)]
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        headers = {"X-Token": f"load-{index % boards}", "X-Device-Type": device}
+        result = {"device": device, "status": None, "ttfb": None, "total": None, "bytes": 0}
+        start = time.perf_counter()
+        try:
+            with sessions.session.post(
+                upload_url, files=clips[device], headers=headers, stream=True, timeout=300
+            ) as response:
+                result["status"] = response.status_code
+                for chunk in response.iter_content(4096):
+                    if result["ttfb"] is None:
+                        result["ttfb"] = time.perf_counter() - start
+                    result["bytes"] += len(chunk)
+        except Exception as e:
+            result["error"] = str(e)
+        result["total"] = time.perf_counter() - start
+        return result
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(upload, range(total)))
+    return results, time.perf_counter() - start
+
+
+def fetch_stage_quantiles(metrics_url):
+    """
+    Read the stage quantiles and counts from the server's metrics page.
+
+    Returns:
+        dict: {stage: {"p50": ..., "p95": ..., "p99": ..., "count": ...}}.
+    """
+    with urllib.request.urlopen(metrics_url, timeout=30) as response:
+        page = response.read().decode("utf-8")
+    stages = {}
+    for line in page.splitlines():
+        if line.startswith("yar_stage_duration_quantile_seconds{"):
+            labels, value = line[line.index("{") + 1:].split("} ")
+            fields = dict(part.split("=") for part in labels.split(","))
+            stage = fields["stage"].strip('"')
+            quantile = float(fields["quantile"].strip('"'))
+            stages.setdefault(stage, {})[f"p{int(round(quantile * 100))}"] = float(value)
+        elif line.startswith("yar_stage_duration_seconds_count{"):
+            labels, value = line[line.index("{") + 1:].split("} ")
+            stage = labels.split("=")[1].strip('"')
+            stages.setdefault(stage, {})["count"] = int(float(value))
+    return stages
+
+
+def build_report(results, wall_time, stages, concurrency, fakes=None, clips=None, cpu_time=None):
+    ok = [result for result in results if result["status"] == 200]
+    report = {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "concurrency": concurrency,
+        "wall_seconds": wall_time,
+        "requests_per_second": len(ok) / wall_time if wall_time else 0.0,
+        "devices": {},
+        "client": {},
+        "stages": stages,
+    }
+    for device in sorted({result["device"] for result in results}):
+        device_results = [result for result in ok if result["device"] == device]
+        report["devices"][device] = {
+            "requests": sum(result["device"] == device for result in results),
+            "upload_bytes": sum(len(part[1]) for part in (clips or {}).get(device, {}).values()),
+            "ttfb_p50": percentile([r["ttfb"] for r in device_results if r["ttfb"]], 0.5),
+            "ttfb_p99": percentile([r["ttfb"] for r in device_results if r["ttfb"]], 0.99),
+            "total_p50": percentile([r["total"] for r in device_results], 0.5),
+            "total_p99": percentile([r["total"] for r in device_results], 0.99),
+        }
+    report["client"] = {
+        "ttfb_p50": percentile([r["ttfb"] for r in ok if r["ttfb"]], 0.5),
+        "ttfb_p99": percentile([r["ttfb"] for r in ok if r["ttfb"]], 0.99),
+        "total_p50": percentile([r["total"] for r in ok], 0.5),
+        "total_p99": percentile([r["total"] for r in ok], 0.99),
+    }
+    errors = sorted({result.get("error") or str(result["status"]) for result in results if result not in ok})
+    if errors:
+        report["errors"] = errors[:10]
+    if fakes:
+        report["fakes"] = fakes
+    if cpu_time is not None:
+        report["cpu_seconds_per_request"] = cpu_time / len(results) if results else 0.0
+    return report
+
+
+def print_report(report):
+    print(
+        f"{report['requests']} requests at concurrency {report['concurrency']}: "
+        f"{report['succeeded']} ok, {report['failed']} failed"
+    )
+    print(
+        f"Throughput: {report['requests_per_second']:.2f} req/s "
+        f"over {report['wall_seconds']:.1f} s"
+    )
+    print()
+    print(f"{'client':<18}{'p50':>10}{'p99':>10}")
+    for name in ("ttfb", "total"):
+        print(
+            f"{name:<18}{report['client'][f'{name}_p50']:>10.3f}"
+            f"{report['client'][f'{name}_p99']:>10.3f}"
+        )
+    for device, stats in report["devices"].items():
+        print(
+            f"{device + ' total':<18}{stats['total_p50']:>10.3f}{stats['total_p99']:>10.3f}"
+            f"  ({stats['upload_bytes'] / 1024:.0f} KiB uploaded)"
+        )
+    if "cpu_seconds_per_request" in report:
+        print(f"CPU per request: {report['cpu_seconds_per_request'] * 1000:.1f} ms (server and client)")
+    print()
+    print(f"{'stage':<18}{'p50':>10}{'p99':>10}{'count':>8}")
+    stages = report["stages"]
+    for stage in [s for s in STAGE_ORDER if s in stages] + sorted(set(stages) - set(STAGE_ORDER)):
+        stats = stages[stage]
+        print(
+            f"{stage:<18}{stats.get('p50', 0):>10.3f}{stats.get('p99', 0):>10.3f}"
+            f"{stats.get('count', 0):>8}"
+        )
+    for error in report.get("errors", []):
+        print(f"error: {error}")
+    if "fakes" in report:
+        print()
+        print(f"Fakes: {json.dumps(report['fakes'])}")
+    if "cold_start" in report:
+        print()
+        print_cold_start(report["cold_start"])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="Base URL of a running server; default runs one in-process")
+    parser.add_argument("--endpoint", default="upload/", choices=["upload/", "upload/async/"])
+    parser.add_argument(
+        "--devices", default="rpi,android", help="Comma separated device types: rpi, rpi-frame, android"
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--boards", type=int, default=10, help="Number of distinct board tokens")
+    parser.add_argument("--video-seconds", type=float, default=3.0)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--stt-latency", default=FakeProviderServer.DEFAULT_LATENCY["stt"])
+    parser.add_argument("--tts-latency", default=FakeProviderServer.DEFAULT_LATENCY["tts"])
+    parser.add_argument("--vision-latency", default=FakeProviderServer.DEFAULT_LATENCY["vision"])
+    parser.add_argument("--vision-token-latency", default=FakeProviderServer.DEFAULT_LATENCY["vision_token"])
+    parser.add_argument("--firestore-latency", default="lognormal:0.03:0.3")
+    parser.add_argument("--storage-latency", default="lognormal:0.1:0.3")
+    parser.add_argument(
+        "--repeat-content",
+        action="store_true",
+        help="Return the same transcript and answer every time, letting the response caches hit",
+    )
+    parser.add_argument("--provider-port", type=int, default=0)
+    parser.add_argument("--port", type=int, default=0, help="Port of the in-process server")
+    parser.add_argument(
+        "--serve-fakes",
+        action="store_true",
+        help="Only run the provider stand-in and print its environment, for use with --url",
+    )
+    parser.add_argument(
+        "--cold-start-runs",
+        type=int,
+        default=3,
+        help="Fresh worker start-ups timed for the report, 0 to skip; not used with --url",
+    )
+    parser.add_argument("--workdir", help="Where clips and server files go; default a temp dir")
+    parser.add_argument("--json", help="Also write the report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    providers = FakeProviderServer(
+        port=args.provider_port,
+        latency={
+            "stt": args.stt_latency,
+            "tts": args.tts_latency,
+            "vision": args.vision_latency,
+            "vision_token": args.vision_token_latency,
+        },
+        vary_content=not args.repeat_content,
+    ).start()
+
+    if args.serve_fakes:
+        for name, value in providers.environment().items():
+            print(f"export {name}={value}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            return 0
+
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="yar-load-")
+    os.makedirs(workdir, exist_ok=True)
+    clips = generate_clips(os.path.join(workdir, "media"), args.video_seconds, args.width, args.height)
+    devices = [device for device in args.devices.split(",") if device in clips]
+    if not devices:
+        print("No clips could be generated for the requested devices", file=sys.stderr)
+        return 1
+
+    db = bucket = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        # The server writes uploads, logs and its job database relative to
+        # the working directory.
+        os.chdir(workdir)
+        base_url, db, bucket = start_server_in_process(
+            providers, args.port, args.firestore_latency, args.storage_latency
+        )
+
+    cpu_start = time.process_time()
+    results, wall_time = run_load(
+        f"{base_url}/video_processing/{args.endpoint}",
+        clips,
+        devices,
+        args.concurrency,
+        args.requests,
+        args.boards,
+    )
+
+    cpu_time = None
+    fakes = None
+    if db is not None:
+        drain_background_work()
+        cpu_time = time.process_time() - cpu_start
+        fakes = {
+            "providers": providers.requests,
+            "firestore": db.counts,
+            "storage": bucket.counts,
+        }
+    stages = fetch_stage_quantiles(f"{base_url}/video_processing/metrics/")
+    report = build_report(
+        results, wall_time, stages, args.concurrency, fakes, clips, cpu_time
+    )
+    if not args.url and args.cold_start_runs > 0:
+        report["cold_start"] = measure_cold_start(args.cold_start_runs)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    providers.stop()
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import os
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+
+def generate_video(
+    path,
+    seconds=3.0,
+    width=640,
+    height=480,
+    fps=30,
+    codec="libx264",
+    audio=False,
+):
+    """
+    Write a synthetic test clip.
+
+    The clip is ffmpeg's testsrc2 pattern, blurred for the first 70% of
+    every second, so frame selection has sharp and blurry frames to choose
+    from. Android-style clips carry a tone as their audio track.
+
+    Without ffmpeg the clip is written with OpenCV's mp4v encoder instead,
+    which cannot add audio.
+
+    Args:
+        path (str): Output path; the extension picks the container.
+        seconds (float): Duration.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        fps (int): Frame rate.
+        codec (str): ffmpeg video encoder, e.g. "libx264", "mpeg4" or "libvpx-vp9".
+        audio (bool): Add an AAC (or Opus for WebM) audio track.
+
+    Returns:
+        str: The path written.
+
+    Raises:
+        Exception: If the clip cannot be generated.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    if shutil.which(FFMPEG_BINARY) is None:
+        if audio:
+            raise Exception("ffmpeg is required to generate clips with audio")
+        return _generate_video_opencv(path, seconds, width, height, fps)
+
+    command = [
+        FFMPEG_BINARY, "-nostdin", "-v", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={seconds}",
+    ]
+    if audio:
+        command += ["-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=44100:duration={seconds}"]
+    command += [
+        "-vf", "gblur=sigma=6:enable='lt(mod(t,1),0.7)'",
+        "-c:v", codec, "-pix_fmt", "yuv420p",
+    ]
+    if audio:
+        audio_codec = "libopus" if path.endswith(".webm") else "aac"
+        command += ["-c:a", audio_codec, "-shortest"]
+    command.append(path)
+
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise Exception(
+            f"Error generating {path}: {result.stderr.decode('utf-8', 'replace').strip()}"
+        )
+    return path
+
+
+def _generate_video_opencv(path, seconds, width, height, fps):
+    import cv2
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise Exception(f"Error opening video writer for {path}")
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    try:
+        for index in range(int(seconds * fps)):
+            frame = np.roll(base, index * 4, axis=1)
+            if index % fps < 0.7 * fps:
+                frame = cv2.GaussianBlur(frame, (0, 0), 6)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+def generate_wav(path, seconds=3.0, sample_rate=16000):
+    """
+    Write a synthetic, speech-like mono 16-bit WAV file.
+
+    The signal is a harmonic series with a pitch glide, gated into
+    syllable-length bursts, which is enough for the encoders and
+    transcription stand-in to behave as they would with speech.
+
+    Args:
+        path (str): Output path.
+        seconds (float): Duration.
+        sample_rate (int): Sample rate in Hz.
+
+    Returns:
+        str: The path written.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    signal = sum(np.sin(harmonic * phase) / harmonic for harmonic in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    samples = (0.3 * 32767 * signal * envelope / 2.3).astype(np.int16)
+
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+    return path
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
 application = get_wsgi_application()
+
+# Import the slow modules now rather than on the first request. Under a
+# preloading server this runs once, before the workers are forked.
+from video_processing.utils.warmup import WARM_UP, warm_up  # noqa: E402
+
+if WARM_UP:
+    warm_up()
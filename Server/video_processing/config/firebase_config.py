@@ -1,9 +1,103 @@
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
+import os
+import threading
 
-cred = credentials.Certificate("video_processing/yar-v2.json")
+# Service account key and Storage bucket of the Firebase project. They are
+# only read when Firebase is first used, so importing the server (and
+# running management commands) needs neither the key nor the network.
+FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "video_processing/yar-v2.json")
+FIREBASE_STORAGE_BUCKET = os.getenv("FIREBASE_STORAGE_BUCKET", "yar-v2.appspot.com")
 
-firebase_admin.initialize_app(cred, {"storageBucket": "yar-v2.appspot.com"})
+_handles = {}
+_lock = threading.Lock()
 
-db = firestore.client()
-bucket = storage.bucket()
+
+def _get_or_create(name, factory):
+    """
+    Return the handle registered under a name, creating it once.
+    """
+    handle = _handles.get(name)
+    if handle is None:
+        with _lock:
+            handle = _handles.get(name)
+            if handle is None:
+                handle = _handles[name] = factory()
+    return handle
+
+
+def _initialize_app():
+    import firebase_admin
+    from firebase_admin import credentials
+
+    cred = credentials.Certificate(FIREBASE_CREDENTIALS)
+    return firebase_admin.initialize_app(cred, {"storageBucket": FIREBASE_STORAGE_BUCKET})
+
+
+def get_app():
+    """
+    Get the Firebase app, reading the credentials and initialising it on first use.
+
+    Returns:
+        firebase_admin.App: The default app.
+    """
+    return _get_or_create("app", _initialize_app)
+
+
+def get_db():
+    """
+    Get the Firestore client, creating it on first use.
+
+    The client holds a gRPC channel, which does not survive a fork, so it
+    should be created in the worker process rather than before forking.
+
+    Returns:
+        google.cloud.firestore.Client: The shared client.
+    """
+
+    def create():
+        from firebase_admin import firestore
+
+        return firestore.client(get_app())
+
+    return _get_or_create("db", create)
+
+
+def get_bucket():
+    """
+    Get the Storage bucket, creating its client on first use.
+
+    Returns:
+        google.cloud.storage.Bucket: The app's bucket.
+    """
+
+    def create():
+        from firebase_admin import storage
+
+        return storage.bucket(app=get_app())
+
+    return _get_or_create("bucket", create)
+
+
+def server_timestamp():
+    """
+    Sentinel asking Firestore to store the server's time in a field.
+
+    Returns:
+        The firestore.SERVER_TIMESTAMP sentinel.
+    """
+    from firebase_admin import firestore
+
+    return firestore.SERVER_TIMESTAMP
+
+
+def __getattr__(name):
+    # Older imports of the module-level handles keep working, but now
+    # initialise Firebase on access instead of on import.
+    if name == "db":
+        return get_db()
+    if name == "bucket":
+        return get_bucket()
+    if name in ("firestore", "storage"):
+        import importlib
+
+        return importlib.import_module(f"firebase_admin.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,5 @@
+# Tests never talk to the real Firebase project: the in-memory fakes replace
+# the config module before any server module imports its handle getters.
+from benchmarks.fake_firebase import install_fake_firebase
+
+install_fake_firebase()
@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+from django.test import SimpleTestCase
+
+from video_processing.utils.focus_metrics import FOCUS_METRICS, get_focus_metric
+from video_processing.utils.video_processing import variance_of_laplacian
+
+
+def frames():
+    """
+    The same textured scene, sharp and then increasingly blurred.
+    """
+    rng = np.random.default_rng(0)
+    scene = cv2.resize(
+        rng.integers(0, 256, size=(60, 80), dtype=np.uint8), (320, 240), interpolation=cv2.INTER_NEAREST
+    )
+    blurred = [cv2.GaussianBlur(scene, (0, 0), sigma) for sigma in (1, 2, 4)]
+    return np.stack([scene, *blurred])
+
+
+def interior(image):
+    return image[1:-1, 1:-1]
+
+
+def cv2_laplacian(frame):
+    # cv2 also scores the border, which the batch metric leaves out.
+    return interior(cv2.Laplacian(frame, cv2.CV_64F)).var()
+
+
+def cv2_tenengrad(frame):
+    gx = interior(cv2.Sobel(frame, cv2.CV_64F, 1, 0, ksize=3))
+    gy = interior(cv2.Sobel(frame, cv2.CV_64F, 0, 1, ksize=3))
+    return (gx * gx + gy * gy).mean()
+
+
+def cv2_gradient(frame):
+    decimated = frame[::2, ::2]
+    # Forward differences; the last column and row would read past the frame.
+    dx = cv2.filter2D(decimated, cv2.CV_64F, np.array([[-1, 1]]), anchor=(0, 0))[:, :-1]
+    dy = cv2.filter2D(decimated, cv2.CV_64F, np.array([[-1], [1]]), anchor=(0, 0))[:-1, :]
+    return np.abs(dx).mean() + np.abs(dy).mean()
+
+
+REFERENCES = {
+    "laplacian": cv2_laplacian,
+    "tenengrad": cv2_tenengrad,
+    "gradient": cv2_gradient,
+}
+
+
+class FocusMetricTests(SimpleTestCase):
+    def setUp(self):
+        self.frames = frames()
+
+    def test_every_metric_has_a_reference(self):
+        self.assertEqual(set(FOCUS_METRICS), set(REFERENCES))
+
+    def test_metrics_match_their_cv2_reference(self):
+        for name, reference in REFERENCES.items():
+            with self.subTest(name):
+                np.testing.assert_allclose(
+                    get_focus_metric(name)(self.frames),
+                    [reference(frame) for frame in self.frames],
+                    rtol=1e-5,
+                )
+
+    def test_batch_scores_equal_per_frame_scores(self):
+        for name, metric in FOCUS_METRICS.items():
+            with self.subTest(name):
+                np.testing.assert_allclose(
+                    metric(self.frames),
+                    [metric(frame)[0] for frame in self.frames],
+                    rtol=1e-6,
+                )
+
+    def test_metrics_rank_sharper_frames_higher(self):
+        for name, metric in FOCUS_METRICS.items():
+            with self.subTest(name):
+                scores = metric(self.frames)
+                self.assertTrue(np.all(np.diff(scores) < 0), scores)
+
+    def test_laplacian_ranks_like_variance_of_laplacian(self):
+        scores = get_focus_metric("laplacian")(self.frames)
+        full_frame_scores = [variance_of_laplacian(frame) for frame in self.frames]
+
+        self.assertEqual(list(np.argsort(scores)), list(np.argsort(full_frame_scores)))
+
+    def test_rejects_color_frames(self):
+        with self.assertRaises(Exception):
+            get_focus_metric("laplacian")(np.zeros((2, 8, 8, 3), dtype=np.uint8))
+
+    def test_rejects_unknown_metrics(self):
+        with self.assertRaises(Exception):
+            get_focus_metric("entropy")
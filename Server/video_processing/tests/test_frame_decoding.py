@@ -0,0 +1,150 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from unittest import mock
+
+import cv2
+import numpy as np
+from django.test import SimpleTestCase
+
+from benchmarks.media import FFMPEG_BINARY, generate_video
+from video_processing.utils import video_processing
+from video_processing.utils.video_processing import (
+    _can_seek,
+    _frame_source,
+    _keyframe_timestamps,
+    select_least_blurry_frame,
+)
+
+FPS = 30
+SECONDS = 2
+
+
+def ffprobe_output(stdout):
+    """
+    Stand in for ffprobe, which lists packets as "pts_time,flags" lines.
+    """
+    return mock.patch.object(
+        video_processing.subprocess,
+        "run",
+        return_value=subprocess.CompletedProcess([], 0, stdout=stdout, stderr=""),
+    )
+
+
+class FrameDecodingTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        cls.mp4 = generate_video(
+            os.path.join(cls.directory, "clip.mp4"), seconds=SECONDS, width=320, height=240, fps=FPS
+        )
+        cls.frames = []
+        cap = cv2.VideoCapture(cls.mp4)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            cls.frames.append(frame)
+        cap.release()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def decode(self, path, decode_mode, frame_stride=1, samples=5):
+        cap, frames = _frame_source(path, decode_mode, frame_stride, samples)
+        try:
+            return [(index, frame.copy()) for index, frame in frames]
+        finally:
+            cap.release()
+
+    def indices(self, *args, **kwargs):
+        return [index for index, _ in self.decode(*args, **kwargs)]
+
+
+class DecodeModeTests(FrameDecodingTestCase):
+    def test_full_decodes_every_frame(self):
+        decoded = self.decode(self.mp4, "full")
+
+        self.assertEqual([index for index, _ in decoded], list(range(SECONDS * FPS)))
+        self.assertTrue(all(np.array_equal(frame, self.frames[index]) for index, frame in decoded))
+
+    def test_full_skips_frames_by_the_stride(self):
+        self.assertEqual(self.indices(self.mp4, "full", frame_stride=7), list(range(0, SECONDS * FPS, 7)))
+
+    def test_sampled_seeks_to_evenly_spaced_frames(self):
+        decoded = self.decode(self.mp4, "sampled", samples=5)
+
+        self.assertEqual([index for index, _ in decoded], [0, 15, 30, 44, 59])
+        for index, frame in decoded:
+            self.assertTrue(np.array_equal(frame, self.frames[index]), index)
+
+    def test_keyframes_seeks_to_the_listed_keyframes(self):
+        packets = "0.000000,K_\n0.033333,__\n1.000000,K_\nN/A,K_\n1.033333,__\n"
+
+        with ffprobe_output(packets):
+            decoded = self.decode(self.mp4, "keyframes")
+
+        self.assertEqual([index for index, _ in decoded], [0, FPS])
+        for index, frame in decoded:
+            self.assertTrue(np.array_equal(frame, self.frames[index]), index)
+
+    def test_keyframes_are_thinned_to_the_sample_count(self):
+        packets = "".join(f"{second / 10:.6f},K_\n" for second in range(20))
+
+        with ffprobe_output(packets):
+            indices = self.indices(self.mp4, "keyframes", samples=3)
+
+        self.assertEqual(indices, [0, 30, 57])
+
+    def test_rejects_unknown_modes(self):
+        with self.assertRaises(Exception):
+            _frame_source(self.mp4, "random", 1, 5)
+
+    def test_sampled_selection_still_picks_a_sharp_frame(self):
+        selector = select_least_blurry_frame(
+            self.mp4, decode_mode="sampled", samples=12, time_budget=None, good_enough=None
+        )
+
+        # The clip is blurred for the first 70% of every second.
+        self.assertGreaterEqual(selector.best_index % FPS, 0.7 * FPS - 1)
+
+
+class SequentialFallbackTests(FrameDecodingTestCase):
+    def test_keyframes_fall_back_without_ffprobe(self):
+        with mock.patch.object(
+            video_processing, "FFPROBE_BINARY", os.path.join(self.directory, "no-ffprobe")
+        ):
+            self.assertIsNone(_keyframe_timestamps(self.mp4))
+            indices = self.indices(self.mp4, "keyframes")
+
+        self.assertEqual(indices, list(range(SECONDS * FPS)))
+
+    def test_keyframes_fall_back_when_none_are_listed(self):
+        with ffprobe_output("0.000000,__\n0.033333,__\n"):
+            indices = self.indices(self.mp4, "keyframes")
+
+        self.assertEqual(indices, list(range(SECONDS * FPS)))
+
+    def test_raw_h264_falls_back_to_sequential_decoding(self):
+        if shutil.which(FFMPEG_BINARY) is None:
+            self.skipTest("needs ffmpeg to write raw H.264")
+        raw = generate_video(
+            os.path.join(self.directory, "clip.h264"), seconds=SECONDS, width=320, height=240, fps=FPS
+        )
+        cap = cv2.VideoCapture(raw)
+        self.addCleanup(cap.release)
+
+        self.assertFalse(_can_seek(cap))
+        for mode in ("sampled", "keyframes"):
+            with self.subTest(mode), ffprobe_output("0.000000,K_\n1.000000,K_\n"):
+                self.assertEqual(self.indices(raw, mode), list(range(SECONDS * FPS)))
+
+    def test_mp4_can_seek(self):
+        cap = cv2.VideoCapture(self.mp4)
+        self.addCleanup(cap.release)
+
+        self.assertTrue(_can_seek(cap))
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+from django.test import SimpleTestCase
+
+from benchmarks.media import generate_video
+from video_processing.utils.focus_metrics import get_focus_metric
+from video_processing.utils.video_processing import select_least_blurry_frame
+
+FPS = 30
+
+
+def full_resolution_score(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return float(get_focus_metric("laplacian")(np.stack([gray]))[0])
+
+
+class DownscaledFrameSelectionTests(SimpleTestCase):
+    """
+    Scoring on a 480px downscale must pick a frame as sharp as scoring at
+    full resolution did. The fixture clips are blurred for the first 70% of
+    every second, so several sharp frames score close to each other.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def select(self, path, score_width):
+        return select_least_blurry_frame(
+            path,
+            frame_stride=1,
+            time_budget=None,
+            good_enough=None,
+            score_width=score_width,
+            decode_mode="full",
+        )
+
+    def check_resolution(self, width, height):
+        path = generate_video(
+            os.path.join(self.directory, f"clip-{width}.mp4"),
+            seconds=1,
+            width=width,
+            height=height,
+            fps=FPS,
+        )
+        full = self.select(path, score_width=0)
+        downscaled = self.select(path, score_width=480)
+
+        self.assertGreaterEqual(downscaled.best_index % FPS, 0.7 * FPS - 1)
+        self.assertGreaterEqual(
+            full_resolution_score(downscaled.best_frame), 0.9 * full.best_score
+        )
+
+    def test_matches_full_resolution_choice_at_720p(self):
+        self.check_resolution(1280, 720)
+
+    def test_matches_full_resolution_choice_at_1080p(self):
+        self.check_resolution(1920, 1080)
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future
+from unittest import mock
+
+import cv2
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from video_processing import views
+from video_processing.utils import upload_handlers
+from video_processing.utils.image_utils import EncodedImage
+
+
+def jpeg_bytes():
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    frame[:, 32:] = 255
+    return cv2.imencode(".jpg", frame)[1].tobytes()
+
+
+class FrameUploadTests(SimpleTestCase):
+    """
+    A Pi that picked its sharpest frame ("rpi-frame") uploads that JPEG in
+    the "image" field, and frame selection uses it as is.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # save_image_file writes under "uploads" in the working directory.
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory)
+        for patcher in (
+            mock.patch.object(upload_handlers, "INCREMENTAL_UPLOADS", False),
+            mock.patch.object(
+                views, "respond_to_upload", return_value=HttpResponse("spoken answer")
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.jpeg = jpeg_bytes()
+
+    def upload(self, **files):
+        request = RequestFactory().post(
+            "/",
+            files,
+            HTTP_X_TOKEN="board",
+            HTTP_X_DEVICE_TYPE="rpi-frame",
+            HTTP_X_AUDIO_FORMAT="wav",
+        )
+        return views.unified_upload_video(request)
+
+    def test_passes_the_uploaded_frame_on_as_the_best_frame(self):
+        response = self.upload(
+            image=SimpleUploadedFile("frame.jpg", self.jpeg, "image/jpeg"),
+            audio=SimpleUploadedFile("recording.wav", b"RIFFdata", "audio/wav"),
+        )
+
+        self.assertEqual(response.content, b"spoken answer")
+        (board_token, image_path, audio_path, *_), kwargs = views.respond_to_upload.call_args
+        self.assertEqual(board_token, "board")
+        with open(image_path, "rb") as image_file:
+            self.assertEqual(image_file.read(), self.jpeg)
+        self.assertTrue(audio_path.endswith(".wav"))
+        frame = kwargs["frame_future"].result(timeout=0)
+        self.assertEqual(frame.data, self.jpeg)
+        self.assertEqual((frame.width, frame.height), (64, 48))
+
+    def test_requires_the_image(self):
+        response = self.upload(
+            video=SimpleUploadedFile("clip.mp4", b"video", "video/mp4"),
+            audio=SimpleUploadedFile("recording.wav", b"RIFFdata", "audio/wav"),
+        )
+
+        self.assertEqual(response.status_code, 400)
+        views.respond_to_upload.assert_not_called()
+
+
+class SaveMediaFileTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.directory)
+        self.logger = mock.Mock()
+
+    def test_frame_upload_resolves_the_frame(self):
+        jpeg = jpeg_bytes()
+        uploaded = SimpleUploadedFile("frame.jpg", jpeg, "image/jpeg")
+
+        path, frame_future = views.save_media_file(
+            RequestFactory().post("/"), "rpi-frame", uploaded, "board", self.logger, 0
+        )
+
+        self.assertEqual(path, os.path.join("uploads", "frame-board.jpg"))
+        self.assertTrue(frame_future.done())
+        self.assertEqual(frame_future.result().data, jpeg)
+
+    def test_video_upload_passes_on_the_frame_scored_during_the_upload(self):
+        request = RequestFactory().post("/")
+        request.frame_future = Future()
+        path = os.path.join(self.directory, "video.mp4")
+
+        with mock.patch.object(views, "save_video_file", return_value=path):
+            saved_path, frame_future = views.save_media_file(
+                request, "rpi", mock.Mock(), "board", self.logger, 0
+            )
+
+        self.assertEqual(saved_path, path)
+        self.assertIs(frame_future, request.frame_future)
+
+    def test_preselected_frame_skips_frame_selection(self):
+        path = os.path.join(self.directory, "frame.jpg")
+        with open(path, "wb") as image_file:
+            image_file.write(jpeg_bytes())
+        transcript_future = Future()
+        transcript_future.set_result("what is this")
+
+        with mock.patch(
+            "video_processing.utils.extract_least_blurry_image",
+            side_effect=AssertionError("the video was decoded"),
+        ):
+            frame, transcript = views.select_frame_and_transcribe(
+                path,
+                "recording.wav",
+                self.logger,
+                0,
+                frame_future=views.preselected_frame(path),
+                transcript_future=transcript_future,
+            )
+
+        self.assertIsInstance(frame, EncodedImage)
+        self.assertEqual(frame.data, jpeg_bytes())
+        self.assertEqual(transcript, "what is this")
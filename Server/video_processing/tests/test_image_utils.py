@@ -0,0 +1,135 @@
+import base64
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+from django.test import SimpleTestCase
+
+from video_processing.utils.image_utils import MIN_EDGE, EncodedImage, fit_to_budget
+
+QUALITIES = [90, 80, 70, 60, 50]
+
+
+def textured_frame(width=640, height=480):
+    """
+    Fine noise, so every quality step and every shrink changes the JPEG size.
+    """
+    rng = np.random.default_rng(0)
+    return cv2.GaussianBlur(rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8), (0, 0), 1)
+
+
+def jpeg(frame, quality):
+    return EncodedImage.from_frame(frame, "image/jpeg", [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+
+def shrink(frame, width):
+    height = round(frame.shape[0] * width / frame.shape[1])
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class FitToBudgetTests(SimpleTestCase):
+    def setUp(self):
+        self.frame = textured_frame()
+        self.image = jpeg(self.frame, 95)
+
+    def test_returns_an_image_within_budget_untouched(self):
+        fitted = fit_to_budget(self.image, max_edge=640, max_bytes=self.image.size, qualities=QUALITIES)
+
+        self.assertIs(fitted, self.image)
+
+    def test_no_limits_leave_the_image_untouched(self):
+        self.assertIs(fit_to_budget(self.image, max_edge=0, max_bytes=0, qualities=QUALITIES), self.image)
+
+    def test_shrinks_to_the_longest_edge_at_the_best_quality(self):
+        fitted = fit_to_budget(self.image, max_edge=320, max_bytes=0, qualities=QUALITIES)
+
+        self.assertEqual((fitted.width, fitted.height), (320, 240))
+        self.assertEqual(fitted.data, jpeg(shrink(self.frame, 320), 90).data)
+
+    def test_walks_down_the_quality_ladder_until_it_fits(self):
+        sizes = [jpeg(self.frame, quality).size for quality in QUALITIES]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+
+        fitted = fit_to_budget(self.image, max_edge=0, max_bytes=sizes[2], qualities=QUALITIES)
+
+        self.assertEqual((fitted.width, fitted.height), (640, 480))
+        self.assertEqual(fitted.data, jpeg(self.frame, 70).data)
+
+    def test_shrinks_at_the_lowest_quality_until_it_fits(self):
+        budget = jpeg(self.frame, 50).size // 3
+
+        fitted = fit_to_budget(self.image, max_edge=0, max_bytes=budget, qualities=QUALITIES)
+
+        self.assertLessEqual(fitted.size, budget)
+        # Each step shrinks the longest side by a quarter: 640, 480, 360, 270...
+        edges = [640]
+        while edges[-1] > MIN_EDGE:
+            edges.append(max(MIN_EDGE, int(edges[-1] * 0.75)))
+        self.assertIn(fitted.width, edges[1:])
+        self.assertEqual(fitted.data, jpeg(shrink(self.frame, fitted.width), 50).data)
+        # The step before did not fit.
+        larger = edges[edges.index(fitted.width) - 1]
+        self.assertGreater(jpeg(shrink(self.frame, larger), 50).size, budget)
+
+    def test_stops_shrinking_at_the_minimum_edge(self):
+        fitted = fit_to_budget(self.image, max_edge=0, max_bytes=1, qualities=QUALITIES)
+
+        self.assertEqual(max(fitted.width, fitted.height), MIN_EDGE)
+        self.assertGreater(fitted.size, 1)
+
+
+class EncodedImageTests(SimpleTestCase):
+    def setUp(self):
+        self.frame = textured_frame(64, 48)
+        self.image = EncodedImage.from_frame(self.frame)
+
+    def test_caches_the_base64_form(self):
+        encoded = self.image.base64
+
+        self.assertEqual(encoded, base64.b64encode(self.image.data).decode("utf-8"))
+        self.assertIs(self.image.base64, encoded)
+
+    def test_writes_one_file_for_all_path_calls(self):
+        path = self.image.path()
+        self.addCleanup(self.image.cleanup)
+
+        self.assertIs(self.image.path(), path)
+        self.assertTrue(path.endswith(".jpg"))
+        with open(path, "rb") as image_file:
+            self.assertEqual(image_file.read(), self.image.data)
+
+    def test_cleanup_removes_the_file(self):
+        path = self.image.path()
+
+        self.image.cleanup()
+        self.image.cleanup()
+
+        self.assertFalse(os.path.exists(path))
+        new_path = self.image.path()
+        self.addCleanup(self.image.cleanup)
+        self.assertTrue(os.path.exists(new_path))
+
+    def test_cleanup_without_a_file_does_nothing(self):
+        self.image.cleanup()
+
+    def test_decodes_to_the_source_frame_without_decoding(self):
+        self.assertIs(self.image.decode(), self.frame)
+        self.assertEqual(self.image.decode(cv2.IMREAD_GRAYSCALE).shape, (48, 64))
+
+    def test_reads_dimensions_and_type_from_a_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "frame.png")
+        EncodedImage.from_frame(self.frame, "image/png").save(path)
+
+        image = EncodedImage.from_file(path)
+
+        self.assertEqual(image.content_type, "image/png")
+        self.assertEqual(image.extension, ".png")
+        self.assertEqual((image.width, image.height), (64, 48))
+
+    def test_rejects_unsupported_content_types(self):
+        with self.assertRaises(Exception):
+            EncodedImage.from_frame(self.frame, "image/gif")
@@ -0,0 +1,262 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from video_processing.utils import job_queue
+from video_processing.utils.job_queue import JobQueue, JobStore, QueueFull
+
+# Patching the queue's retry timer patches threading.Timer for everyone.
+Timer = threading.Timer
+
+
+def stored_jobs(store):
+    with store._lock:
+        return store._connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+class Recorder:
+    """
+    A job handler recording its calls, failing its first `failures` calls.
+    """
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self.threads = []
+
+    def __call__(self, payload, data):
+        self.calls.append((payload, data))
+        self.threads.append(threading.current_thread())
+        if len(self.calls) <= self.failures:
+            raise Exception("job failed")
+
+
+class Blocker:
+    """
+    A job handler that blocks until released, to keep the single worker busy.
+    """
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, payload, data):
+        self.started.set()
+        self.release.wait(5)
+
+
+class JobQueueTestCase(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "jobs.sqlite3")
+        # Retries are requeued without waiting out the backoff.
+        self.delays = []
+
+        def timer(delay, function, args):
+            self.delays.append(delay)
+            return Timer(0, function, args)
+
+        patcher = mock.patch.object(job_queue.threading, "Timer", side_effect=timer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_store(self, **kwargs):
+        store = JobStore(self.path, **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def make_queue(self, store=None, **kwargs):
+        queue = JobQueue(store, **kwargs)
+        self.addCleanup(queue.close, 5)
+        return queue
+
+
+class ReplayTests(JobQueueTestCase):
+    def test_replays_jobs_whose_lease_expired(self):
+        dead = self.make_store(lease=0.05)
+        dead.add("job", {"n": 1}, b"data", time.time())
+        time.sleep(0.1)
+        handler = Recorder()
+        store = self.make_store()
+
+        queue = self.make_queue(store, handlers={"job": handler})
+        queue.start()
+
+        self.assertTrue(queue.join(5))
+        self.assertEqual(handler.calls, [({"n": 1}, b"data")])
+        self.assertEqual(stored_jobs(store), 0)
+
+    def test_leaves_jobs_with_a_live_lease(self):
+        alive = self.make_store()
+        alive.add("job", {}, None, time.time())
+        handler = Recorder()
+
+        queue = self.make_queue(self.make_store(), handlers={"job": handler})
+        queue.start()
+
+        self.assertTrue(queue.join(5))
+        self.assertEqual(handler.calls, [])
+        self.assertEqual(stored_jobs(alive), 1)
+
+    def test_released_jobs_are_replayed_right_away(self):
+        closing = self.make_store()
+        closing.add("job", {}, None, time.time())
+        closing.release()
+        handler = Recorder()
+
+        queue = self.make_queue(self.make_store(), handlers={"job": handler})
+        queue.start()
+
+        self.assertTrue(queue.join(5))
+        self.assertEqual(len(handler.calls), 1)
+
+
+class RetryTests(JobQueueTestCase):
+    def test_retries_a_failing_job_until_it_succeeds(self):
+        handler = Recorder(failures=1)
+        store = self.make_store()
+        queue = self.make_queue(store, handlers={"job": handler}, max_attempts=3)
+
+        queue.submit("job", {})
+
+        self.assertTrue(queue.join(5))
+        self.assertEqual(len(handler.calls), 2)
+        self.assertEqual(self.delays, [0.5])
+        self.assertEqual(stored_jobs(store), 0)
+        self.assertEqual(queue.stats()["completed"], 1)
+        self.assertEqual(queue.stats()["retried"], 1)
+
+    def test_drops_a_job_after_its_last_attempt(self):
+        handler = Recorder(failures=10)
+        discarded = []
+        store = self.make_store()
+        queue = self.make_queue(
+            store,
+            handlers={"job": handler},
+            failure_handlers={"job": lambda payload, data: discarded.append(payload)},
+            max_attempts=3,
+        )
+
+        queue.submit("job", {"n": 1})
+
+        self.assertTrue(queue.join(5))
+        self.assertEqual(len(handler.calls), 3)
+        self.assertEqual(self.delays, [0.5, 1])
+        self.assertEqual(discarded, [{"n": 1}])
+        self.assertEqual(stored_jobs(store), 0)
+        self.assertEqual(queue.stats()["failed"], 1)
+
+
+class OverflowTests(JobQueueTestCase):
+    def fill(self, overflow, **kwargs):
+        """
+        A queue with its one worker busy and its one slot taken.
+        """
+        blocker = Blocker()
+        handler = Recorder()
+        queue = self.make_queue(
+            kwargs.pop("store", None),
+            workers=1,
+            max_pending=1,
+            overflow=overflow,
+            handlers={"block": blocker, "job": handler},
+            **kwargs,
+        )
+        queue.submit("block", {})
+        self.assertTrue(blocker.started.wait(5))
+        queue.submit("job", {"queued": True})
+        self.addCleanup(blocker.release.set)
+        return queue, blocker, handler
+
+    def test_block_waits_for_room(self):
+        queue, blocker, handler = self.fill("block", submit_timeout=5)
+        Timer(0.05, blocker.release.set).start()
+
+        queue.submit("job", {"queued": False})
+
+        self.assertTrue(queue.join(5))
+        self.assertEqual(len(handler.calls), 2)
+        self.assertNotIn(threading.current_thread(), handler.threads)
+        self.assertEqual(queue.stats()["inline"], 0)
+
+    def test_block_runs_the_job_inline_after_the_timeout(self):
+        queue, _, handler = self.fill("block", submit_timeout=0.05)
+
+        queue.submit("job", {"queued": False})
+
+        self.assertEqual(handler.calls, [({"queued": False}, None)])
+        self.assertEqual(handler.threads, [threading.current_thread()])
+        self.assertEqual(queue.stats()["inline"], 1)
+
+    def test_caller_runs_the_job_inline(self):
+        queue, _, handler = self.fill("caller")
+
+        queue.submit("job", {"queued": False})
+
+        self.assertEqual(handler.threads, [threading.current_thread()])
+        self.assertEqual(queue.stats()["inline"], 1)
+
+    def test_caller_stores_inline_jobs_while_they_run(self):
+        store = self.make_store()
+        queue, _, _ = self.fill("caller", store=store)
+        seen = []
+        queue.handlers["count"] = lambda payload, data: seen.append(stored_jobs(store))
+
+        queue.submit("count", {})
+
+        # The blocker, the queued job and the job running inline.
+        self.assertEqual(seen, [3])
+        self.assertEqual(stored_jobs(store), 2)
+
+    def test_reject_raises(self):
+        queue, _, handler = self.fill("reject")
+
+        with self.assertRaises(QueueFull):
+            queue.submit("job", {"queued": False})
+
+        self.assertEqual(handler.calls, [])
+        self.assertEqual(queue.stats()["rejected"], 1)
+
+
+class HandedOffWorkTests(JobQueueTestCase):
+    def test_settles_the_job_when_its_future_resolves(self):
+        future = Future()
+        store = self.make_store()
+        queue = self.make_queue(store, handlers={"job": lambda payload, data: future})
+
+        queue.submit("job", {})
+
+        self.assertFalse(queue.join(0.1))
+        self.assertEqual(stored_jobs(store), 1)
+        future.set_result("written")
+        self.assertTrue(queue.join(5))
+        self.assertEqual(stored_jobs(store), 0)
+        self.assertEqual(queue.stats()["completed"], 1)
+
+    def test_retries_the_job_when_its_future_fails(self):
+        futures = []
+
+        def handler(payload, data):
+            future = Future()
+            futures.append(future)
+            if len(futures) == 1:
+                future.set_exception(Exception("write dropped"))
+            else:
+                future.set_result("written")
+            return future
+
+        queue = self.make_queue(handlers={"job": handler}, max_attempts=2)
+
+        queue.submit("job", {})
+
+        self.assertTrue(queue.join(5))
+        self.assertEqual(len(futures), 2)
+        self.assertEqual(queue.stats()["retried"], 1)
+        self.assertEqual(queue.stats()["completed"], 1)
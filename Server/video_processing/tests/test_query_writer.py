@@ -0,0 +1,146 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from benchmarks.fake_firebase import FakeFirestore
+from video_processing.utils.firebase_utils import KnownBoards, QueryWriter
+
+
+class FailingFirestore(FakeFirestore):
+    """
+    A fake whose batch commits all fail.
+    """
+
+    def batch(self):
+        batch = super().batch()
+
+        def commit():
+            self.round_trip("commits")
+            raise Exception("Firestore unavailable")
+
+        batch.commit = commit
+        return batch
+
+
+def backoff_delays(sleep):
+    # time.sleep is patched for everyone; leave out the fake's zero latency.
+    return [call.args[0] for call in sleep.call_args_list if call.args[0]]
+
+
+def query_path(board_id, query_id):
+    return f"boards/{board_id}/queries/{query_id}"
+
+
+class QueryWriterTests(SimpleTestCase):
+    def make_writer(self, client, **kwargs):
+        kwargs.setdefault("batch_size", 3)
+        kwargs.setdefault("flush_interval", 60)
+        writer = QueryWriter(client=client, boards=KnownBoards(), **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def test_writes_full_batches_with_one_commit(self):
+        db = FakeFirestore()
+        writer = self.make_writer(db)
+
+        futures = [writer.enqueue("board", {"prompt": str(i)}) for i in range(6)]
+        query_ids = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual(db.counts["commits"], 2)
+        for i, query_id in enumerate(query_ids):
+            self.assertEqual(db.documents[query_path("board", query_id)], {"prompt": str(i)})
+
+    def test_flushes_a_partial_batch_after_the_interval(self):
+        db = FakeFirestore()
+        writer = self.make_writer(db, flush_interval=0.05)
+
+        query_id = writer.enqueue("board", {"prompt": "hi"}).result(timeout=5)
+
+        self.assertEqual(db.counts["commits"], 1)
+        self.assertIn(query_path("board", query_id), db.documents)
+
+    def test_keeps_the_given_query_id(self):
+        db = FakeFirestore()
+        writer = self.make_writer(db, batch_size=1)
+
+        self.assertEqual(writer.enqueue("board", {}, "q1").result(timeout=5), "q1")
+        writer.enqueue("board", {"again": True}, "q1").result(timeout=5)
+
+        self.assertEqual(db.documents[query_path("board", "q1")], {"again": True})
+
+    def test_looks_up_unknown_boards_once_per_batch(self):
+        db = FakeFirestore()
+        db.write("boards/existing", {"created_at": "earlier"})
+        writer = self.make_writer(db)
+
+        futures = [
+            writer.enqueue("existing", {}),
+            writer.enqueue("new", {}),
+            writer.enqueue("new", {}),
+        ]
+        for future in futures:
+            future.result(timeout=5)
+
+        # One get_all for both boards, and the new board created in the
+        # same commit as its queries.
+        self.assertEqual(db.counts["reads"], 2)
+        self.assertEqual(db.counts["commits"], 1)
+        self.assertEqual(db.documents["boards/existing"], {"created_at": "earlier"})
+        self.assertIn("boards/new", db.documents)
+        self.assertIn("existing", writer.boards)
+        self.assertIn("new", writer.boards)
+
+    def test_does_not_look_up_known_boards_again(self):
+        db = FakeFirestore()
+        writer = self.make_writer(db, batch_size=1)
+
+        writer.enqueue("board", {}).result(timeout=5)
+        writer.enqueue("board", {}).result(timeout=5)
+
+        self.assertEqual(db.counts["reads"], 1)
+        self.assertEqual(db.counts["commits"], 2)
+
+    def test_retries_then_drops_a_failing_batch(self):
+        db = FailingFirestore()
+        writer = self.make_writer(db, batch_size=1, max_retries=2)
+
+        # Without waiting out the backoff between attempts.
+        with mock.patch("video_processing.utils.firebase_utils.time.sleep") as sleep:
+            futures = [writer.enqueue("board", {}), writer.enqueue("other", {})]
+            for future in futures:
+                with self.assertRaisesMessage(Exception, "Firestore unavailable"):
+                    future.result(timeout=5)
+        self.assertEqual(db.counts["commits"], 6)
+        # Backs off between attempts, not after the last one.
+        self.assertEqual(backoff_delays(sleep), [0.5, 1] * 2)
+        self.assertFalse(any("/queries/" in path for path in db.documents))
+        self.assertNotIn("board", writer.boards)
+
+    def test_caps_the_backoff(self):
+        db = FailingFirestore()
+        writer = self.make_writer(db, batch_size=1, max_retries=6)
+
+        with mock.patch("video_processing.utils.firebase_utils.time.sleep") as sleep:
+            with self.assertRaises(Exception):
+                writer.enqueue("board", {}).result(timeout=5)
+
+        self.assertEqual(backoff_delays(sleep), [0.5, 1, 2, 4, 8, 10])
+
+    def test_writes_right_away_once_closed(self):
+        db = FakeFirestore()
+        writer = self.make_writer(db)
+        writer.close()
+
+        future = writer.enqueue("board", {})
+
+        self.assertTrue(future.done())
+        self.assertIn(query_path("board", future.result()), db.documents)
+
+    def test_close_flushes_what_is_left(self):
+        db = FakeFirestore()
+        writer = self.make_writer(db)
+        future = writer.enqueue("board", {})
+
+        writer.close()
+
+        self.assertIn(query_path("board", future.result(timeout=0)), db.documents)
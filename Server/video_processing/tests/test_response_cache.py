@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from video_processing.utils.image_utils import EncodedImage
+from video_processing.utils.response_cache import (
+    DiskCacheBackend,
+    MemoryCacheBackend,
+    VisionCache,
+)
+
+
+def gradient_frame(offset=0):
+    row = np.arange(128, dtype=np.uint16)
+    frame = (row[None, :] + row[:, None] + offset) % 256
+    return EncodedImage.from_frame(np.stack([frame.astype(np.uint8)] * 3, axis=-1))
+
+
+class VisionCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = VisionCache(MemoryCacheBackend(ttl=60, max_bytes=1024 * 1024))
+
+    def store(self, image, transcript, board_token):
+        answer, image_hash = self.cache.get(image, transcript, "model", board_token)
+        self.assertIsNone(answer)
+        self.cache.set(image_hash, transcript, "model", "a cup", board_token)
+
+    def test_reuses_the_answer_for_the_same_board(self):
+        self.store(gradient_frame(), "What is this?", "board-a")
+
+        answer, _ = self.cache.get(gradient_frame(1), "what is this", "model", "board-a")
+
+        self.assertEqual(answer, "a cup")
+
+    def test_does_not_share_answers_between_boards(self):
+        self.store(gradient_frame(), "What is this?", "board-a")
+
+        answer, _ = self.cache.get(gradient_frame(), "What is this?", "model", "board-b")
+
+        self.assertIsNone(answer)
+
+    def test_forgets_hashes_the_backend_evicts(self):
+        # Room for one answer only.
+        self.cache = VisionCache(MemoryCacheBackend(ttl=60, max_bytes=len("a cup")))
+        self.store(gradient_frame(), "What is this?", "board-a")
+        self.store(gradient_frame(), "What is this?", "board-b")
+
+        answer, _ = self.cache.get(gradient_frame(), "What is this?", "model", "board-b")
+
+        self.assertEqual(answer, "a cup")
+        self.assertEqual(len(self.cache._index), 1)
+
+    def test_forgets_hashes_that_expired(self):
+        self.cache = VisionCache(MemoryCacheBackend(ttl=-1, max_bytes=1024))
+        self.store(gradient_frame(), "What is this?", "board-a")
+
+        answer, _ = self.cache.get(gradient_frame(), "What is this?", "model", "board-a")
+
+        self.assertIsNone(answer)
+        self.assertEqual(self.cache._index, {})
+
+
+class DiskCacheBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_ignores_leftover_temporary_files(self):
+        with open(os.path.join(self.directory, "entry"), "wb") as entry:
+            entry.write(b"12345")
+        with open(os.path.join(self.directory, "interrupted.tmp"), "wb") as leftover:
+            leftover.write(b"x" * 100)
+
+        backend = DiskCacheBackend(self.directory, ttl=60, max_bytes=10)
+        backend.set("other", b"12345")
+
+        self.assertEqual(backend._size, 10)
+        self.assertEqual(sorted(backend.keys()), ["entry", "other"])
+
+    def test_reports_evicted_keys(self):
+        backend = DiskCacheBackend(self.directory, ttl=60, max_bytes=10)
+        evicted = []
+        backend.on_evict = evicted.append
+        backend.set("first", b"12345")
+        # Last read long ago.
+        first = os.path.join(self.directory, "first")
+        os.utime(first, (0, os.stat(first).st_mtime))
+
+        backend.set("second", b"123456")
+
+        self.assertEqual(evicted, ["first"])
+        self.assertEqual(backend.keys(), ["second"])
@@ -0,0 +1,71 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from video_processing.utils.speech_pipeline import AsyncSpeechPipeline, SpeechPipeline
+
+
+def failing_stream():
+    yield "The first sentence is long enough. "
+    raise RuntimeError("vision failed")
+
+
+async def failing_stream_async():
+    yield "The first sentence is long enough. "
+    raise RuntimeError("vision failed")
+
+
+async def synthesize_async(sentence):
+    yield sentence.encode()
+
+
+class SpeechPipelineTests(SimpleTestCase):
+    def test_passes_the_text_to_on_complete(self):
+        completed, errors = [], []
+        speech = SpeechPipeline(
+            iter(["The first sentence is long enough. ", "And a second one."]),
+            lambda sentence: [sentence.encode()],
+            on_complete=completed.append,
+            on_error=errors.append,
+        )
+
+        audio = b"".join(speech)
+
+        self.assertEqual(audio, b"The first sentence is long enough.And a second one.")
+        self.assertEqual(completed, ["The first sentence is long enough. And a second one."])
+        self.assertEqual(errors, [])
+
+    def test_passes_a_failed_stream_to_on_error(self):
+        completed, errors = [], []
+        speech = SpeechPipeline(
+            failing_stream(),
+            lambda sentence: [sentence.encode()],
+            on_complete=completed.append,
+            on_error=errors.append,
+        )
+
+        with self.assertRaises(RuntimeError):
+            b"".join(speech)
+        speech._producer.join()
+
+        self.assertEqual(completed, [])
+        self.assertEqual([str(error) for error in errors], ["vision failed"])
+
+    def test_async_passes_a_failed_stream_to_on_error(self):
+        completed, errors = [], []
+
+        async def consume():
+            speech = AsyncSpeechPipeline(
+                failing_stream_async(),
+                synthesize_async,
+                on_complete=completed.append,
+                on_error=errors.append,
+            )
+            async for _ in speech:
+                pass
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(consume())
+
+        self.assertEqual(completed, [])
+        self.assertEqual([str(error) for error in errors], ["vision failed"])
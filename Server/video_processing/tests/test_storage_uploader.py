@@ -0,0 +1,132 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase
+
+from benchmarks.fake_firebase import FakeBucket
+from video_processing.utils.image_utils import EncodedImage
+from video_processing.utils.storage_uploader import StorageUploader
+
+
+def image(data=b"jpeg bytes"):
+    return EncodedImage(data, "image/jpeg")
+
+
+class SlowBucket(FakeBucket):
+    """
+    A bucket whose uploads take a while, recording how many run at once.
+    """
+
+    def __init__(self, seconds=0.05):
+        super().__init__()
+        self.seconds = seconds
+        self.running = 0
+        self.max_running = 0
+        self._running_lock = threading.Lock()
+
+    def upload(self, *args, **kwargs):
+        with self._running_lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.seconds)
+            super().upload(*args, **kwargs)
+        finally:
+            with self._running_lock:
+                self.running -= 1
+
+
+class StorageUploaderTests(SimpleTestCase):
+    def test_names_objects_after_their_content(self):
+        bucket = FakeBucket()
+        uploader = StorageUploader(bucket=bucket)
+
+        url = uploader.upload(image(), "board")
+
+        name = f"boards/board/{hashlib.sha256(b'jpeg bytes').hexdigest()[:32]}.jpg"
+        self.assertEqual(url, bucket.blob(name).public_url)
+        self.assertEqual(bucket.objects, {name: b"jpeg bytes"})
+
+    def test_uploads_the_same_image_once(self):
+        bucket = FakeBucket()
+        uploader = StorageUploader(bucket=bucket)
+
+        urls = {uploader.upload(image(), "board") for _ in range(3)}
+
+        self.assertEqual(len(urls), 1)
+        self.assertEqual(bucket.counts["uploads"], 1)
+        self.assertEqual(uploader.stats.as_dict()["deduplicated"], 2)
+
+    def test_concurrent_uploads_of_the_same_image_wait_for_the_first(self):
+        bucket = SlowBucket()
+        uploader = StorageUploader(bucket=bucket)
+
+        with ThreadPoolExecutor(4) as pool:
+            urls = set(pool.map(lambda _: uploader.upload(image(), "board"), range(4)))
+
+        self.assertEqual(len(urls), 1)
+        self.assertEqual(bucket.counts["requests"], 1)
+
+    def test_treats_an_existing_object_as_uploaded(self):
+        bucket = FakeBucket()
+        StorageUploader(bucket=bucket).upload(image(), "board")
+        # Another process, which has not seen the upload.
+        uploader = StorageUploader(bucket=bucket)
+
+        url = uploader.upload(image(), "board")
+
+        self.assertEqual(bucket.counts["precondition_failures"], 1)
+        self.assertEqual(bucket.counts["uploads"], 1)
+        self.assertEqual(url, bucket.blob(next(iter(bucket.objects))).public_url)
+        self.assertEqual(uploader.stats.as_dict()["failures"], 0)
+
+    def test_acl_mode_makes_the_upload_public(self):
+        bucket = FakeBucket()
+
+        StorageUploader(bucket=bucket, public_mode="acl").upload(image(), "board")
+
+        self.assertEqual(bucket.public, set(bucket.objects))
+        self.assertEqual(bucket.counts["requests"], 1)
+
+    def test_make_public_mode_makes_it_public_with_a_second_request(self):
+        bucket = FakeBucket()
+
+        StorageUploader(bucket=bucket, public_mode="make_public").upload(image(), "board")
+
+        self.assertEqual(bucket.public, set(bucket.objects))
+        self.assertEqual(bucket.counts["requests"], 2)
+
+    def test_none_mode_leaves_access_to_the_bucket(self):
+        bucket = FakeBucket()
+
+        StorageUploader(bucket=bucket, public_mode="none").upload(image(), "board")
+
+        self.assertEqual(bucket.public, set())
+
+    def test_rejects_unknown_public_modes(self):
+        with self.assertRaises(Exception):
+            StorageUploader(bucket=FakeBucket(), public_mode="signed")
+
+    def test_caps_concurrent_uploads(self):
+        bucket = SlowBucket()
+        uploader = StorageUploader(bucket=bucket, slots=2)
+
+        with ThreadPoolExecutor(6) as pool:
+            list(pool.map(lambda i: uploader.upload(image(bytes([i])), "board"), range(6)))
+
+        self.assertEqual(bucket.counts["uploads"], 6)
+        self.assertEqual(bucket.max_running, 2)
+
+    def test_forgets_the_oldest_names(self):
+        bucket = FakeBucket()
+        uploader = StorageUploader(bucket=bucket, known_objects=1)
+        uploader.upload(image(b"first"), "board")
+        uploader.upload(image(b"second"), "board")
+
+        uploader.upload(image(b"first"), "board")
+
+        # Forgotten, so the bucket's precondition catches the duplicate.
+        self.assertEqual(bucket.counts["precondition_failures"], 1)
+        self.assertEqual(bucket.counts["uploads"], 2)
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.uploadhandler import StopFutureHandlers, StopUpload
+from django.test import RequestFactory, SimpleTestCase
+
+from video_processing.utils import upload_handlers
+from video_processing.utils.upload_handlers import (
+    IncrementalUploadHandler,
+    WriteOnceUploadHandler,
+    install_upload_handlers,
+)
+
+
+def feed(handler, field_name, file_name, chunks, content_length=None):
+    """
+    Drive a handler the way Django's multipart parser does.
+    """
+    try:
+        handler.new_file(field_name, file_name, "application/octet-stream", content_length)
+    except StopFutureHandlers:
+        pass
+    passed_on = []
+    start = 0
+    for chunk in chunks:
+        passed_on.append(handler.receive_data_chunk(chunk, start))
+        start += len(chunk)
+    return handler.file_complete(start), passed_on
+
+
+class FakeScorer:
+    def __init__(self):
+        self.data = b""
+
+    def feed(self, raw_data):
+        self.data += raw_data
+
+    def finish(self):
+        return self.data
+
+    def abort(self):
+        pass
+
+
+class WriteOnceUploadHandlerTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        fields = {
+            "video": (os.path.join(self.directory, "uploads"), "video", ".mp4", 16),
+            "audio": (os.path.join(self.directory, "audio"), "audio", ".wav", 16),
+        }
+        patcher = mock.patch.dict(upload_handlers.STORED_UPLOAD_FIELDS, fields)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def handler(self, **headers):
+        request = RequestFactory().post("/", HTTP_X_TOKEN="board", **headers)
+        return WriteOnceUploadHandler(request), request
+
+    def test_writes_the_part_once_with_its_digest(self):
+        handler, _ = self.handler()
+
+        uploaded, passed_on = feed(handler, "video", "clip.mp4", [b"abcd", b"efgh"])
+        self.addCleanup(uploaded.close)
+
+        self.assertEqual(passed_on, [None, None])
+        self.assertEqual(uploaded.size, 8)
+        self.assertEqual(uploaded.sha256, hashlib.sha256(b"abcdefgh").hexdigest())
+        with open(uploaded.temporary_file_path(), "rb") as stored:
+            self.assertEqual(stored.read(), b"abcdefgh")
+
+    def test_names_the_file_after_the_board_and_audio_format(self):
+        handler, _ = self.handler(HTTP_X_AUDIO_FORMAT="flac")
+
+        uploaded, _ = feed(handler, "audio", "recording.flac", [b"fLaC"])
+        self.addCleanup(uploaded.close)
+
+        path = uploaded.temporary_file_path()
+        self.assertEqual(os.path.dirname(path), os.path.join(self.directory, "audio"))
+        self.assertRegex(os.path.basename(path), r"^audio-board-[0-9a-f]{8}\.flac$")
+
+    def test_stops_a_part_growing_past_its_limit(self):
+        handler, request = self.handler()
+
+        with self.assertRaises(StopUpload):
+            feed(handler, "video", "clip.mp4", [b"a" * 10, b"b" * 10])
+
+        self.assertEqual(request.upload_error, "video exceeds 16 bytes")
+        self.assertEqual(os.listdir(os.path.join(self.directory, "uploads")), [])
+
+    def test_rejects_a_declared_length_over_the_limit(self):
+        handler, request = self.handler()
+
+        with self.assertRaises(StopUpload):
+            feed(handler, "video", "clip.mp4", [], content_length=17)
+
+        self.assertEqual(request.upload_error, "video exceeds 16 bytes")
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "uploads")))
+
+    def test_leaves_other_fields_to_the_next_handler(self):
+        handler, _ = self.handler()
+
+        uploaded, passed_on = feed(handler, "notes", "notes.txt", [b"hello"])
+
+        self.assertIsNone(uploaded)
+        self.assertEqual(passed_on, [b"hello"])
+
+    def test_removes_the_partial_file_when_interrupted(self):
+        handler, _ = self.handler()
+        try:
+            handler.new_file("video", "clip.mp4", "video/mp4", None)
+        except StopFutureHandlers:
+            pass
+        handler.receive_data_chunk(b"abcd", 0)
+
+        handler.upload_interrupted()
+
+        self.assertEqual(os.listdir(os.path.join(self.directory, "uploads")), [])
+
+
+class IncrementalUploadHandlerTests(SimpleTestCase):
+    def setUp(self):
+        self.request = RequestFactory().post("/")
+        self.handler = IncrementalUploadHandler(self.request)
+
+    def test_scores_the_video_while_passing_it_on(self):
+        with mock.patch("video_processing.utils.video_processing.StreamingFrameScorer", FakeScorer):
+            _, passed_on = feed(self.handler, "video", "clip.mp4", [b"abcd", b"efgh"])
+
+        self.assertEqual(passed_on, [b"abcd", b"efgh"])
+        self.assertEqual(self.request.frame_future.result(timeout=5), b"abcdefgh")
+
+    def test_transcribes_the_buffered_audio(self):
+        with mock.patch(
+            "video_processing.utils.api_services.convert_speech_to_text",
+            lambda audio: (audio.name, audio.read()),
+        ):
+            _, passed_on = feed(self.handler, "audio", "recording.wav", [b"RIFF", b"data"])
+            transcript = self.request.transcript_future.result(timeout=5)
+
+        self.assertEqual(passed_on, [b"RIFF", b"data"])
+        self.assertEqual(transcript, ("audio.wav", b"RIFFdata"))
+
+    def test_names_the_audio_after_the_announced_format(self):
+        request = RequestFactory().post("/", HTTP_X_AUDIO_FORMAT="flac")
+        handler = IncrementalUploadHandler(request)
+
+        with mock.patch(
+            "video_processing.utils.api_services.convert_speech_to_text",
+            lambda audio: audio.name,
+        ):
+            feed(handler, "audio", "recording.wav", [b"fLaC"])
+            name = request.transcript_future.result(timeout=5)
+
+        self.assertEqual(name, "audio.flac")
+
+    def test_falls_back_when_the_scorer_is_unavailable(self):
+        with mock.patch(
+            "video_processing.utils.video_processing.StreamingFrameScorer",
+            side_effect=RuntimeError("no decoder"),
+        ):
+            _, passed_on = feed(self.handler, "video", "clip.mp4", [b"abcd"])
+
+        self.assertEqual(passed_on, [b"abcd"])
+        self.assertFalse(hasattr(self.request, "frame_future"))
+
+    def test_falls_back_when_the_audio_is_too_large(self):
+        with mock.patch.object(upload_handlers, "INCREMENTAL_AUDIO_MAX_BYTES", 6):
+            _, passed_on = feed(self.handler, "audio", "recording.wav", [b"RIFF", b"data"])
+
+        self.assertEqual(passed_on, [b"RIFF", b"data"])
+        self.assertFalse(hasattr(self.request, "transcript_future"))
+
+
+class InstallUploadHandlersTests(SimpleTestCase):
+    def test_writes_once_without_incremental_processing(self):
+        request = RequestFactory().post("/")
+
+        with mock.patch.object(upload_handlers, "INCREMENTAL_UPLOADS", False):
+            install_upload_handlers(request)
+
+        self.assertIsInstance(request.upload_handlers[0], WriteOnceUploadHandler)
+        self.assertFalse(
+            any(isinstance(handler, IncrementalUploadHandler) for handler in request.upload_handlers)
+        )
+
+    def test_processes_incrementally_in_front_when_enabled(self):
+        request = RequestFactory().post("/")
+
+        with mock.patch.object(upload_handlers, "INCREMENTAL_UPLOADS", True):
+            install_upload_handlers(request)
+
+        self.assertIsInstance(request.upload_handlers[0], IncrementalUploadHandler)
+        self.assertIsInstance(request.upload_handlers[1], WriteOnceUploadHandler)
@@ -0,0 +1,106 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+
+from video_processing.utils.upload_sessions import (
+    OffsetMismatch,
+    SessionError,
+    UploadSessionStore,
+)
+
+
+def digest(data):
+    return {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+
+class UploadSessionTests(SimpleTestCase):
+    def setUp(self):
+        # Finished parts are moved to directories relative to the working directory.
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+        self.store = UploadSessionStore("sessions")
+        self.session = self.store.create("board", "rpi-frame", "flac")
+
+    def append(self, part, data, offset=0):
+        return self.session.append(part, offset, io.BytesIO(data), len(data))
+
+    def test_appends_chunks_at_the_stored_offset(self):
+        self.assertEqual(self.append("audio", b"abc"), 3)
+        self.assertEqual(self.append("audio", b"de", offset=3), 5)
+
+        with self.assertRaises(OffsetMismatch) as raised:
+            self.append("audio", b"de", offset=3)
+        self.assertEqual(raised.exception.offset, 5)
+        self.assertEqual(self.session.offsets(), {"image": 0, "audio": 5})
+
+    def test_finish_moves_matching_parts(self):
+        self.append("image", b"jpeg")
+        self.append("audio", b"flac")
+
+        paths = self.session.finish({"image": digest(b"jpeg"), "audio": digest(b"flac")})
+
+        self.assertTrue(paths["audio"].endswith(".flac"))
+        with open(paths["image"], "rb") as image_file:
+            self.assertEqual(image_file.read(), b"jpeg")
+        self.assertIsNone(self.store.get(self.session.id, "board"))
+
+    def test_finish_requires_every_size(self):
+        self.append("image", b"jpeg")
+        self.append("audio", b"flac")
+
+        with self.assertRaisesMessage(SessionError, "final size of audio"):
+            self.session.finish({"image": digest(b"jpeg")})
+
+    def test_finish_rejects_a_short_part(self):
+        self.append("image", b"jpeg")
+        self.append("audio", b"fl")
+
+        with self.assertRaises(SessionError) as raised:
+            self.session.finish({"image": digest(b"jpeg"), "audio": digest(b"flac")})
+        self.assertEqual(raised.exception.status, 409)
+        # Nothing was moved, the client may still upload the rest.
+        self.assertEqual(self.session.offsets(), {"image": 4, "audio": 2})
+
+    def test_finish_rejects_a_wrong_sha256(self):
+        self.append("image", b"jpeg")
+        self.append("audio", b"flac")
+
+        with self.assertRaises(SessionError) as raised:
+            self.session.finish({"image": digest(b"jpeg"), "audio": digest(b"FLAC")})
+        self.assertEqual(raised.exception.status, 409)
+
+    def test_finish_runs_once(self):
+        self.append("image", b"jpeg")
+        self.append("audio", b"flac")
+        expected = {"image": digest(b"jpeg"), "audio": digest(b"flac")}
+        results = []
+
+        def complete():
+            try:
+                results.append(self.session.finish(expected))
+            except SessionError as e:
+                results.append(e.status)
+
+        threads = [threading.Thread(target=complete) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sum(isinstance(result, dict) for result in results), 1)
+        self.assertEqual(results.count(404), 3)
+
+    def test_append_after_finish_is_rejected(self):
+        self.append("image", b"jpeg")
+        self.append("audio", b"flac")
+        self.session.finish({"image": digest(b"jpeg"), "audio": digest(b"flac")})
+
+        with self.assertRaises(SessionError) as raised:
+            self.append("audio", b"more", offset=4)
+        self.assertEqual(raised.exception.status, 404)
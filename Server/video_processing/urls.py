@@ -3,4 +3,26 @@ from . import views
 
 urlpatterns = [
     path("upload/", views.unified_upload_video, name="upload_video"),
+    path("upload/async/", views.unified_upload_video_async, name="upload_video_async"),
+    path(
+        "upload/sessions/",
+        views.create_upload_session,
+        name="create_upload_session",
+    ),
+    path(
+        "upload/sessions/<str:session_id>/",
+        views.upload_session_status,
+        name="upload_session_status",
+    ),
+    path(
+        "upload/sessions/<str:session_id>/parts/<str:part>/",
+        views.upload_session_part,
+        name="upload_session_part",
+    ),
+    path(
+        "upload/sessions/<str:session_id>/complete/",
+        views.complete_upload_session,
+        name="complete_upload_session",
+    ),
+    path("metrics/", views.metrics, name="metrics"),
 ]
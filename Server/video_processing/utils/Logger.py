@@ -1,8 +1,86 @@
+import atexit
+import contextvars
+import hashlib
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import queue
+import random
 import time
 
+# Logging configuration. With LOG_ASYNC=1 records are handed to a queue and
+# written by a dedicated thread, so request threads never wait on the disk
+# or on log rotation. LOG_FORMAT is "text" or "json" (one object per line).
+# LOG_LEVEL sets the minimum level, and LOG_DEBUG_SAMPLE_RATE keeps only that
+# fraction of debug lines.
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG").upper()
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1"))
+
+# Context attached to every record logged from the current request, see Logger.bind.
+_log_context = contextvars.ContextVar("log_context", default={})
+
+
+class _ContextFilter(logging.Filter):
+    """
+    Copy the caller's log context onto the record before it changes threads.
+    """
+
+    def filter(self, record):
+        record.context = _log_context.get()
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    A QueueHandler that leaves formatting to the writer thread.
+
+    The default QueueHandler formats every record on the calling thread; the
+    records stay in this process, so they can be queued as they are.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def _record_fields(record):
+    fields = dict(getattr(record, "context", None) or {})
+    fields.update(getattr(record, "fields", None) or {})
+    return fields
+
+
+class _TextFormatter(logging.Formatter):
+    """
+    The classic text format, followed by the record's context and fields.
+    """
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _record_fields(record)
+        if fields:
+            line += " [" + " ".join(f"{key}={value}" for key, value in fields.items()) + "]"
+        return line
+
+
+class _JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line with the time, level, message, context and fields.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_record_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
 
 class SingletonMeta(type):
     """
@@ -40,6 +118,10 @@ class Logger(metaclass=SingletonMeta):
     - Initialize once, then use throughout the application without needing to pass the logger object.
     - Automatically falls back to a default log filename based on the current timestamp if none is provided.
 
+    Records are written by a background thread unless LOG_ASYNC=0, and can
+    carry structured fields, which the JSON format (LOG_FORMAT=json) emits as
+    keys and the text format appends in brackets.
+
     Initialisation Examples:
     1. Log to console:
         Logger().info("Starting yAR...")
@@ -47,17 +129,21 @@ class Logger(metaclass=SingletonMeta):
         Logger(log_to_file=True, filename="yar.log").info("Starting yAR...")
     3. Log to file with a default filename:
         Logger(log_to_file=True).info("Starting yAR...")
+    4. Log with structured fields:
+        Logger().info("Transcript made", stage="stt", duration=0.42)
     """
 
     def __init__(self, log_to_file=False, filename=None):
         if not hasattr(self, "initialized"):  # Prevents reinitialization
             self.logger = logging.getLogger(__name__)
             self.log_to_file = log_to_file
-            self.filename = (
-                filename if filename is not None else self._default_filename()
-            )
+            self.filename = filename
+            self.listener = None
             self.setup_logger()
             self.initialized = True
+            atexit.register(self.close)
+            if hasattr(os, "register_at_fork"):
+                os.register_at_fork(after_in_child=self._after_fork)
 
     def _default_filename(self):
         """
@@ -74,33 +160,93 @@ class Logger(metaclass=SingletonMeta):
         """
         Configures the logger to log to either the console or a file, with automatic
         file rotation. The log messages include timestamps in the Apache format.
+
+        With LOG_ASYNC enabled the handler is driven by a QueueListener thread
+        and the logger itself only enqueues records.
         """
         if self.log_to_file:
+            if self.filename is None:
+                self.filename = self._default_filename()
             handler = RotatingFileHandler(
                 self.filename, maxBytes=5000000, backupCount=5
             )
         else:
             handler = logging.StreamHandler()
 
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-            datefmt="[%d/%b/%Y:%H:%M:%S]",
-        )
+        if LOG_FORMAT == "json":
+            formatter = _JsonFormatter()
+        else:
+            formatter = _TextFormatter(
+                "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                datefmt="[%d/%b/%Y:%H:%M:%S]",
+            )
         handler.setFormatter(formatter)
+
+        # Replace any previous output, e.g. the one inherited over a fork.
+        self.close()
+        for previous in list(self.logger.handlers):
+            self.logger.removeHandler(previous)
+
+        if LOG_ASYNC:
+            self.listener = QueueListener(queue.SimpleQueue(), handler)
+            self.listener.start()
+            handler = _DeferredQueueHandler(self.listener.queue)
+        handler.addFilter(_ContextFilter())
         self.logger.addHandler(handler)
-        self.logger.setLevel(logging.DEBUG)
+        self.logger.setLevel(LOG_LEVEL)
+
+    def close(self):
+        """
+        Write out queued records and stop the writer thread, if any.
+        """
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _after_fork(self):
+        # The writer thread is not copied into a forked worker, e.g. when the
+        # app was warmed up before forking; give the worker its own.
+        if self.listener is not None:
+            self.listener = None
+            self.setup_logger()
+
+    def bind(self, request_id=None, board_token=None, **context):
+        """
+        Attach context to every record logged from the current request.
+
+        The context lives in a context variable, so it follows the request's
+        thread or asyncio task, and is copied into the executor threads, speech
+        pipeline threads and jobs the request starts. The board token is
+        logged as a short hash.
+
+        Args:
+            request_id (str): ID of the request.
+            board_token (str): The board token, hashed before logging.
+            **context: Any other fields to attach.
+        """
+        if request_id is not None:
+            context["request_id"] = request_id
+        if board_token is not None:
+            context["board"] = hashlib.sha256(board_token.encode("utf-8")).hexdigest()[:12]
+        _log_context.set(context)
+
+    def _log(self, level, message, fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, extra={"fields": fields} if fields else None)
 
-    def debug(self, message):
-        self.logger.debug(message)
+    def debug(self, message, **fields):
+        if LOG_DEBUG_SAMPLE_RATE < 1 and random.random() >= LOG_DEBUG_SAMPLE_RATE:
+            return
+        self._log(logging.DEBUG, message, fields)
 
-    def info(self, message):
-        self.logger.info(message)
+    def info(self, message, **fields):
+        self._log(logging.INFO, message, fields)
 
-    def warning(self, message):
-        self.logger.warning(message)
+    def warning(self, message, **fields):
+        self._log(logging.WARNING, message, fields)
 
-    def error(self, message):
-        self.logger.error(message)
+    def error(self, message, **fields):
+        self._log(logging.ERROR, message, fields)
 
-    def critical(self, message):
-        self.logger.critical(message)
+    def critical(self, message, **fields):
+        self._log(logging.CRITICAL, message, fields)
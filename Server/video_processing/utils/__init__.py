@@ -1,30 +1,132 @@
 # utils/__init__.py
 
-# Re-exporting functions from various modules
-from .file_handling import save_video_file, save_audio_file
-from .video_processing import extract_and_find_least_blurry_frame, extract_audio
-from .api_services import convert_speech_to_text, convert_text_to_speech, image_to_text
-from .firebase_utils import (
-    upload_image_to_storage,
-    board_exists,
-    create_board,
-    add_query_to_board,
-)
-from .time_utils import get_time
+import importlib
+
+# Re-exporting functions from various modules. The modules are imported on
+# first access, so importing the package does not pull in OpenCV, the
+# provider SDKs or Firebase until something actually uses them.
+_EXPORTS = {
+    "save_video_file": "file_handling",
+    "save_audio_file": "file_handling",
+    "save_image_file": "file_handling",
+    "extract_and_find_least_blurry_frame": "video_processing",
+    "extract_least_blurry_image": "video_processing",
+    "extract_audio": "video_processing",
+    "open_audio_stream": "video_processing",
+    "EncodedImage": "image_utils",
+    "fit_to_budget": "image_utils",
+    "convert_speech_to_text": "api_services",
+    "convert_text_to_speech": "api_services",
+    "image_to_text": "api_services",
+    "convert_speech_to_text_async": "api_services",
+    "convert_text_to_speech_async": "api_services",
+    "image_to_text_async": "api_services",
+    "stream_image_to_text": "api_services",
+    "stream_image_to_text_async": "api_services",
+    "close_clients": "api_services",
+    "cache_stats": "response_cache",
+    "STREAM_SPEECH": "speech_pipeline",
+    "SpeechPipeline": "speech_pipeline",
+    "AsyncSpeechPipeline": "speech_pipeline",
+    "get_executor": "executors",
+    "run_in_executor": "executors",
+    "get_io_executor": "executors",
+    "run_in_io_executor": "executors",
+    "upload_image_to_storage": "firebase_utils",
+    "board_exists": "firebase_utils",
+    "create_board": "firebase_utils",
+    "add_query_to_board": "firebase_utils",
+    "queue_query_for_board": "firebase_utils",
+    "generate_query_id": "firebase_utils",
+    "storage_stats": "storage_uploader",
+    "register_job": "job_queue",
+    "get_job_queue": "job_queue",
+    "job_queue_stats": "job_queue",
+    "QueueFull": "job_queue",
+    "observe": "metrics",
+    "span": "metrics",
+    "timed": "metrics",
+    "render_metrics": "metrics",
+    "stage_stats": "metrics",
+    "get_time": "time_utils",
+    "install_upload_handlers": "upload_handlers",
+    "AUDIO_UPLOAD_FORMATS": "upload_handlers",
+    "audio_upload_format": "upload_handlers",
+    "audio_upload_extension": "upload_handlers",
+    "warm_up": "warmup",
+    "get_session_store": "upload_sessions",
+    "SessionError": "upload_sessions",
+    "OffsetMismatch": "upload_sessions",
+    "UPLOAD_CHUNK_MAX_BYTES": "upload_sessions",
+}
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    # Cache it, so later lookups skip this function.
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
 
 
 # You can also use __all__ to specify what gets imported with 'from utils import *'
 __all__ = [
     "save_video_file",
     "save_audio_file",
+    "save_image_file",
     "extract_and_find_least_blurry_frame",
+    "extract_least_blurry_image",
+    "EncodedImage",
+    "fit_to_budget",
     "convert_speech_to_text",
     "convert_text_to_speech",
     "image_to_text",
+    "convert_speech_to_text_async",
+    "convert_text_to_speech_async",
+    "image_to_text_async",
+    "close_clients",
+    "stream_image_to_text",
+    "stream_image_to_text_async",
+    "cache_stats",
+    "STREAM_SPEECH",
+    "SpeechPipeline",
+    "AsyncSpeechPipeline",
+    "get_executor",
+    "run_in_executor",
+    "get_io_executor",
+    "run_in_io_executor",
     "upload_image_to_storage",
+    "storage_stats",
     "board_exists",
     "create_board",
     "add_query_to_board",
+    "queue_query_for_board",
+    "generate_query_id",
+    "register_job",
+    "get_job_queue",
+    "job_queue_stats",
+    "QueueFull",
+    "observe",
+    "span",
+    "timed",
+    "render_metrics",
+    "stage_stats",
     "get_time",
+    "install_upload_handlers",
+    "AUDIO_UPLOAD_FORMATS",
+    "audio_upload_format",
+    "audio_upload_extension",
+    "warm_up",
+    "get_session_store",
+    "SessionError",
+    "OffsetMismatch",
+    "UPLOAD_CHUNK_MAX_BYTES",
     "extract_audio",
+    "open_audio_stream",
 ]
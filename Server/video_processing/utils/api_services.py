@@ -1,19 +1,208 @@
+import asyncio
+import contextlib
 import os
+import threading
+import weakref
 import requests
-import anthropic
-import base64
+import httpx
 import json
+from requests.adapters import HTTPAdapter
+
+from .executors import run_in_executor, run_in_io_executor
+from .image_utils import EncodedImage
+from .metrics import timed, timed_stream
+from .response_cache import get_speech_cache, get_vision_cache
 
 # Load API keys from environment variables
 openai_api_key = os.getenv("OPENAI_API_KEY")
 anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
 
+# OPENAI_BASE_URL can point at a compatible server, e.g. the local stand-in
+# used by the load tests. The Anthropic SDK reads ANTHROPIC_BASE_URL itself.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+OPENAI_TRANSLATIONS_URL = f"{OPENAI_BASE_URL}/audio/translations"
+OPENAI_SPEECH_URL = f"{OPENAI_BASE_URL}/audio/speech"
+
+# Outbound connection pooling. HTTP_POOL_SIZE is the number of connections
+# kept per provider host, HTTP_KEEPALIVE_EXPIRY how long an idle connection
+# is kept open, HTTP_CONNECT_TIMEOUT and HTTP_TIMEOUT the connect and overall
+# read timeouts in seconds, and HTTP2=1 enables HTTP/2 for the httpx clients
+# (Anthropic and the async OpenAI calls) when the h2 package is installed.
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP2 = os.getenv("HTTP2", "0") == "1"
+
+VISION_SYSTEM_PROMPT = "The user is visually impaired and is seeking assistance to gain environmental awareness through this query. Using the details provided in the image and the user's prompt, generate a response that is helpful, relevant, and respectful of privacy. Maintain the language and tone of the user's prompt, and ensure the response is assistive in nature. The cost of not providing a useful response could be significant, so prioritize accuracy and utility. Be concise when required, and provide additional context when necessary. RESPOND ONLY IN ENGLISH"
+
+# Content types sent to Whisper for the audio formats the server produces or receives
+AUDIO_CONTENT_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".ogg": "audio/ogg",
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+}
+
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+def _http2_available():
+    """
+    Whether HTTP/2 is requested and the h2 package httpx needs for it is installed.
+    """
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _httpx_options():
+    """
+    Keyword arguments shared by every httpx client in the registry.
+    """
+    return {
+        "timeout": httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=HTTP_POOL_SIZE,
+            max_keepalive_connections=HTTP_POOL_SIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "http2": _http2_available(),
+    }
+
+def _get_or_create(name, factory):
+    """
+    Return the process-wide client registered under a name, creating it once.
+    """
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+def _new_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_http_session():
+    """
+    Get the shared requests.Session used by the sync OpenAI calls.
+
+    Its connection pool keeps connections to each host alive between
+    requests and is safe to use from any thread.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    return _get_or_create("http_session", _new_http_session)
+
+def get_anthropic_client():
+    """
+    Get the shared Anthropic client used by `image_to_text`.
+
+    Returns:
+        anthropic.Anthropic: The shared client, backed by a pooled httpx.Client.
+    """
+    # The SDK is only imported once a client is needed; it is one of the
+    # slowest imports of the app.
+    import anthropic
+
+    return _get_or_create(
+        "anthropic",
+        lambda: anthropic.Anthropic(
+            api_key=anthropic_api_key, http_client=httpx.Client(**_httpx_options())
+        ),
+    )
+
+def _async_clients_for_loop():
+    """
+    Get the async clients bound to the running event loop.
+
+    httpx.AsyncClient connections belong to the loop they were opened on, so
+    each loop gets its own clients. Under an ASGI server there is one loop
+    per process, so this is effectively process-wide.
+    """
+    import anthropic
+
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.get(loop)
+        if clients is None:
+            http_client = httpx.AsyncClient(**_httpx_options())
+            clients = _async_clients[loop] = {
+                "http": http_client,
+                "anthropic": anthropic.AsyncAnthropic(
+                    api_key=anthropic_api_key,
+                    http_client=httpx.AsyncClient(**_httpx_options()),
+                ),
+            }
+    return clients
+
+def get_async_http_client():
+    """
+    Get the pooled httpx.AsyncClient for the running event loop.
+
+    Returns:
+        httpx.AsyncClient: The shared async client.
+    """
+    return _async_clients_for_loop()["http"]
+
+def get_async_anthropic_client():
+    """
+    Get the pooled Anthropic async client for the running event loop.
+
+    Returns:
+        anthropic.AsyncAnthropic: The shared async client.
+    """
+    return _async_clients_for_loop()["anthropic"]
+
+def close_clients():
+    """
+    Close the shared sync clients, e.g. on worker shutdown.
+
+    Async clients are dropped along with their event loop.
+    """
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+def _audio_upload(audio_file):
+    """
+    Build the (filename, file object, content type) tuple for a Whisper upload.
+
+    Args:
+        audio_file (str or file-like): Path to the audio file, or an open
+            file-like object with a `name` attribute such as an AudioStream.
+
+    Returns:
+        tuple: The multipart file tuple.
+    """
+    if isinstance(audio_file, str):
+        filename, file_obj = os.path.basename(audio_file), open(audio_file, "rb")
+    else:
+        filename, file_obj = os.path.basename(str(audio_file.name)), audio_file
+    extension = os.path.splitext(filename)[1].lower()
+    return filename, file_obj, AUDIO_CONTENT_TYPES.get(extension, "audio/mpeg")
+
+@timed("stt")
 def convert_speech_to_text(audio_file_path, model="whisper-1"):
     """
     Convert speech in an audio file to text using OpenAI's Whisper model.
 
     Args:
-        audio_file_path (str): Path to the audio file.
+        audio_file_path (str or file-like): Path to the audio file, or a
+            file-like object such as the AudioStream from open_audio_stream.
         model (str): The model to use for speech recognition. Default is "whisper-1".
 
     Returns:
@@ -25,13 +214,20 @@ def convert_speech_to_text(audio_file_path, model="whisper-1"):
     headers = {
         "Authorization": f"Bearer {openai_api_key}",
     }
+    filename, audio_file, content_type = _audio_upload(audio_file_path)
     files = {
-        "file": ("openai.mp3", open(audio_file_path, "rb"), "audio/mpeg"),
+        "file": (filename, audio_file, content_type),
         "model": (None, model),
     }
-    response = requests.post(
-        "https://api.openai.com/v1/audio/translations", headers=headers, files=files
-    )
+    try:
+        response = get_http_session().post(
+            OPENAI_TRANSLATIONS_URL,
+            headers=headers,
+            files=files,
+            timeout=(HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT),
+        )
+    finally:
+        audio_file.close()
     if response.status_code == 200:
         response_data = response.json()
         transcript = response_data["text"]
@@ -39,16 +235,15 @@ def convert_speech_to_text(audio_file_path, model="whisper-1"):
     else:
         raise Exception(f"Error: {response.status_code} - {response.text}")
 
-def convert_text_to_speech(input_text, board_token, model="tts-1", voice="alloy", directory="response"):
+@timed_stream("tts_first_byte", "tts_complete")
+def convert_text_to_speech(input_text, model="tts-1", voice="alloy"):
     """
     Convert text to speech using OpenAI's Text-to-Speech model.
 
     Args:
         input_text (str): The text to convert to speech.
-        board_token (str): A unique identifier for the board.
         model (str): The TTS model to use. Default is "tts-1".
         voice (str): The voice to use. Default is "alloy".
-        directory (str): The directory to save the audio file. Default is "response".
 
     Yields:
         bytes: Chunks of the audio file.
@@ -56,35 +251,49 @@ def convert_text_to_speech(input_text, board_token, model="tts-1", voice="alloy"
     Raises:
         Exception: If the API request fails.
     """
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    output_file = os.path.join(directory, f"response-{board_token}.mp3")
+    cached_audio = get_speech_cache().get(input_text, voice, model)
+    if cached_audio is not None:
+        yield from _chunked(cached_audio)
+        return
+
     headers = {
         "Authorization": f"Bearer {openai_api_key}",
         "Content-Type": "application/json",
     }
     payload = {"model": model, "input": input_text, "voice": voice, "language": "en"}
-    response = requests.post(
-        "https://api.openai.com/v1/audio/speech",
+    response = get_http_session().post(
+        OPENAI_SPEECH_URL,
         headers=headers,
         json=payload,
         stream=True,
+        timeout=(HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT),
     )
-    if response.status_code == 200:
-        for chunk in response.iter_content(chunk_size=1024):
-            yield chunk
-    else:
-        raise Exception(f"Error: {response.status_code} - {response.text}")
+    try:
+        if response.status_code == 200:
+            audio = bytearray()
+            for chunk in response.iter_content(chunk_size=1024):
+                audio += chunk
+                yield chunk
+            get_speech_cache().set(input_text, voice, model, bytes(audio))
+        else:
+            raise Exception(f"Error: {response.status_code} - {response.text}")
+    finally:
+        # Hand the connection back to the pool even if the client went away
+        response.close()
 
-def image_to_text(image_path, prompt, model="claude-3-haiku-20240307", max_tokens=250):
+@timed("vision")
+def image_to_text(
+    image, prompt, model="claude-3-haiku-20240307", max_tokens=250, board_token=None
+):
     """
     Convert an image to descriptive text using Anthropic's Claude model.
 
     Args:
-        image_path (str): Path to the image file.
+        image (EncodedImage or str): The encoded image, or a path to an image file.
         prompt (str): The user's prompt or question about the image.
         model (str): The Claude model to use. Default is "claude-3-haiku-20240307".
         max_tokens (int): Maximum number of tokens in the response. Default is 250.
+        board_token (str): The board asking. Cached answers are only reused for the same board.
 
     Returns:
         str: The generated text description of the image.
@@ -92,32 +301,274 @@ def image_to_text(image_path, prompt, model="claude-3-haiku-20240307", max_token
     Raises:
         Exception: If the API request fails.
     """
-    client = anthropic.Client(api_key=anthropic_api_key)
-    with open(image_path, "rb") as image_file:
-        base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-    
+    if not isinstance(image, EncodedImage):
+        image = EncodedImage.from_file(image)
+    cached_response, image_hash = get_vision_cache().get(image, prompt, model, board_token)
+    if cached_response is not None:
+        return cached_response
+    client = get_anthropic_client()
+
     message = client.messages.create(
         model=model,
         max_tokens=max_tokens,
-        system="The user is visually impaired and is seeking assistance to gain environmental awareness through this query. Using the details provided in the image and the user's prompt, generate a response that is helpful, relevant, and respectful of privacy. Maintain the language and tone of the user's prompt, and ensure the response is assistive in nature. The cost of not providing a useful response could be significant, so prioritize accuracy and utility. Be concise when required, and provide additional context when necessary. RESPOND ONLY IN ENGLISH",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/jpeg",
-                            "data": base64_image,
-                        },
-                    },
-                    {"type": "text", "text": prompt},
-                ],
-            }
-        ],
+        system=VISION_SYSTEM_PROMPT,
+        messages=_vision_messages(image, prompt),
     )
     message = message.json()
     message = json.loads(message)
     text_response = message["content"][0]["text"]
-    return text_response
\ No newline at end of file
+    get_vision_cache().set(image_hash, prompt, model, text_response, board_token)
+    return text_response
+
+@timed_stream(complete_stage="vision")
+def stream_image_to_text(
+    image, prompt, model="claude-3-haiku-20240307", max_tokens=250, board_token=None
+):
+    """
+    Stream the description of an image from Anthropic's Claude model.
+
+    Args:
+        image (EncodedImage or str): The encoded image, or a path to an image file.
+        prompt (str): The user's prompt or question about the image.
+        model (str): The Claude model to use. Default is "claude-3-haiku-20240307".
+        max_tokens (int): Maximum number of tokens in the response. Default is 250.
+        board_token (str): The board asking. Cached answers are only reused for the same board.
+
+    Yields:
+        str: Text deltas of the response as they are generated.
+
+    Raises:
+        Exception: If the API request fails.
+    """
+    if not isinstance(image, EncodedImage):
+        image = EncodedImage.from_file(image)
+    cached_response, image_hash = get_vision_cache().get(image, prompt, model, board_token)
+    if cached_response is not None:
+        yield cached_response
+        return
+    client = get_anthropic_client()
+
+    parts = []
+    with client.messages.stream(
+        model=model,
+        max_tokens=max_tokens,
+        system=VISION_SYSTEM_PROMPT,
+        messages=_vision_messages(image, prompt),
+    ) as stream:
+        for text in stream.text_stream:
+            parts.append(text)
+            yield text
+    get_vision_cache().set(image_hash, prompt, model, "".join(parts), board_token)
+
+def _chunked(data, chunk_size=1024):
+    """
+    Yield bytes in chunks, the way a streamed response would.
+    """
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+def _vision_messages(image, prompt):
+    """
+    Build the Claude messages for a question about an image.
+
+    Args:
+        image (EncodedImage): The encoded image.
+        prompt (str): The user's prompt or question about the image.
+
+    Returns:
+        list: The messages payload.
+    """
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": image.content_type,
+                        "data": image.base64,
+                    },
+                },
+                {"type": "text", "text": prompt},
+            ],
+        }
+    ]
+
+@contextlib.asynccontextmanager
+async def _async_http_client(client=None):
+    """
+    Use the given httpx.AsyncClient, or the pooled one for the running loop.
+    """
+    yield client if client is not None else get_async_http_client()
+
+def _read_audio_upload(audio_file_path):
+    """
+    Read an audio file into memory as a (filename, bytes, content type) tuple.
+    """
+    filename, audio_file, content_type = _audio_upload(audio_file_path)
+    try:
+        return filename, audio_file.read(), content_type
+    finally:
+        audio_file.close()
+
+@timed("stt")
+async def convert_speech_to_text_async(audio_file_path, model="whisper-1", client=None):
+    """
+    Async version of `convert_speech_to_text`.
+
+    The audio is read in the shared I/O executor and posted with httpx, so the
+    event loop is free while Whisper works.
+
+    Args:
+        audio_file_path (str or file-like): Path to the audio file, or a file-like object.
+        model (str): The model to use for speech recognition. Default is "whisper-1".
+        client (httpx.AsyncClient): Optional client to send the request with.
+
+    Returns:
+        str: The transcribed text.
+
+    Raises:
+        Exception: If the API request fails.
+    """
+    headers = {
+        "Authorization": f"Bearer {openai_api_key}",
+    }
+    audio_upload = await run_in_io_executor(_read_audio_upload, audio_file_path)
+    async with _async_http_client(client) as http:
+        response = await http.post(
+            OPENAI_TRANSLATIONS_URL,
+            headers=headers,
+            files={"file": audio_upload},
+            data={"model": model},
+        )
+    if response.status_code == 200:
+        return response.json()["text"]
+    else:
+        raise Exception(f"Error: {response.status_code} - {response.text}")
+
+@timed_stream("tts_first_byte", "tts_complete")
+async def convert_text_to_speech_async(input_text, model="tts-1", voice="alloy", client=None):
+    """
+    Async version of `convert_text_to_speech`, streaming audio as it arrives.
+
+    Args:
+        input_text (str): The text to convert to speech.
+        model (str): The TTS model to use. Default is "tts-1".
+        voice (str): The voice to use. Default is "alloy".
+        client (httpx.AsyncClient): Optional client to send the request with.
+
+    Yields:
+        bytes: Chunks of the audio file.
+
+    Raises:
+        Exception: If the API request fails.
+    """
+    headers = {
+        "Authorization": f"Bearer {openai_api_key}",
+        "Content-Type": "application/json",
+    }
+    cached_audio = get_speech_cache().get(input_text, voice, model)
+    if cached_audio is not None:
+        for chunk in _chunked(cached_audio):
+            yield chunk
+        return
+
+    payload = {"model": model, "input": input_text, "voice": voice, "language": "en"}
+    async with _async_http_client(client) as http:
+        async with http.stream(
+            "POST", OPENAI_SPEECH_URL, headers=headers, json=payload
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise Exception(f"Error: {response.status_code} - {response.text}")
+            audio = bytearray()
+            async for chunk in response.aiter_bytes(chunk_size=1024):
+                audio += chunk
+                yield chunk
+    get_speech_cache().set(input_text, voice, model, bytes(audio))
+
+@timed("vision")
+async def image_to_text_async(
+    image, prompt, model="claude-3-haiku-20240307", max_tokens=250, board_token=None
+):
+    """
+    Async version of `image_to_text`.
+
+    Args:
+        image (EncodedImage or str): The encoded image, or a path to an image file.
+        prompt (str): The user's prompt or question about the image.
+        model (str): The Claude model to use. Default is "claude-3-haiku-20240307".
+        max_tokens (int): Maximum number of tokens in the response. Default is 250.
+        board_token (str): The board asking. Cached answers are only reused for the same board.
+
+    Returns:
+        str: The generated text description of the image.
+
+    Raises:
+        Exception: If the API request fails.
+    """
+    if not isinstance(image, EncodedImage):
+        image = await run_in_executor(EncodedImage.from_file, image)
+    cached_response, image_hash = await run_in_executor(
+        get_vision_cache().get, image, prompt, model, board_token
+    )
+    if cached_response is not None:
+        return cached_response
+    client = get_async_anthropic_client()
+
+    message = await client.messages.create(
+        model=model,
+        max_tokens=max_tokens,
+        system=VISION_SYSTEM_PROMPT,
+        messages=_vision_messages(image, prompt),
+    )
+    text_response = message.content[0].text
+    await run_in_executor(
+        get_vision_cache().set, image_hash, prompt, model, text_response, board_token
+    )
+    return text_response
+
+@timed_stream(complete_stage="vision")
+async def stream_image_to_text_async(
+    image, prompt, model="claude-3-haiku-20240307", max_tokens=250, board_token=None
+):
+    """
+    Async version of `stream_image_to_text`.
+
+    Args:
+        image (EncodedImage or str): The encoded image, or a path to an image file.
+        prompt (str): The user's prompt or question about the image.
+        model (str): The Claude model to use. Default is "claude-3-haiku-20240307".
+        max_tokens (int): Maximum number of tokens in the response. Default is 250.
+        board_token (str): The board asking. Cached answers are only reused for the same board.
+
+    Yields:
+        str: Text deltas of the response as they are generated.
+
+    Raises:
+        Exception: If the API request fails.
+    """
+    if not isinstance(image, EncodedImage):
+        image = await run_in_executor(EncodedImage.from_file, image)
+    cached_response, image_hash = await run_in_executor(
+        get_vision_cache().get, image, prompt, model, board_token
+    )
+    if cached_response is not None:
+        yield cached_response
+        return
+    client = get_async_anthropic_client()
+
+    parts = []
+    async with client.messages.stream(
+        model=model,
+        max_tokens=max_tokens,
+        system=VISION_SYSTEM_PROMPT,
+        messages=_vision_messages(image, prompt),
+    ) as stream:
+        async for text in stream.text_stream:
+            parts.append(text)
+            yield text
+    await run_in_executor(
+        get_vision_cache().set, image_hash, prompt, model, "".join(parts), board_token
+    )
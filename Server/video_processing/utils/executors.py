@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of threads shared by the CPU-bound stages (frame selection, audio
+# extraction, image resizing) of every request in this process.
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 4)))
+# Number of threads for blocking I/O (saving uploads, queueing jobs) of every
+# request in this process, kept apart so waiting on the disk or a full queue
+# never holds up a CPU-bound stage.
+IO_WORKERS = int(os.getenv("IO_WORKERS", "32"))
+
+_executor = None
+_io_executor = None
+_executor_lock = threading.Lock()
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    A ThreadPoolExecutor that runs each task in a copy of the submitter's
+    context, so context variables such as the request's log context follow
+    the work into the pool.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
+def get_executor():
+    """
+    Get the process-wide executor for CPU-bound stages, creating it on first use.
+
+    Returns:
+        ThreadPoolExecutor: The shared executor.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ContextThreadPoolExecutor(
+                    max_workers=CPU_WORKERS, thread_name_prefix="cpu-stage"
+                )
+    return _executor
+
+
+def get_io_executor():
+    """
+    Get the process-wide executor for blocking I/O, creating it on first use.
+
+    Returns:
+        ThreadPoolExecutor: The shared I/O executor.
+    """
+    global _io_executor
+    if _io_executor is None:
+        with _executor_lock:
+            if _io_executor is None:
+                _io_executor = ContextThreadPoolExecutor(
+                    max_workers=IO_WORKERS, thread_name_prefix="io"
+                )
+    return _io_executor
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """
+    Run a blocking function in the shared executor without blocking the event loop.
+
+    Args:
+        func (callable): The function to run.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        The function's return value.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+async def run_in_io_executor(func, *args, **kwargs):
+    """
+    Run a blocking I/O function in the shared I/O executor without blocking the event loop.
+
+    Args:
+        func (callable): The function to run.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        The function's return value.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_io_executor(), functools.partial(func, *args, **kwargs)
+    )
@@ -1,9 +1,14 @@
 import os
 
+from .metrics import span
+
 def save_video_file(video_file, board_token, directory="uploads"):
     """
     Save an uploaded video file to a specified directory.
 
+    Files already written to their final location by the WriteOnceUploadHandler
+    are not copied again; the handler times their "save" stage itself.
+
     Args:
         video_file (UploadedFile): The uploaded video file object.
         board_token (str): A unique identifier for the board, used in the filename.
@@ -12,42 +17,86 @@ def save_video_file(video_file, board_token, directory="uploads"):
     Returns:
         str: The path to the saved video file.
     """
-    # Create the directory if it doesn't exist
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    
-    # Generate the file path
-    video_file_path = os.path.join(directory, f"video-{board_token}.mp4")
-    
-    # Save the file
-    with open(video_file_path, "wb") as f:
-        for chunk in video_file.chunks():
-            f.write(chunk)
+    stored_path = getattr(video_file, "stored_path", None)
+    if stored_path:
+        return stored_path
+
+    with span("save"):
+        # Create the directory if it doesn't exist
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # Generate the file path
+        video_file_path = os.path.join(directory, f"video-{board_token}.mp4")
+
+        # Save the file
+        with open(video_file_path, "wb") as f:
+            for chunk in video_file.chunks():
+                f.write(chunk)
     
     return video_file_path
 
-def save_audio_file(uploaded_audio, board_token, directory="audio"):
+def save_audio_file(uploaded_audio, board_token, directory="audio", extension=".wav"):
     """
     Save an uploaded audio file to a specified directory.
 
+    Files already written to their final location by the WriteOnceUploadHandler
+    are not copied again; the handler times their "save" stage itself.
+
     Args:
         uploaded_audio (UploadedFile): The uploaded audio file object.
         board_token (str): A unique identifier for the board, used in the filename.
         directory (str): The directory to save the file. Defaults to "audio".
+        extension (str): Extension matching the audio format. Defaults to ".wav".
 
     Returns:
         str: The path to the saved audio file.
     """
-    # Create the directory if it doesn't exist
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    
-    # Generate the file path
-    audio_file_path = os.path.join(directory, f"audio-{board_token}.wav")
-    
-    # Save the file
-    with open(audio_file_path, "wb") as wf:
-        for chunk in uploaded_audio.chunks():
-            wf.write(chunk)
+    stored_path = getattr(uploaded_audio, "stored_path", None)
+    if stored_path:
+        return stored_path
+
+    with span("save"):
+        # Create the directory if it doesn't exist
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # Generate the file path
+        audio_file_path = os.path.join(directory, f"audio-{board_token}{extension}")
+
+        # Save the file
+        with open(audio_file_path, "wb") as wf:
+            for chunk in uploaded_audio.chunks():
+                wf.write(chunk)
     
-    return audio_file_path
\ No newline at end of file
+    return audio_file_path
+
+def save_image_file(uploaded_image, board_token, directory="uploads"):
+    """
+    Save an uploaded frame image to a specified directory.
+
+    Files already written to their final location by the WriteOnceUploadHandler
+    are not copied again; the handler times their "save" stage itself.
+
+    Args:
+        uploaded_image (UploadedFile): The uploaded JPEG image.
+        board_token (str): A unique identifier for the board, used in the filename.
+        directory (str): The directory to save the file. Defaults to "uploads".
+
+    Returns:
+        str: The path to the saved image file.
+    """
+    stored_path = getattr(uploaded_image, "stored_path", None)
+    if stored_path:
+        return stored_path
+
+    with span("save"):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        image_file_path = os.path.join(directory, f"frame-{board_token}.jpg")
+        with open(image_file_path, "wb") as image_file:
+            for chunk in uploaded_image.chunks():
+                image_file.write(chunk)
+
+    return image_file_path
@@ -1,28 +1,75 @@
-from uuid import uuid4
+from collections import OrderedDict
+import atexit
 import os
+import threading
 import time
 import random
 import string
-from ..config.firebase_config import db, storage, bucket, firestore
+from concurrent.futures import Future
+from ..config.firebase_config import get_db, server_timestamp
+from .storage_uploader import get_storage_uploader
+from .metrics import timed
+from .Logger import Logger
 
-def upload_image_to_storage(file_path, board_id):
+# Write-behind persistence of queries. With FIRESTORE_WRITE_BEHIND=1 queries
+# are queued and written with batched writes once FIRESTORE_BATCH_SIZE are
+# pending or FIRESTORE_FLUSH_INTERVAL seconds have passed, retrying failed
+# batches FIRESTORE_MAX_RETRIES times. Up to KNOWN_BOARDS_MAX board IDs known
+# to exist are remembered so they are not looked up again.
+FIRESTORE_WRITE_BEHIND = os.getenv("FIRESTORE_WRITE_BEHIND", "1") == "1"
+# Each query may need a board write too, and a batch holds at most 500 writes.
+FIRESTORE_BATCH_SIZE = min(int(os.getenv("FIRESTORE_BATCH_SIZE", "100")), 250)
+FIRESTORE_FLUSH_INTERVAL = float(os.getenv("FIRESTORE_FLUSH_INTERVAL", "2"))
+FIRESTORE_MAX_RETRIES = int(os.getenv("FIRESTORE_MAX_RETRIES", "3"))
+KNOWN_BOARDS_MAX = int(os.getenv("KNOWN_BOARDS_MAX", "10000"))
+
+
+class KnownBoards:
+    """
+    A bounded, thread-safe LRU set of board IDs known to exist in Firestore.
+
+    Args:
+        max_size (int): Maximum number of board IDs remembered.
+    """
+
+    def __init__(self, max_size=KNOWN_BOARDS_MAX):
+        self.max_size = max_size
+        self._boards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, board_id):
+        with self._lock:
+            if board_id in self._boards:
+                self._boards.move_to_end(board_id)
+                return True
+            return False
+
+    def add(self, board_id):
+        with self._lock:
+            self._boards[board_id] = True
+            self._boards.move_to_end(board_id)
+            while len(self._boards) > self.max_size:
+                self._boards.popitem(last=False)
+
+
+known_boards = KnownBoards()
+
+def upload_image_to_storage(image, board_id):
     """
     Upload an image to Firebase Storage.
 
+    Uploads go through the shared StorageUploader, which limits concurrent
+    uploads and names objects after their content, so uploading the same
+    image twice returns the existing object.
+
     Args:
-        file_path (str): Local path of the image file.
+        image (EncodedImage or str): The encoded image, or a local path of the image file.
         board_id (str): ID of the board associated with the image.
 
     Returns:
         str: Public URL of the uploaded image.
     """
-    original_filename = os.path.basename(file_path)
-    extension = os.path.splitext(original_filename)[1]
-    filename = f"{uuid4()}{extension}"
-    blob = bucket.blob(f"boards/{board_id}/{filename}")
-    blob.upload_from_filename(file_path, content_type="image/jpeg")
-    blob.make_public()
-    return blob.public_url
+    return get_storage_uploader().upload(image, board_id)
 
 def board_exists(board_id):
     """
@@ -34,7 +81,7 @@ def board_exists(board_id):
     Returns:
         bool: True if the board exists, False otherwise.
     """
-    board_ref = db.collection("boards").document(board_id)
+    board_ref = get_db().collection("boards").document(board_id)
     board_doc = board_ref.get()
     return board_doc.exists
 
@@ -46,12 +93,13 @@ def create_board(board_id):
         board_id (str): ID of the board to create.
     """
     board_data = {
-        "created_at": firestore.SERVER_TIMESTAMP,
+        "created_at": server_timestamp(),
     }
-    board_ref = db.collection("boards").document(board_id)
+    board_ref = get_db().collection("boards").document(board_id)
     board_ref.set(board_data)
 
-def add_query_to_board(board_id, query_data):
+@timed("firestore_write")
+def add_query_to_board(board_id, query_data, query_id=None):
     """
     Add a query to a board in Firestore.
 
@@ -60,13 +108,16 @@ def add_query_to_board(board_id, query_data):
     Args:
         board_id (str): ID of the board to add the query to.
         query_data (dict): Data of the query to add.
+        query_id (str): ID to store the query under. Generated if omitted.
     """
-    if not board_exists(board_id):
-        create_board(board_id)
-    
-    query_id = generate_query_id()
+    if board_id not in known_boards:
+        if not board_exists(board_id):
+            create_board(board_id)
+        known_boards.add(board_id)
+
+    query_id = query_id or generate_query_id()
     query_ref = (
-        db.collection("boards")
+        get_db().collection("boards")
         .document(board_id)
         .collection("queries")
         .document(query_id)
@@ -84,4 +135,202 @@ def generate_query_id():
     """
     timestamp = int(time.time())
     random_str = "".join(random.choices(string.ascii_lowercase + string.digits, k=6))
-    return f"{timestamp}_{random_str}"
\ No newline at end of file
+    return f"{timestamp}_{random_str}"
+
+
+class QueryWriter:
+    """
+    Queue query documents and write them to Firestore in batches.
+
+    Queries are given their ID when queued, so a retried batch overwrites
+    the same documents instead of duplicating them. When a batch is
+    written, all its boards missing from the known-board cache are looked up
+    with a single get_all. Boards that do not exist yet are created in the
+    same batch as the queries.
+
+    A background thread flushes the queue when `batch_size` queries are
+    pending or every `flush_interval` seconds. `close` flushes what is left
+    and is registered to run at interpreter exit; queries queued after that
+    are written right away.
+
+    Args:
+        client: Firestore client, or an in-memory fake with the same interface.
+            Defaults to the app's client.
+        batch_size (int): Number of queries per batched write.
+        flush_interval (float): Maximum seconds a query waits in the queue.
+        max_retries (int): Attempts after the first before a batch is dropped.
+        boards (KnownBoards): Cache of boards known to exist.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        batch_size=FIRESTORE_BATCH_SIZE,
+        flush_interval=FIRESTORE_FLUSH_INTERVAL,
+        max_retries=FIRESTORE_MAX_RETRIES,
+        boards=None,
+    ):
+        self._client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.boards = boards if boards is not None else known_boards
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else get_db()
+
+    def enqueue(self, board_id, query_data, query_id=None):
+        """
+        Queue a query to be added to a board.
+
+        Args:
+            board_id (str): ID of the board to add the query to.
+            query_data (dict): Data of the query to add.
+            query_id (str): ID to store the query under. Generated if omitted.
+
+        Returns:
+            Future: Resolves to the query's ID once its batch is committed, or
+            to the error its batch was dropped with.
+        """
+        query_id = query_id or generate_query_id()
+        future = Future()
+        entry = (board_id, query_id, query_data, future)
+        with self._condition:
+            closed = self._closed
+            if not closed:
+                self._pending.append(entry)
+        if closed:
+            self._write_with_retry([entry])
+            return future
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="firestore-writer", daemon=True
+                )
+                self._thread.start()
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+        return future
+
+    def pending(self):
+        """
+        int: Number of queries waiting to be written.
+        """
+        with self._condition:
+            return len(self._pending)
+
+    def _take_batch(self):
+        batch = self._pending[: self.batch_size]
+        del self._pending[: self.batch_size]
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._closed or len(self._pending) >= self.batch_size,
+                    timeout=self.flush_interval,
+                )
+                if self._closed:
+                    return
+                batch = self._take_batch()
+            if batch:
+                self._write_with_retry(batch)
+
+    def _write_with_retry(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._write(batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    Logger().error(
+                        f"Dropping {len(batch)} queries after {attempt + 1} attempts: {e}"
+                    )
+                    for _, _, _, future in batch:
+                        future.set_exception(e)
+                    return
+                time.sleep(min(0.5 * 2**attempt, 10))
+            else:
+                for _, query_id, _, future in batch:
+                    future.set_result(query_id)
+                return
+
+    @timed("firestore_write")
+    def _write(self, batch):
+        client = self.client
+        boards = client.collection("boards")
+        write = client.batch()
+
+        unknown_boards = {board_id for board_id, _, _, _ in batch if board_id not in self.boards}
+        if unknown_boards:
+            refs = [boards.document(board_id) for board_id in unknown_boards]
+            for snapshot in client.get_all(refs):
+                if not snapshot.exists:
+                    write.set(
+                        snapshot.reference, {"created_at": server_timestamp()}
+                    )
+
+        for board_id, query_id, query_data, _ in batch:
+            write.set(
+                boards.document(board_id).collection("queries").document(query_id),
+                query_data,
+            )
+        write.commit()
+
+        for board_id in unknown_boards:
+            self.boards.add(board_id)
+
+    def flush(self):
+        """
+        Write every pending query now, in the calling thread.
+        """
+        while True:
+            with self._condition:
+                batch = self._take_batch()
+            if not batch:
+                return
+            self._write_with_retry(batch)
+
+    def close(self):
+        """
+        Stop the background thread and flush what is left.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+
+query_writer = QueryWriter()
+atexit.register(query_writer.close)
+
+
+def queue_query_for_board(board_id, query_data, query_id=None):
+    """
+    Add a query to a board, in the background when write-behind is enabled.
+
+    Args:
+        board_id (str): ID of the board to add the query to.
+        query_data (dict): Data of the query to add.
+        query_id (str): ID to store the query under, so saving the same
+            query twice writes one document. Generated if omitted.
+
+    Returns:
+        Future: Resolves to the query's ID once it is written, or to the
+        error its batch was dropped with. Already resolved when write-behind
+        is disabled, in which case errors are raised right away.
+    """
+    if FIRESTORE_WRITE_BEHIND:
+        return query_writer.enqueue(board_id, query_data, query_id)
+    query_id = query_id or generate_query_id()
+    add_query_to_board(board_id, query_data, query_id)
+    future = Future()
+    future.set_result(query_id)
+    return future
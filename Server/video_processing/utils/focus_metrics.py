@@ -0,0 +1,125 @@
+import numpy as np
+
+# Registry of focus metrics by name. Every metric takes a batch of grayscale
+# frames stacked into one array of shape (N, H, W) and returns an array of N
+# scores, where a higher score means a sharper frame.
+FOCUS_METRICS = {}
+
+
+def register_focus_metric(name):
+    """
+    Register a batch focus metric under a name.
+
+    Args:
+        name (str): Name used to select the metric, e.g. from FOCUS_METRIC.
+
+    Returns:
+        callable: Decorator that registers and returns the metric unchanged.
+    """
+
+    def decorator(metric):
+        FOCUS_METRICS[name] = metric
+        return metric
+
+    return decorator
+
+
+def get_focus_metric(name):
+    """
+    Look up a registered focus metric.
+
+    Args:
+        name (str): Name of the metric.
+
+    Returns:
+        callable: The batch focus metric.
+
+    Raises:
+        Exception: If no metric is registered under that name.
+    """
+    try:
+        return FOCUS_METRICS[name]
+    except KeyError:
+        raise Exception(
+            f"Unknown focus metric '{name}', expected one of {sorted(FOCUS_METRICS)}"
+        )
+
+
+def _as_batch(frames):
+    """
+    Convert a single frame or a stack of frames to a float32 (N, H, W) array.
+    """
+    frames = np.asarray(frames)
+    if frames.ndim == 2:
+        frames = frames[np.newaxis]
+    if frames.ndim != 3:
+        raise Exception("Focus metrics expect grayscale frames of shape (N, H, W)")
+    return frames.astype(np.float32, copy=False)
+
+
+@register_focus_metric("laplacian")
+def laplacian_variance(frames):
+    """
+    Variance of the 4-neighbour Laplacian of each frame.
+
+    The measure of `variance_of_laplacian`, computed for every frame in the
+    batch at once but over interior pixels only: cv2 also scores the
+    one-pixel border by reflecting the frame, which this skips. The scores
+    therefore differ slightly from cv2's, while ranking frames the same.
+
+    Args:
+        frames (numpy.ndarray): Grayscale frames of shape (N, H, W) or (H, W).
+
+    Returns:
+        numpy.ndarray: One score per frame.
+    """
+    x = _as_batch(frames)
+    laplacian = (
+        x[:, :-2, 1:-1]
+        + x[:, 2:, 1:-1]
+        + x[:, 1:-1, :-2]
+        + x[:, 1:-1, 2:]
+        - 4 * x[:, 1:-1, 1:-1]
+    )
+    return laplacian.var(axis=(1, 2))
+
+
+@register_focus_metric("tenengrad")
+def tenengrad(frames):
+    """
+    Mean Sobel gradient energy (Tenengrad) of each frame.
+
+    More robust to noise than the Laplacian at roughly twice the cost.
+
+    Args:
+        frames (numpy.ndarray): Grayscale frames of shape (N, H, W) or (H, W).
+
+    Returns:
+        numpy.ndarray: One score per frame.
+    """
+    x = _as_batch(frames)
+    # Vertical smoothing followed by a horizontal difference, and vice versa.
+    rows = x[:, :-2, :] + 2 * x[:, 1:-1, :] + x[:, 2:, :]
+    cols = x[:, :, :-2] + 2 * x[:, :, 1:-1] + x[:, :, 2:]
+    gx = rows[:, :, 2:] - rows[:, :, :-2]
+    gy = cols[:, 2:, :] - cols[:, :-2, :]
+    return (gx * gx + gy * gy).mean(axis=(1, 2))
+
+
+@register_focus_metric("gradient")
+def downsampled_gradient(frames):
+    """
+    Mean absolute first difference of each frame after 2x decimation.
+
+    The cheapest metric here; good enough to rank frames of the same scene.
+
+    Args:
+        frames (numpy.ndarray): Grayscale frames of shape (N, H, W) or (H, W).
+
+    Returns:
+        numpy.ndarray: One score per frame.
+    """
+    x = _as_batch(np.asarray(frames)[..., ::2, ::2])
+    dx = np.abs(np.diff(x, axis=2)).mean(axis=(1, 2))
+    dy = np.abs(np.diff(x, axis=1)).mean(axis=(1, 2))
+    return dx + dy
@@ -0,0 +1,269 @@
+import base64
+import mimetypes
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+# Budget applied to the image sent to the vision model. VISION_MAX_EDGE caps
+# the longest side in pixels, VISION_MAX_BYTES caps the encoded size (0
+# disables either limit) and VISION_JPEG_QUALITIES is the ladder of JPEG
+# qualities tried, best first, until the image fits.
+VISION_MAX_EDGE = int(os.getenv("VISION_MAX_EDGE", "1024"))
+VISION_MAX_BYTES = int(os.getenv("VISION_MAX_BYTES", "200000"))
+VISION_JPEG_QUALITIES = [
+    int(quality)
+    for quality in os.getenv("VISION_JPEG_QUALITIES", "90,80,70,60,50").split(",")
+]
+
+# Smallest longest side fit_to_budget will shrink an image to.
+MIN_EDGE = 64
+
+# OpenCV extension used to encode each supported content type.
+ENCODING_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+}
+
+
+class EncodedImage:
+    """
+    An encoded image held in memory and handed from stage to stage.
+
+    The frame selected from the video is encoded once into an EncodedImage,
+    which is then shared by the vision request and the storage upload. The
+    base64 form is computed on first use and cached, and a file is only
+    written if a consumer asks for a path.
+
+    Args:
+        data (bytes): The encoded image.
+        content_type (str): MIME type of the encoding. Defaults to "image/jpeg".
+        width (int): Width in pixels, decoded lazily from the data if omitted.
+        height (int): Height in pixels, decoded lazily from the data if omitted.
+    """
+
+    def __init__(self, data, content_type="image/jpeg", width=None, height=None):
+        self.data = data
+        self.content_type = content_type
+        self._width = width
+        self._height = height
+        self._base64 = None
+        self._path = None
+        self._frame = None
+
+    @classmethod
+    def from_frame(cls, frame, content_type="image/jpeg", params=None):
+        """
+        Encode a decoded frame.
+
+        Args:
+            frame (numpy.ndarray): BGR or grayscale frame.
+            content_type (str): MIME type to encode to. Defaults to "image/jpeg".
+            params (list): Extra OpenCV encoding parameters, e.g. JPEG quality.
+
+        Returns:
+            EncodedImage: The encoded frame.
+
+        Raises:
+            Exception: If the content type is unsupported or encoding fails.
+        """
+        extension = ENCODING_EXTENSIONS.get(content_type)
+        if extension is None:
+            raise Exception(f"Unsupported image content type '{content_type}'")
+        ok, buffer = cv2.imencode(extension, frame, params or [])
+        if not ok:
+            raise Exception("Error encoding frame")
+        height, width = frame.shape[:2]
+        image = cls(buffer.tobytes(), content_type, width, height)
+        # Keep the source pixels so resizing later does not need a decode.
+        image._frame = frame
+        return image
+
+    @classmethod
+    def from_file(cls, file_path):
+        """
+        Load an already encoded image from disk.
+
+        Args:
+            file_path (str): Path to the image file.
+
+        Returns:
+            EncodedImage: The image, with its content type guessed from the extension.
+        """
+        with open(file_path, "rb") as image_file:
+            data = image_file.read()
+        content_type = mimetypes.guess_type(file_path)[0] or "image/jpeg"
+        return cls(data, content_type)
+
+    def _decode_dimensions(self):
+        frame = self.decode(cv2.IMREAD_GRAYSCALE)
+        self._height, self._width = frame.shape[:2]
+
+    @property
+    def width(self):
+        """
+        int: Width of the image in pixels.
+        """
+        if self._width is None:
+            self._decode_dimensions()
+        return self._width
+
+    @property
+    def height(self):
+        """
+        int: Height of the image in pixels.
+        """
+        if self._height is None:
+            self._decode_dimensions()
+        return self._height
+
+    @property
+    def size(self):
+        """
+        int: Size of the encoded image in bytes.
+        """
+        return len(self.data)
+
+    @property
+    def extension(self):
+        """
+        str: File extension matching the content type, e.g. ".jpg".
+        """
+        return ENCODING_EXTENSIONS.get(self.content_type) or (
+            mimetypes.guess_extension(self.content_type) or ""
+        )
+
+    @property
+    def base64(self):
+        """
+        str: The encoded image as base64 text, computed once.
+        """
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode("utf-8")
+        return self._base64
+
+    def decode(self, flags=cv2.IMREAD_COLOR):
+        """
+        Decode the image back to a frame.
+
+        Args:
+            flags (int): OpenCV imread flags. Defaults to cv2.IMREAD_COLOR.
+
+        Returns:
+            numpy.ndarray: The decoded frame.
+
+        Raises:
+            Exception: If the data cannot be decoded.
+        """
+        if (
+            flags == cv2.IMREAD_COLOR
+            and self._frame is not None
+            and self._frame.ndim == 3
+        ):
+            return self._frame
+        frame = cv2.imdecode(np.frombuffer(self.data, dtype=np.uint8), flags)
+        if frame is None:
+            raise Exception("Error decoding image")
+        return frame
+
+    def save(self, file_path):
+        """
+        Write the encoded image to a given path.
+
+        Args:
+            file_path (str): Destination path.
+
+        Returns:
+            str: The path the image was written to.
+        """
+        with open(file_path, "wb") as image_file:
+            image_file.write(self.data)
+        return file_path
+
+    def path(self):
+        """
+        Get a file path for consumers that can only read from disk.
+
+        The image is written to a temporary file on first call and the same
+        path is returned afterwards. Call `cleanup` to remove it.
+
+        Returns:
+            str: Path to a file holding the encoded image.
+        """
+        if self._path is None:
+            fd, temp_path = tempfile.mkstemp(suffix=self.extension)
+            with os.fdopen(fd, "wb") as image_file:
+                image_file.write(self.data)
+            self._path = temp_path
+        return self._path
+
+    def cleanup(self):
+        """
+        Remove the temporary file created by `path`, if any.
+        """
+        if self._path is not None:
+            if os.path.exists(self._path):
+                os.remove(self._path)
+            self._path = None
+
+
+def fit_to_budget(
+    image,
+    max_edge=VISION_MAX_EDGE,
+    max_bytes=VISION_MAX_BYTES,
+    qualities=VISION_JPEG_QUALITIES,
+):
+    """
+    Downscale and recompress an image until it fits a size budget.
+
+    The image is first shrunk so its longest side is at most `max_edge`, then
+    encoded as JPEG at each quality of the ladder until it is at most
+    `max_bytes`. If even the lowest quality is too large, the image keeps
+    shrinking by a quarter at that quality. Images already within budget are
+    returned untouched.
+
+    Args:
+        image (EncodedImage): The image to fit.
+        max_edge (int): Maximum length of the longest side, 0 for no limit.
+            Defaults to VISION_MAX_EDGE.
+        max_bytes (int): Maximum encoded size, 0 for no limit.
+            Defaults to VISION_MAX_BYTES.
+        qualities (list): JPEG qualities to try, best first.
+            Defaults to VISION_JPEG_QUALITIES.
+
+    Returns:
+        EncodedImage: An image within budget, or the original if it already was.
+    """
+    longest = max(image.width, image.height)
+    fits_edge = not max_edge or longest <= max_edge
+    fits_bytes = not max_bytes or image.size <= max_bytes
+    if fits_edge and fits_bytes:
+        return image
+
+    frame = image.decode()
+    target = min(longest, max_edge) if max_edge else longest
+    qualities = qualities or [90]
+    while True:
+        if target < longest:
+            scale = target / longest
+            size = (
+                max(1, round(frame.shape[1] * scale)),
+                max(1, round(frame.shape[0] * scale)),
+            )
+            resized = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        else:
+            resized = frame
+
+        for quality in qualities:
+            candidate = EncodedImage.from_frame(
+                resized, "image/jpeg", [cv2.IMWRITE_JPEG_QUALITY, quality]
+            )
+            if not max_bytes or candidate.size <= max_bytes:
+                return candidate
+
+        if target <= MIN_EDGE:
+            return candidate
+        target = max(MIN_EDGE, int(target * 0.75))
+        qualities = qualities[-1:]
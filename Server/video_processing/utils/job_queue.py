@@ -0,0 +1,557 @@
+import atexit
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from uuid import uuid4
+
+from .Logger import Logger
+
+# Background jobs. JOB_WORKERS threads run jobs from a queue of at most
+# JOB_QUEUE_SIZE pending jobs. When the queue is full, JOB_OVERFLOW_POLICY
+# decides what happens to a new job: "block" waits up to JOB_SUBMIT_TIMEOUT
+# seconds for room and then runs it in the submitting thread, "caller" runs it
+# in the submitting thread right away, and "reject" raises QueueFull. Pending
+# jobs, including those run in the submitting thread, are stored in the SQLite
+# database JOB_QUEUE_DB and replayed after a restart. A failed job is retried up to JOB_MAX_ATTEMPTS times in total.
+#
+# Worker processes share the database, so each process holds a lease on the
+# jobs it stored or replayed and renews it while it is alive. Only jobs whose
+# lease has been expired for JOB_LEASE_SECONDS, because their process died,
+# are replayed by another process.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "256"))
+JOB_OVERFLOW_POLICY = os.getenv("JOB_OVERFLOW_POLICY", "block")
+JOB_SUBMIT_TIMEOUT = float(os.getenv("JOB_SUBMIT_TIMEOUT", "5"))
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", "jobs/jobs.sqlite3")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# At shutdown, queued and running jobs get up to JOB_SHUTDOWN_TIMEOUT seconds
+# to finish; the rest are replayed by another process.
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "10"))
+
+OVERFLOW_POLICIES = ("block", "caller", "reject")
+
+# Number of recent wait and run times kept for the latency percentiles.
+LATENCY_SAMPLES = 1024
+
+# Registry of job handlers by name. A handler takes the job's JSON payload
+# and its optional binary data. It may return a Future to keep the job open
+# until work it handed off (e.g. a batched write) is done. A failure handler, called the same way once a
+# job has run out of attempts, releases what the job would have cleaned up.
+JOB_HANDLERS = {}
+JOB_FAILURE_HANDLERS = {}
+
+
+class QueueFull(Exception):
+    """
+    Raised by `JobQueue.submit` when the queue is full and the overflow
+    policy is "reject".
+    """
+
+
+def register_job(name, on_failure=None):
+    """
+    Register a background job handler under a name.
+
+    Args:
+        name (str): Name the job is submitted and stored under.
+        on_failure (callable): Optional handler called with the job's payload
+            and data once it has failed for the last time, e.g. to remove its
+            temporary files.
+
+    Returns:
+        callable: Decorator that registers and returns the handler unchanged.
+    """
+
+    def decorator(handler):
+        JOB_HANDLERS[name] = handler
+        if on_failure is not None:
+            JOB_FAILURE_HANDLERS[name] = on_failure
+        return handler
+
+    return decorator
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class JobStore:
+    """
+    SQLite table of pending jobs, so they survive a restart.
+
+    Every row carries the owner that is running it and when its lease runs
+    out. The owner renews its leases while it is alive, so rows whose lease
+    has expired belong to a process that died and may be claimed by another.
+
+    Args:
+        path (str): Path to the database file, or ":memory:".
+        owner (str): Name this store claims rows under. Defaults to the
+            process ID plus a random suffix, since PIDs are reused.
+        lease (float): Seconds a claim lasts without being renewed.
+    """
+
+    def __init__(self, path, owner=None, lease=JOB_LEASE_SECONDS):
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+        self.owner = owner or f"{os.getpid()}-{uuid4().hex[:8]}"
+        self.lease = lease
+        # Transactions are begun explicitly, so claims can take the write
+        # lock before reading which rows are free.
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            with self._transaction():
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "name TEXT NOT NULL, "
+                    "payload TEXT NOT NULL, "
+                    "data BLOB, "
+                    "enqueued_at REAL NOT NULL, "
+                    "attempts INTEGER NOT NULL DEFAULT 0, "
+                    "owner TEXT, "
+                    "lease_until REAL NOT NULL DEFAULT 0)"
+                )
+                columns = {
+                    row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")
+                }
+                # Databases written before leases existed; their rows start
+                # out expired, so they are replayed once.
+                if "owner" not in columns:
+                    self._connection.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+                if "lease_until" not in columns:
+                    self._connection.execute(
+                        "ALTER TABLE jobs ADD COLUMN lease_until REAL NOT NULL DEFAULT 0"
+                    )
+
+    @contextmanager
+    def _transaction(self):
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def add(self, name, payload, data, enqueued_at):
+        with self._lock, self._transaction():
+            cursor = self._connection.execute(
+                "INSERT INTO jobs (name, payload, data, enqueued_at, owner, lease_until) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    name,
+                    json.dumps(payload),
+                    data,
+                    enqueued_at,
+                    self.owner,
+                    time.time() + self.lease,
+                ),
+            )
+            return cursor.lastrowid
+
+    def attempted(self, job_id):
+        with self._lock, self._transaction():
+            self._connection.execute(
+                "UPDATE jobs SET attempts = attempts + 1 WHERE id = ?", (job_id,)
+            )
+
+    def remove(self, job_id):
+        with self._lock, self._transaction():
+            self._connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def claim_expired(self):
+        """
+        Take over the jobs whose lease has expired.
+
+        Returns:
+            list: The claimed jobs as (id, name, payload, data, enqueued_at,
+            attempts) tuples, oldest first.
+        """
+        now = time.time()
+        with self._lock, self._transaction():
+            rows = self._connection.execute(
+                "SELECT id, name, payload, data, enqueued_at, attempts FROM jobs "
+                "WHERE lease_until < ? ORDER BY id",
+                (now,),
+            ).fetchall()
+            self._connection.executemany(
+                "UPDATE jobs SET owner = ?, lease_until = ? WHERE id = ?",
+                [(self.owner, now + self.lease, row[0]) for row in rows],
+            )
+        return [
+            (job_id, name, json.loads(payload), data, enqueued_at, attempts)
+            for job_id, name, payload, data, enqueued_at, attempts in rows
+        ]
+
+    def renew(self):
+        """
+        Extend the lease of every job this store owns.
+        """
+        with self._lock, self._transaction():
+            self._connection.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ?",
+                (time.time() + self.lease, self.owner),
+            )
+
+    def release(self):
+        """
+        Give up the jobs this store owns, so another process replays them
+        right away instead of after their lease expires.
+        """
+        with self._lock, self._transaction():
+            self._connection.execute(
+                "UPDATE jobs SET lease_until = 0 WHERE owner = ?", (self.owner,)
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class JobQueue:
+    """
+    A fixed pool of worker threads running jobs from a bounded, durable queue.
+
+    Every job is written to the store before it is queued and removed once
+    it has succeeded or run out of attempts, so jobs still pending when the
+    process dies are replayed, by `start` on the next run or by a sibling
+    process once their lease expires. Handlers must therefore be safe to run
+    twice.
+
+    Args:
+        store (JobStore): Where pending jobs are persisted, or None to keep
+            them in memory only.
+        workers (int): Number of worker threads.
+        max_pending (int): Maximum number of queued jobs.
+        overflow (str): What to do with a job when the queue is full, one of
+            OVERFLOW_POLICIES.
+        submit_timeout (float): Seconds the "block" policy waits for room.
+        max_attempts (int): Attempts before a failing job is dropped.
+        handlers (dict): Job handlers by name. Defaults to JOB_HANDLERS.
+        failure_handlers (dict): Failure handlers by name. Defaults to
+            JOB_FAILURE_HANDLERS.
+    """
+
+    def __init__(
+        self,
+        store=None,
+        workers=JOB_WORKERS,
+        max_pending=JOB_QUEUE_SIZE,
+        overflow=JOB_OVERFLOW_POLICY,
+        submit_timeout=JOB_SUBMIT_TIMEOUT,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        handlers=None,
+        failure_handlers=None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise Exception(
+                f"Unknown overflow policy '{overflow}', expected one of {OVERFLOW_POLICIES}"
+            )
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.overflow = overflow
+        self.submit_timeout = submit_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.handlers = handlers if handlers is not None else JOB_HANDLERS
+        self.failure_handlers = (
+            failure_handlers if failure_handlers is not None else JOB_FAILURE_HANDLERS
+        )
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._running = 0
+        self._closed = False
+        self._stopping = threading.Event()
+        self._counts = {"completed": 0, "failed": 0, "retried": 0, "rejected": 0, "inline": 0}
+        self._wait_times = deque(maxlen=LATENCY_SAMPLES)
+        self._run_times = deque(maxlen=LATENCY_SAMPLES)
+
+    def start(self):
+        """
+        Start the workers and replay jobs left in the store by a previous run.
+
+        Calling it again is a no-op.
+        """
+        with self._condition:
+            if self._threads or self._closed:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._work, name=f"job-worker-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+        if self.store is not None:
+            self._replay_expired()
+            thread = threading.Thread(target=self._keep_leases, name="job-lease", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _replay_expired(self):
+        jobs = self.store.claim_expired()
+        if not jobs:
+            return
+        Logger().info(f"Replaying {len(jobs)} background jobs")
+        with self._condition:
+            # Replayed jobs are queued even beyond max_pending, since they
+            # were accepted before their process died.
+            self._pending.extend(job + (None, contextvars.Context()) for job in jobs)
+            self._condition.notify_all()
+
+    def _keep_leases(self):
+        # Renew often enough that a slow renewal never lets a lease lapse,
+        # and pick up jobs of processes that died since the last check.
+        while not self._stopping.wait(self.store.lease / 3):
+            try:
+                self.store.renew()
+                self._replay_expired()
+            except Exception as e:
+                Logger().error(f"Renewing job leases failed: {e}")
+
+    def submit(self, name, payload, data=None):
+        """
+        Queue a job.
+
+        The job runs in a copy of the submitter's context, e.g. with the
+        request's log context. A job run in the submitting thread because the
+        queue is full is stored all the same, so its retries and a crash
+        while it runs are covered too.
+
+        Args:
+            name (str): Name of a registered handler.
+            payload (dict): JSON-serialisable arguments of the job.
+            data (bytes): Optional binary data, e.g. an encoded image.
+
+        Raises:
+            QueueFull: If the queue is full and the overflow policy is "reject".
+        """
+        if name not in self.handlers:
+            raise Exception(f"Unknown job '{name}'")
+        self.start()
+        enqueued_at = time.time()
+        context = contextvars.copy_context()
+        with self._condition:
+            if self.overflow == "block":
+                self._condition.wait_for(
+                    lambda: len(self._pending) < self.max_pending,
+                    timeout=self.submit_timeout,
+                )
+            full = len(self._pending) >= self.max_pending
+            if full and self.overflow == "reject":
+                self._counts["rejected"] += 1
+                raise QueueFull(f"Job queue is full ({self.max_pending} pending)")
+            if full:
+                self._counts["inline"] += 1
+
+        job_id = (
+            self.store.add(name, payload, data, enqueued_at)
+            if self.store is not None
+            else None
+        )
+        if full:
+            # Run the job here, which slows down the submitter instead of
+            # growing the queue.
+            with self._condition:
+                self._running += 1
+            self._run((job_id, name, payload, data, enqueued_at, 0, None, context))
+            return
+
+        with self._condition:
+            self._pending.append(
+                (job_id, name, payload, data, enqueued_at, 0, None, context)
+            )
+            self._condition.notify_all()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                # Jobs being retried or waiting for handed-off work count as
+                # running, so workers stay until those are settled too.
+                self._condition.wait_for(
+                    lambda: self._pending or (self._closed and not self._running)
+                )
+                if not self._pending:
+                    return
+                job = self._pending.popleft()
+                self._running += 1
+                # Wake blocked submitters now that there is room.
+                self._condition.notify_all()
+            self._run(job)
+
+    def _run(self, job):
+        """
+        Run one attempt of a job.
+
+        If the handler returns a Future, the job is settled when it resolves,
+        without a worker waiting for it.
+        """
+        job_id, name, payload, data, enqueued_at, attempts, started_at, context = job
+        job = (
+            job_id,
+            name,
+            payload,
+            data,
+            enqueued_at,
+            attempts + 1,
+            started_at or time.time(),
+            context,
+        )
+        if job_id is not None:
+            self.store.attempted(job_id)
+        try:
+            handler = self.handlers.get(name)
+            if handler is None:
+                raise Exception(f"Unknown job '{name}'")
+            result = context.run(handler, payload, data)
+        except Exception as e:
+            self._settle(job, e)
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(lambda future: self._settle(job, future.exception()))
+        else:
+            self._settle(job, None)
+
+    def _settle(self, job, error):
+        job_id, name, payload, data, enqueued_at, attempts, started_at, _ = job
+        if error is not None and attempts < self.max_attempts:
+            with self._condition:
+                self._counts["retried"] += 1
+            # Requeued after a backoff from a timer, so no worker (or thread
+            # that finished the handed-off work) sleeps through it.
+            timer = threading.Timer(
+                min(0.5 * 2 ** (attempts - 1), 10), self._requeue, (job,)
+            )
+            timer.daemon = True
+            timer.start()
+            return
+
+        if error is not None:
+            Logger().error(f"Job {name} failed after {attempts} attempts: {error}")
+            outcome = "failed"
+            self._discard(name, payload, data)
+        else:
+            outcome = "completed"
+        finished_at = time.time()
+        if job_id is not None:
+            self.store.remove(job_id)
+        with self._condition:
+            self._counts[outcome] += 1
+            self._wait_times.append(started_at - enqueued_at)
+            self._run_times.append(finished_at - started_at)
+            self._running -= 1
+            self._condition.notify_all()
+
+    def _requeue(self, job):
+        with self._condition:
+            self._running -= 1
+            # Ahead of newer jobs, it has waited long enough.
+            self._pending.appendleft(job)
+            self._condition.notify_all()
+
+    def _discard(self, name, payload, data):
+        on_failure = self.failure_handlers.get(name)
+        if on_failure is None:
+            return
+        try:
+            on_failure(payload, data)
+        except Exception as e:
+            Logger().error(f"Cleaning up after job {name} failed: {e}")
+
+    def join(self, timeout=None):
+        """
+        Wait until no job is queued or running.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and not self._running, timeout=timeout
+            )
+
+    def close(self, timeout=None):
+        """
+        Let the workers finish the queued and running jobs, then stop them.
+
+        Jobs still queued when the timeout expires stay in the store, and
+        their leases are given up so another process replays them right away.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._stopping.set()
+        deadline = None if timeout is None else time.time() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.time()))
+        if self.store is not None:
+            self.store.release()
+
+    def stats(self):
+        """
+        Queue depth, job counts and latency percentiles.
+
+        Returns:
+            dict: "depth" and "running" job counts, totals per outcome, and
+            p50/p95/p99 of the seconds jobs waited in the queue and ran for.
+        """
+        with self._condition:
+            wait_times = list(self._wait_times)
+            run_times = list(self._run_times)
+            stats = {"depth": len(self._pending), "running": self._running}
+            stats.update(self._counts)
+        for label, samples in (("wait", wait_times), ("run", run_times)):
+            for fraction in (0.5, 0.95, 0.99):
+                stats[f"{label}_p{int(fraction * 100)}"] = _percentile(samples, fraction)
+        return stats
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Get the process-wide job queue, creating and starting it on first use.
+
+    The queue is drained at interpreter exit, for up to JOB_SHUTDOWN_TIMEOUT
+    seconds.
+
+    Returns:
+        JobQueue: The shared job queue, persisted to JOB_QUEUE_DB.
+    """
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue(JobStore(JOB_QUEUE_DB))
+                _job_queue.start()
+                atexit.register(_job_queue.close, JOB_SHUTDOWN_TIMEOUT)
+    return _job_queue
+
+
+def job_queue_stats():
+    """
+    Statistics of the shared job queue.
+
+    Returns:
+        dict: See `JobQueue.stats`, or an empty dict if the queue was never used.
+    """
+    return _job_queue.stats() if _job_queue is not None else {}
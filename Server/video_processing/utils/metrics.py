@@ -0,0 +1,285 @@
+import contextlib
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import deque
+
+# Stage latency metrics. Every stage keeps a Prometheus-style histogram of
+# all its durations plus the last METRICS_WINDOW durations, from which the
+# p50/p95/p99 are computed.
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))
+
+# Stages timed along the request path. "request" is the time until the
+# response starts streaming back to the device.
+STAGES = (
+    "request",
+    "save",
+    "audio_extraction",
+    "frame_selection",
+    "stt",
+    "vision",
+    "tts_first_byte",
+    "tts_complete",
+    "storage_upload",
+    "firestore_write",
+)
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """
+    Thread-safe latency histogram with quantiles over a recent window.
+
+    Args:
+        buckets (tuple): Upper bounds of the buckets, in seconds.
+        window (int): Number of recent observations kept for quantiles.
+    """
+
+    def __init__(self, buckets=BUCKETS, window=METRICS_WINDOW):
+        self.buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._count = 0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self._counts[index] += 1
+                    break
+            self._sum += seconds
+            self._count += 1
+            self._recent.append(seconds)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Cumulative bucket counts, sum, count and recent quantiles.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+            recent = sorted(self._recent)
+        cumulative, running = [], 0
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+        quantiles = {
+            quantile: recent[min(len(recent) - 1, int(quantile * len(recent)))]
+            if recent
+            else 0.0
+            for quantile in QUANTILES
+        }
+        return {
+            "buckets": list(zip(self.buckets, cumulative)),
+            "sum": total,
+            "count": count,
+            "quantiles": quantiles,
+        }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def get_histogram(stage):
+    """
+    Get the histogram of a stage, creating it on first use.
+    """
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(stage, Histogram())
+    return histogram
+
+
+def observe(stage, seconds):
+    """
+    Record the duration of a stage.
+
+    Args:
+        stage (str): Name of the stage, usually one of STAGES.
+        seconds (float): How long the stage took.
+    """
+    get_histogram(stage).observe(seconds)
+
+
+@contextlib.contextmanager
+def span(stage):
+    """
+    Time the enclosed block as a stage, whether or not it raises.
+
+    Works around `await` too, since only wall-clock time is measured.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def timed(stage):
+    """
+    Decorator timing every call of a function, or of a coroutine function, as a stage.
+
+    Args:
+        stage (str): Name of the stage.
+
+    Returns:
+        callable: Decorator wrapping the function.
+    """
+
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def timed_stream(first_stage=None, complete_stage=None):
+    """
+    Decorator timing a generator, or async generator, function.
+
+    The time until the first item is recorded as `first_stage` and the time
+    until the generator is exhausted as `complete_stage`. Streams abandoned
+    by their consumer are not recorded as complete.
+
+    The undecorated function stays reachable as `__wrapped__`, for callers
+    that time a series of streams as one, like the speech pipelines.
+
+    Args:
+        first_stage (str): Stage timed up to the first item, or None.
+        complete_stage (str): Stage timed up to the end of the stream, or None.
+
+    Returns:
+        callable: Decorator wrapping the generator function.
+    """
+
+    def decorator(function):
+        if inspect.isasyncgenfunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                first = True
+                stream = function(*args, **kwargs)
+                try:
+                    async for item in stream:
+                        if first and first_stage:
+                            observe(first_stage, time.perf_counter() - start)
+                        first = False
+                        yield item
+                finally:
+                    # Release the inner stream's connection right away.
+                    await stream.aclose()
+                if complete_stage:
+                    observe(complete_stage, time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            first = True
+            stream = function(*args, **kwargs)
+            try:
+                for item in stream:
+                    if first and first_stage:
+                        observe(first_stage, time.perf_counter() - start)
+                    first = False
+                    yield item
+            finally:
+                stream.close()
+            if complete_stage:
+                observe(complete_stage, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def stage_stats():
+    """
+    Snapshot of every stage histogram.
+
+    Returns:
+        dict: Histogram snapshot per stage, see `Histogram.snapshot`.
+    """
+    with _histograms_lock:
+        histograms = dict(_histograms)
+    return {stage: histogram.snapshot() for stage, histogram in sorted(histograms.items())}
+
+
+def _format_value(value):
+    return repr(float(value)) if not isinstance(value, bool) else str(int(value))
+
+
+def render_metrics(gauges=None):
+    """
+    Render the stage histograms and extra gauges in the Prometheus text format.
+
+    Args:
+        gauges (dict): Optional gauges as {metric name: {label value: stats dict}}.
+            Each numeric entry of a stats dict becomes a gauge named
+            "yar_<metric name>_<key>" labelled with the label value, e.g.
+            {"cache": {"vision": {"hits": 3}}} renders
+            'yar_cache_hits{name="vision"} 3.0'.
+
+    Returns:
+        str: The metrics page.
+    """
+    lines = [
+        "# HELP yar_stage_duration_seconds Duration of each request stage.",
+        "# TYPE yar_stage_duration_seconds histogram",
+    ]
+    snapshots = stage_stats()
+    for stage, snapshot in snapshots.items():
+        for bound, count in snapshot["buckets"]:
+            lines.append(
+                f'yar_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}'
+            )
+        lines.append(
+            f'yar_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {snapshot["count"]}'
+        )
+        lines.append(f'yar_stage_duration_seconds_sum{{stage="{stage}"}} {snapshot["sum"]}')
+        lines.append(f'yar_stage_duration_seconds_count{{stage="{stage}"}} {snapshot["count"]}')
+
+    lines += [
+        "# HELP yar_stage_duration_quantile_seconds Recent quantiles of each request stage.",
+        "# TYPE yar_stage_duration_quantile_seconds gauge",
+    ]
+    for stage, snapshot in snapshots.items():
+        for quantile, value in snapshot["quantiles"].items():
+            lines.append(
+                f'yar_stage_duration_quantile_seconds{{stage="{stage}",quantile="{quantile}"}} {value}'
+            )
+
+    for metric, groups in (gauges or {}).items():
+        for label, stats in groups.items():
+            for key, value in stats.items():
+                if isinstance(value, (int, float)):
+                    lines.append(
+                        f'yar_{metric}_{key}{{name="{label}"}} {_format_value(value)}'
+                    )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,456 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Response caching. RESPONSE_CACHE_BACKEND is "memory", "disk" (under
+# RESPONSE_CACHE_DIR) or "none". Vision answers are reused for frames whose
+# perceptual hashes differ by at most VISION_CACHE_MAX_DISTANCE bits, for the
+# same normalized transcript from the same board. TTS audio is reused for identical text, voice
+# and model. Each tier has its own TTL in seconds and size limit in bytes.
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", os.path.join("response", "cache"))
+VISION_CACHE_TTL = float(os.getenv("VISION_CACHE_TTL", "300"))
+VISION_CACHE_MAX_BYTES = int(os.getenv("VISION_CACHE_MAX_BYTES", str(1024 * 1024)))
+VISION_CACHE_MAX_DISTANCE = int(os.getenv("VISION_CACHE_MAX_DISTANCE", "6"))
+TTS_CACHE_TTL = float(os.getenv("TTS_CACHE_TTL", "86400"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU cache of bytes values with a TTL and a total size limit.
+
+    Args:
+        ttl (float): Seconds an entry stays valid after it is written.
+        max_bytes (int): Maximum total size of the stored values.
+
+    Attributes:
+        on_evict (callable): Called with the key of each entry dropped because
+            it expired or to make room, while the backend's lock is held.
+    """
+
+    def __init__(self, ttl, max_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.on_evict = None
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        value, _ = self._entries.pop(key)
+        self._size -= len(value)
+
+    def _evict(self, key):
+        self._remove(key)
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, written_at = entry
+            if time.time() - written_at > self.ttl:
+                self._evict(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time())
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+
+class DiskCacheBackend:
+    """
+    On-disk LRU cache of bytes values with a TTL and a total size limit.
+
+    Each value is a file named after its key. The file's modification time
+    records when it was written (for the TTL) and its access time when it was
+    last read (for LRU eviction), so the cache survives restarts.
+
+    Args:
+        directory (str): Directory holding the entries.
+        ttl (float): Seconds an entry stays valid after it is written.
+        max_bytes (int): Maximum total size of the stored values.
+
+    Attributes:
+        on_evict (callable): Called with the key of each entry dropped because
+            it expired or to make room, while the backend's lock is held.
+    """
+
+    def __init__(self, directory, ttl, max_bytes):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.on_evict = None
+        self._lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        # Leftover temporary files from an interrupted write are not entries.
+        self._size = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in os.listdir(directory)
+            if not name.endswith(".tmp")
+        )
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._size -= size
+        except FileNotFoundError:
+            pass
+
+    def _evict_entry(self, key):
+        self._remove(self._path(key))
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def get(self, key):
+        path = self._path(key)
+        with self._lock:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return None
+            if time.time() - stat.st_mtime > self.ttl:
+                self._evict_entry(key)
+                return None
+            with open(path, "rb") as cache_file:
+                value = cache_file.read()
+            os.utime(path, (time.time(), stat.st_mtime))
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        with self._lock:
+            self._remove(path)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "wb") as cache_file:
+                cache_file.write(value)
+            os.replace(temp_path, path)
+            self._size += len(value)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                entries.append((os.stat(self._path(name)).st_atime, name))
+            except FileNotFoundError:
+                continue
+        for _, name in sorted(entries):
+            if self._size <= self.max_bytes:
+                break
+            self._evict_entry(name)
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(self._path(key))
+
+    def keys(self):
+        with self._lock:
+            return [name for name in os.listdir(self.directory) if not name.endswith(".tmp")]
+
+
+def create_backend(name, ttl, max_bytes):
+    """
+    Create the cache backend configured by RESPONSE_CACHE_BACKEND.
+
+    Args:
+        name (str): Name of the cache, used as a subdirectory for disk backends.
+        ttl (float): Seconds an entry stays valid.
+        max_bytes (int): Maximum total size of the stored values.
+
+    Returns:
+        MemoryCacheBackend or DiskCacheBackend: The backend, or None if caching is disabled.
+
+    Raises:
+        Exception: If the backend name is unknown.
+    """
+    if RESPONSE_CACHE_BACKEND == "none":
+        return None
+    if RESPONSE_CACHE_BACKEND == "memory":
+        return MemoryCacheBackend(ttl, max_bytes)
+    if RESPONSE_CACHE_BACKEND == "disk":
+        return DiskCacheBackend(os.path.join(RESPONSE_CACHE_DIR, name), ttl, max_bytes)
+    raise Exception(f"Unknown response cache backend '{RESPONSE_CACHE_BACKEND}'")
+
+
+def perceptual_hash(image):
+    """
+    Compute a 64-bit DCT perceptual hash of an image.
+
+    Args:
+        image (EncodedImage): The image.
+
+    Returns:
+        int: The hash. Similar images have hashes a small Hamming distance apart.
+    """
+    frame = image.decode()
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+    low_frequencies = cv2.dct(small.astype(np.float32))[:8, :8].flatten()
+    bits = low_frequencies > np.median(low_frequencies[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def normalize_transcript(transcript):
+    """
+    Lowercase a transcript and strip punctuation and extra whitespace.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", transcript.lower()).split())
+
+
+class CacheStats:
+    """
+    Hit and miss counters for a cache.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class VisionCache:
+    """
+    Cache of vision answers keyed by a perceptual hash of the frame, the
+    transcript and the board.
+
+    Entries are stored in the backend under "<question digest>-<hash>",
+    where the question digest covers the model, the board and the
+    transcript, so one board never gets an answer to another board's frame.
+    An in-memory index of the hashes seen per question is used to find the
+    nearest stored frame within the Hamming distance tolerance. Entries the
+    backend evicts are dropped from the index.
+
+    Args:
+        backend: A cache backend, or None to disable the cache.
+        max_distance (int): Maximum Hamming distance between matching hashes.
+    """
+
+    def __init__(self, backend, max_distance=VISION_CACHE_MAX_DISTANCE):
+        self.backend = backend
+        self.max_distance = max_distance
+        self.stats = CacheStats()
+        self._index = {}
+        self._lock = threading.Lock()
+        if backend is not None:
+            backend.on_evict = self._remove_from_index
+            for key in backend.keys():
+                self._add_to_index(key)
+
+    def _add_to_index(self, key):
+        transcript_key, _, hash_hex = key.rpartition("-")
+        try:
+            self._index.setdefault(transcript_key, set()).add(int(hash_hex, 16))
+        except ValueError:
+            pass
+
+    def _remove_from_index(self, key):
+        transcript_key, _, hash_hex = key.rpartition("-")
+        try:
+            image_hash = int(hash_hex, 16)
+        except ValueError:
+            return
+        with self._lock:
+            self._discard(transcript_key, image_hash)
+
+    def _discard(self, transcript_key, image_hash):
+        hashes = self._index.get(transcript_key)
+        if hashes is None:
+            return
+        hashes.discard(image_hash)
+        if not hashes:
+            del self._index[transcript_key]
+
+    @staticmethod
+    def _transcript_key(transcript, model, board_token):
+        normalized = f"{model}\n{board_token or ''}\n{normalize_transcript(transcript)}"
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+    def get(self, image, transcript, model, board_token=None):
+        """
+        Look up the answer for a similar frame and the same question from the same board.
+
+        Args:
+            image (EncodedImage): The selected frame.
+            transcript (str): The user's question.
+            model (str): The vision model.
+            board_token (str): The board asking.
+
+        Returns:
+            tuple: The cached answer or None, and the frame's perceptual hash
+            for a later `set`.
+        """
+        if self.backend is None:
+            return None, None
+        image_hash = perceptual_hash(image)
+        transcript_key = self._transcript_key(transcript, model, board_token)
+        with self._lock:
+            candidates = sorted(
+                self._index.get(transcript_key, ()),
+                key=lambda cached: bin(cached ^ image_hash).count("1"),
+            )
+        for cached_hash in candidates:
+            if bin(cached_hash ^ image_hash).count("1") > self.max_distance:
+                break
+            value = self.backend.get(f"{transcript_key}-{cached_hash:016x}")
+            if value is not None:
+                self.stats.record(hit=True)
+                return value.decode("utf-8"), image_hash
+            with self._lock:
+                self._discard(transcript_key, cached_hash)
+        self.stats.record(hit=False)
+        return None, image_hash
+
+    def set(self, image_hash, transcript, model, answer, board_token=None):
+        """
+        Store the answer for a frame and question.
+
+        Args:
+            image_hash (int): Perceptual hash returned by `get`.
+            transcript (str): The user's question.
+            model (str): The vision model.
+            answer (str): The vision model's answer.
+            board_token (str): The board that asked.
+        """
+        if self.backend is None or image_hash is None:
+            return
+        key = f"{self._transcript_key(transcript, model, board_token)}-{image_hash:016x}"
+        self.backend.set(key, answer.encode("utf-8"))
+        with self._lock:
+            self._add_to_index(key)
+
+
+class SpeechCache:
+    """
+    Cache of synthesised speech keyed by text, voice and model.
+
+    Args:
+        backend: A cache backend, or None to disable the cache.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = CacheStats()
+
+    @staticmethod
+    def key(text, voice, model):
+        return hashlib.sha256(f"{model}\n{voice}\n{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text, voice, model):
+        """
+        Returns:
+            bytes: The cached audio, or None.
+        """
+        if self.backend is None:
+            return None
+        audio = self.backend.get(self.key(text, voice, model))
+        self.stats.record(hit=audio is not None)
+        return audio
+
+    def set(self, text, voice, model, audio):
+        if self.backend is not None:
+            self.backend.set(self.key(text, voice, model), audio)
+
+
+_vision_cache = None
+_speech_cache = None
+_caches_lock = threading.Lock()
+
+
+def get_vision_cache():
+    """
+    Get the process-wide vision cache, creating it (and its backend) on first use.
+
+    Returns:
+        VisionCache: The shared vision cache.
+    """
+    global _vision_cache
+    if _vision_cache is None:
+        with _caches_lock:
+            if _vision_cache is None:
+                _vision_cache = VisionCache(
+                    create_backend("vision", VISION_CACHE_TTL, VISION_CACHE_MAX_BYTES)
+                )
+    return _vision_cache
+
+
+def get_speech_cache():
+    """
+    Get the process-wide speech cache, creating it (and its backend) on first use.
+
+    Returns:
+        SpeechCache: The shared speech cache.
+    """
+    global _speech_cache
+    if _speech_cache is None:
+        with _caches_lock:
+            if _speech_cache is None:
+                _speech_cache = SpeechCache(
+                    create_backend("speech", TTS_CACHE_TTL, TTS_CACHE_MAX_BYTES)
+                )
+    return _speech_cache
+
+
+def cache_stats():
+    """
+    Hit-rate statistics of the response caches.
+
+    Returns:
+        dict: Hits, misses and hit rate per cache.
+    """
+    return {
+        "vision": get_vision_cache().stats.as_dict(),
+        "speech": get_speech_cache().stats.as_dict(),
+    }
@@ -0,0 +1,362 @@
+import asyncio
+import contextvars
+import os
+import queue
+import re
+import threading
+import time
+
+from .metrics import observe
+
+# Sentence-pipelined speech. With STREAM_SPEECH=1 the vision response is
+# streamed and each sentence is sent to TTS as soon as it is complete.
+# TTS_PREFETCH bounds how many sentences are synthesised ahead of playback,
+# and sentences shorter than TTS_MIN_SENTENCE_CHARS are merged with the next
+# one to avoid tiny TTS requests.
+STREAM_SPEECH = os.getenv("STREAM_SPEECH", "1") == "1"
+TTS_PREFETCH = int(os.getenv("TTS_PREFETCH", "2"))
+TTS_MIN_SENTENCE_CHARS = int(os.getenv("TTS_MIN_SENTENCE_CHARS", "20"))
+
+# End of a sentence: terminal punctuation, optional closing quotes or
+# brackets, then whitespace.
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+")
+
+
+class SentenceSplitter:
+    """
+    Cut a stream of text deltas into complete sentences.
+
+    Args:
+        min_chars (int): Sentences shorter than this are held back and
+            merged with the following one.
+    """
+
+    def __init__(self, min_chars=TTS_MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text):
+        """
+        Add a text delta.
+
+        Args:
+            text (str): The next piece of the streamed text.
+
+        Returns:
+            list: Sentences completed by this delta, possibly empty.
+        """
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            if match.end() - start < self.min_chars:
+                continue
+            sentences.append(self._buffer[start:match.end()].strip())
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """
+        Return whatever text is left once the stream has ended.
+
+        Returns:
+            str: The final, possibly unterminated, sentence or None if nothing is left.
+        """
+        remainder, self._buffer = self._buffer.strip(), ""
+        return remainder or None
+
+
+def _finish(pipeline):
+    if pipeline.text is not None:
+        if pipeline.on_complete is not None:
+            pipeline.on_complete(pipeline.text)
+    elif pipeline.on_error is not None:
+        pipeline.on_error(pipeline.error)
+
+
+def _first_audio(pipeline):
+    observe("tts_first_byte", time.perf_counter() - pipeline._first_sentence_at)
+    if pipeline.on_first_audio is not None:
+        pipeline.on_first_audio()
+
+
+def _last_audio(pipeline, silent):
+    # Abandoned or silent responses are not recorded as complete.
+    if not silent:
+        observe("tts_complete", time.perf_counter() - pipeline._first_sentence_at)
+
+
+class SpeechPipeline:
+    """
+    Speak a streamed text response sentence by sentence.
+
+    A producer thread reads the text deltas, cuts them into sentences and
+    starts synthesising each one as soon as it is complete, at most
+    `prefetch` sentences ahead of the consumer. Iterating the pipeline yields
+    the audio of each sentence in order, so the first sentence can be played
+    while the rest of the response is still being generated.
+
+    The complete text is passed to `on_complete` from the producer thread
+    once the text stream ends, whether or not the audio was consumed. If the
+    text stream fails instead, its exception is passed to `on_error`, so the
+    caller can still release what it holds for the response.
+
+    Speech is timed once per response: "tts_first_byte" from the first
+    sentence sent to TTS until its first audio is yielded, and "tts_complete"
+    until the last audio is yielded. `synthesize` should therefore not time
+    itself, e.g. use `convert_text_to_speech.__wrapped__`.
+
+    Args:
+        text_chunks (iterable): Text deltas, e.g. from `stream_image_to_text`.
+        synthesize (callable): Takes a sentence and returns an iterable of audio chunks.
+        on_complete (callable): Optional callback receiving the complete text.
+        prefetch (int): Maximum number of sentences synthesised ahead of playback.
+        on_first_audio (callable): Optional callback, called without arguments
+            when the first audio is yielded.
+        on_error (callable): Optional callback receiving the exception if the
+            text stream fails, or None if it was cancelled.
+    """
+
+    def __init__(
+        self,
+        text_chunks,
+        synthesize,
+        on_complete=None,
+        prefetch=TTS_PREFETCH,
+        on_first_audio=None,
+        on_error=None,
+    ):
+        self.synthesize = synthesize
+        self.on_complete = on_complete
+        self.on_first_audio = on_first_audio
+        self.on_error = on_error
+        self._first_sentence_at = None
+        self.text = None
+        self.error = None
+        self._sentences = queue.Queue()
+        self.prefetch = max(1, prefetch)
+        self._slots = threading.Semaphore(self.prefetch)
+        self._ready = threading.Event()
+        self._cancelled = False
+        # The threads run in a copy of the request's context, e.g. its log context.
+        self._producer = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._produce, text_chunks),
+            daemon=True,
+        )
+        self._producer.start()
+
+    def _produce(self, text_chunks):
+        splitter = SentenceSplitter()
+        parts = []
+
+        def speak(sentence):
+            parts.append(sentence)
+            if self._cancelled:
+                return
+            self._slots.acquire()
+            if self._cancelled:
+                return
+            chunks = queue.Queue()
+            if self._first_sentence_at is None:
+                self._first_sentence_at = time.perf_counter()
+            threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(self._synthesize, sentence, chunks),
+                daemon=True,
+            ).start()
+            self._sentences.put(chunks)
+            self._ready.set()
+
+        try:
+            for text in text_chunks:
+                for sentence in splitter.feed(text):
+                    speak(sentence)
+            remainder = splitter.flush()
+            if remainder:
+                speak(remainder)
+            self.text = " ".join(parts)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._sentences.put(None)
+            self._ready.set()
+            _finish(self)
+
+    def _synthesize(self, sentence, chunks):
+        try:
+            for chunk in self.synthesize(sentence):
+                chunks.put(chunk)
+        except Exception as e:
+            chunks.put(e)
+        finally:
+            chunks.put(None)
+
+    def wait_until_ready(self):
+        """
+        Block until the first sentence is being synthesised or the text stream ended.
+
+        Raises:
+            Exception: If the text stream failed before producing any sentence.
+        """
+        self._ready.wait()
+        if self.error is not None and self._sentences.qsize() <= 1:
+            raise self.error
+
+    def __iter__(self):
+        first = True
+        try:
+            while True:
+                chunks = self._sentences.get()
+                if chunks is None:
+                    break
+                try:
+                    while True:
+                        chunk = chunks.get()
+                        if chunk is None:
+                            break
+                        if isinstance(chunk, Exception):
+                            raise chunk
+                        if first:
+                            first = False
+                            _first_audio(self)
+                        yield chunk
+                finally:
+                    self._slots.release()
+            if self.error is not None:
+                raise self.error
+            _last_audio(self, first)
+        finally:
+            # Stop synthesising if the client went away; the text is still
+            # collected. Free the slots so a waiting producer can notice.
+            self._cancelled = True
+            for _ in range(self.prefetch):
+                self._slots.release()
+
+
+class AsyncSpeechPipeline:
+    """
+    Async counterpart of `SpeechPipeline`, built on asyncio tasks.
+
+    Args:
+        text_chunks (async iterable): Text deltas, e.g. from `stream_image_to_text_async`.
+        synthesize (callable): Takes a sentence and returns an async iterable of audio chunks.
+        on_complete (callable): Optional callback receiving the complete text.
+        prefetch (int): Maximum number of sentences synthesised ahead of playback.
+        on_first_audio (callable): Optional callback, called without arguments
+            when the first audio is yielded.
+        on_error (callable): Optional callback receiving the exception if the
+            text stream fails, or None if it was cancelled.
+    """
+
+    def __init__(
+        self,
+        text_chunks,
+        synthesize,
+        on_complete=None,
+        prefetch=TTS_PREFETCH,
+        on_first_audio=None,
+        on_error=None,
+    ):
+        self.synthesize = synthesize
+        self.on_complete = on_complete
+        self.on_first_audio = on_first_audio
+        self.on_error = on_error
+        self._first_sentence_at = None
+        self.text = None
+        self.error = None
+        self._sentences = asyncio.Queue()
+        self.prefetch = max(1, prefetch)
+        self._slots = asyncio.Semaphore(self.prefetch)
+        self._ready = asyncio.Event()
+        self._cancelled = False
+        self._tasks = set()
+        self._spawn(self._produce(text_chunks))
+
+    def _spawn(self, coroutine):
+        # Keep a reference so running tasks are not garbage collected.
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _produce(self, text_chunks):
+        splitter = SentenceSplitter()
+        parts = []
+
+        async def speak(sentence):
+            parts.append(sentence)
+            if self._cancelled:
+                return
+            await self._slots.acquire()
+            if self._cancelled:
+                return
+            chunks = asyncio.Queue()
+            if self._first_sentence_at is None:
+                self._first_sentence_at = time.perf_counter()
+            self._spawn(self._synthesize(sentence, chunks))
+            await self._sentences.put(chunks)
+            self._ready.set()
+
+        try:
+            async for text in text_chunks:
+                for sentence in splitter.feed(text):
+                    await speak(sentence)
+            remainder = splitter.flush()
+            if remainder:
+                await speak(remainder)
+            self.text = " ".join(parts)
+        except Exception as e:
+            self.error = e
+        finally:
+            await self._sentences.put(None)
+            self._ready.set()
+            _finish(self)
+
+    async def _synthesize(self, sentence, chunks):
+        try:
+            async for chunk in self.synthesize(sentence):
+                await chunks.put(chunk)
+        except Exception as e:
+            await chunks.put(e)
+        finally:
+            await chunks.put(None)
+
+    async def wait_until_ready(self):
+        """
+        Wait until the first sentence is being synthesised or the text stream ended.
+
+        Raises:
+            Exception: If the text stream failed before producing any sentence.
+        """
+        await self._ready.wait()
+        if self.error is not None and self._sentences.qsize() <= 1:
+            raise self.error
+
+    async def __aiter__(self):
+        first = True
+        try:
+            while True:
+                chunks = await self._sentences.get()
+                if chunks is None:
+                    break
+                try:
+                    while True:
+                        chunk = await chunks.get()
+                        if chunk is None:
+                            break
+                        if isinstance(chunk, Exception):
+                            raise chunk
+                        if first:
+                            first = False
+                            _first_audio(self)
+                        yield chunk
+                finally:
+                    self._slots.release()
+            if self.error is not None:
+                raise self.error
+            _last_audio(self, first)
+        finally:
+            self._cancelled = True
+            for _ in range(self.prefetch):
+                self._slots.release()
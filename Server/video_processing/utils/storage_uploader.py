@@ -0,0 +1,236 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from requests.adapters import HTTPAdapter
+
+from ..config.firebase_config import get_bucket
+from .image_utils import EncodedImage
+from .metrics import observe
+
+# Storage uploads. At most STORAGE_UPLOAD_SLOTS uploads run at once, over a
+# connection pool of the same size. STORAGE_PUBLIC_MODE controls how images
+# are made public: "acl" sends a public-read ACL with the upload itself,
+# "make_public" sets it with a second request (for buckets where predefined
+# ACLs are rejected), and "none" leaves it to the bucket's IAM policy.
+# Up to STORAGE_KNOWN_OBJECTS uploaded object names are remembered so
+# duplicates are not uploaded again.
+STORAGE_UPLOAD_SLOTS = int(os.getenv("STORAGE_UPLOAD_SLOTS", "8"))
+STORAGE_PUBLIC_MODE = os.getenv("STORAGE_PUBLIC_MODE", "acl")
+STORAGE_KNOWN_OBJECTS = int(os.getenv("STORAGE_KNOWN_OBJECTS", "10000"))
+
+PUBLIC_MODES = ("acl", "make_public", "none")
+
+# HTTP status returned when an if_generation_match=0 upload finds the object
+# already exists.
+PRECONDITION_FAILED = 412
+
+
+class UploadStats:
+    """
+    Throughput and latency counters of a StorageUploader.
+    """
+
+    def __init__(self):
+        self.uploads = 0
+        self.deduplicated = 0
+        self.failures = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record_upload(self, size, seconds):
+        with self._lock:
+            self.uploads += 1
+            self.bytes += size
+            self.seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def record_deduplicated(self):
+        with self._lock:
+            self.deduplicated += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "uploads": self.uploads,
+                "deduplicated": self.deduplicated,
+                "failures": self.failures,
+                "bytes": self.bytes,
+                "mean_seconds": self.seconds / self.uploads if self.uploads else 0.0,
+                "max_seconds": self.max_seconds,
+                "bytes_per_second": self.bytes / self.seconds if self.seconds else 0.0,
+            }
+
+
+class StorageUploader:
+    """
+    Upload images to a storage bucket under content-addressed names.
+
+    Each image is stored as "boards/<board id>/<sha256 of the data><ext>", so
+    uploading the same image twice, e.g. when a job is retried, yields the
+    same object. Names already uploaded by this process are skipped, a
+    concurrent upload of the same name waits for the first one, and the
+    upload itself only succeeds if the object does not exist yet
+    (if_generation_match=0), so other processes do not upload it twice either.
+
+    Args:
+        bucket: A google.cloud.storage Bucket, or a fake with the same
+            interface. Defaults to the app's bucket.
+        slots (int): Maximum number of uploads running at once.
+        public_mode (str): How uploaded images are made public, one of PUBLIC_MODES.
+        known_objects (int): Number of uploaded object names remembered.
+    """
+
+    def __init__(
+        self,
+        bucket=None,
+        slots=STORAGE_UPLOAD_SLOTS,
+        public_mode=STORAGE_PUBLIC_MODE,
+        known_objects=STORAGE_KNOWN_OBJECTS,
+    ):
+        if public_mode not in PUBLIC_MODES:
+            raise Exception(
+                f"Unknown storage public mode '{public_mode}', expected one of {PUBLIC_MODES}"
+            )
+        self.bucket = bucket if bucket is not None else get_bucket()
+        self.slots = max(1, slots)
+        self.public_mode = public_mode
+        self.known_objects = known_objects
+        self.stats = UploadStats()
+        self._slots = threading.BoundedSemaphore(self.slots)
+        self._uploaded = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._size_connection_pool()
+
+    def _size_connection_pool(self):
+        # The storage client sends requests through an authorized
+        # requests.Session, whose default pool is smaller than the slots.
+        session = getattr(getattr(self.bucket, "client", None), "_http", None)
+        if hasattr(session, "mount"):
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.slots)
+            session.mount("https://", adapter)
+
+    @staticmethod
+    def object_name(image, board_id):
+        """
+        Content-addressed name of an image in the bucket.
+
+        Args:
+            image (EncodedImage): The image.
+            board_id (str): ID of the board associated with the image.
+
+        Returns:
+            str: The object name.
+        """
+        digest = hashlib.sha256(image.data).hexdigest()[:32]
+        return f"boards/{board_id}/{digest}{image.extension}"
+
+    def _remember(self, name, url):
+        with self._lock:
+            self._uploaded[name] = url
+            self._uploaded.move_to_end(name)
+            while len(self._uploaded) > self.known_objects:
+                self._uploaded.popitem(last=False)
+
+    def upload(self, image, board_id):
+        """
+        Upload an image unless it is already in the bucket.
+
+        Args:
+            image (EncodedImage or str): The encoded image, or a local path of the image file.
+            board_id (str): ID of the board associated with the image.
+
+        Returns:
+            str: Public URL of the image.
+        """
+        if not isinstance(image, EncodedImage):
+            image = EncodedImage.from_file(image)
+        name = self.object_name(image, board_id)
+
+        with self._lock:
+            url = self._uploaded.get(name)
+            waiting_for = self._in_flight.get(name)
+            if url is None and waiting_for is None:
+                done = self._in_flight[name] = threading.Event()
+        if url is not None:
+            self.stats.record_deduplicated()
+            return url
+        if waiting_for is not None:
+            waiting_for.wait()
+            with self._lock:
+                url = self._uploaded.get(name)
+            if url is not None:
+                self.stats.record_deduplicated()
+                return url
+            # The first upload failed; try again.
+            return self.upload(image, board_id)
+
+        try:
+            url = self._upload(name, image)
+            self._remember(name, url)
+            return url
+        finally:
+            with self._lock:
+                del self._in_flight[name]
+            done.set()
+
+    def _upload(self, name, image):
+        blob = self.bucket.blob(name)
+        options = {"content_type": image.content_type, "if_generation_match": 0}
+        if self.public_mode == "acl":
+            options["predefined_acl"] = "publicRead"
+
+        with self._slots:
+            start_time = time.time()
+            try:
+                blob.upload_from_string(image.data, **options)
+            except Exception as e:
+                if getattr(e, "code", None) != PRECONDITION_FAILED:
+                    self.stats.record_failure()
+                    raise
+                # Already uploaded, e.g. by a previous attempt of this job.
+                self.stats.record_deduplicated()
+            else:
+                self.stats.record_upload(image.size, time.time() - start_time)
+            if self.public_mode == "make_public":
+                blob.make_public()
+            observe("storage_upload", time.time() - start_time)
+        return blob.public_url
+
+
+_storage_uploader = None
+_storage_uploader_lock = threading.Lock()
+
+
+def get_storage_uploader():
+    """
+    Get the process-wide storage uploader, creating it on first use.
+
+    Returns:
+        StorageUploader: The shared uploader for the app's bucket.
+    """
+    global _storage_uploader
+    if _storage_uploader is None:
+        with _storage_uploader_lock:
+            if _storage_uploader is None:
+                _storage_uploader = StorageUploader()
+    return _storage_uploader
+
+
+def storage_stats():
+    """
+    Upload counters of the shared storage uploader.
+
+    Returns:
+        dict: See `UploadStats.as_dict`, or an empty dict if nothing was uploaded yet.
+    """
+    return _storage_uploader.stats.as_dict() if _storage_uploader is not None else {}
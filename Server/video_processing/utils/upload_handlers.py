@@ -0,0 +1,297 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from uuid import uuid4
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    StopFutureHandlers,
+    StopUpload,
+)
+
+from .executors import ContextThreadPoolExecutor
+from .metrics import observe
+
+# Incremental processing is opt-in. INCREMENTAL_WORKERS bounds how many
+# upload-time jobs (frame scoring tails, early transcriptions) run at once,
+# and INCREMENTAL_AUDIO_MAX_BYTES caps how much audio is buffered in memory
+# for an early transcription; larger audio waits for the saved file instead.
+INCREMENTAL_UPLOADS = os.getenv("INCREMENTAL_UPLOADS", "0") == "1"
+INCREMENTAL_WORKERS = int(os.getenv("INCREMENTAL_WORKERS", "8"))
+INCREMENTAL_AUDIO_MAX_BYTES = int(os.getenv("INCREMENTAL_AUDIO_MAX_BYTES", "10000000"))
+
+# Upload parts written straight to their final location, as
+# field name -> (directory, filename prefix, extension, maximum size in bytes).
+STORED_UPLOAD_FIELDS = {
+    "video": (
+        "uploads",
+        "video",
+        ".mp4",
+        int(os.getenv("UPLOAD_MAX_VIDEO_BYTES", str(100 * 1024 * 1024))),
+    ),
+    "audio": (
+        "audio",
+        "audio",
+        ".wav",
+        int(os.getenv("UPLOAD_MAX_AUDIO_BYTES", str(20 * 1024 * 1024))),
+    ),
+    "image": (
+        "uploads",
+        "frame",
+        ".jpg",
+        int(os.getenv("UPLOAD_MAX_IMAGE_BYTES", str(10 * 1024 * 1024))),
+    ),
+}
+
+# Audio formats the Pi may upload, as the X-Audio-Format header value ->
+# file extension. Uploads without the header are WAV. The extension is what
+# tells the speech-to-text request how the audio is encoded.
+AUDIO_UPLOAD_FORMATS = {"wav": ".wav", "flac": ".flac", "opus": ".ogg"}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    # Created on the first incremental upload, so installing the handlers
+    # starts no threads.
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ContextThreadPoolExecutor(
+                    max_workers=INCREMENTAL_WORKERS,
+                    thread_name_prefix="incremental-upload",
+                )
+    return _executor
+
+
+class IncrementalUploadHandler(FileUploadHandler):
+    """
+    Start processing an upload while its bytes are still arriving.
+
+    Installed in front of Django's default handlers, this handler sees every
+    chunk first and then passes it on unchanged, so the files are still saved
+    as usual. Along the way:
+
+    - chunks of the "video" part are fed to a `StreamingFrameScorer`, and
+      when the part ends `request.frame_future` resolves to the best frame;
+    - the "audio" part is buffered in memory, and as soon as it ends it is
+      sent for transcription, with `request.transcript_future` resolving to
+      the transcript.
+
+    Either future may be missing or fail, in which case the view falls back
+    to processing the saved files.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.scorer = None
+        self.audio_buffer = None
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        if field_name == "video":
+            from .video_processing import StreamingFrameScorer
+
+            try:
+                self.scorer = StreamingFrameScorer()
+            except Exception:
+                self.scorer = None
+        elif field_name == "audio":
+            self.audio_buffer = io.BytesIO()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.field_name == "video" and self.scorer is not None:
+            self.scorer.feed(raw_data)
+        elif self.field_name == "audio" and self.audio_buffer is not None:
+            if start + len(raw_data) > INCREMENTAL_AUDIO_MAX_BYTES:
+                self.audio_buffer = None
+            else:
+                self.audio_buffer.write(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.field_name == "video" and self.scorer is not None:
+            self.request.frame_future = _get_executor().submit(self.scorer.finish)
+            self.scorer = None
+        elif self.field_name == "audio" and self.audio_buffer is not None:
+            from .api_services import convert_speech_to_text
+
+            self.audio_buffer.seek(0)
+            # The transcription API takes the format from the name. Use the
+            # announced format, as the stored file does, not the client's name.
+            self.audio_buffer.name = f"audio{audio_upload_extension(self.request)}"
+            self.request.transcript_future = _get_executor().submit(
+                convert_speech_to_text, self.audio_buffer
+            )
+            self.audio_buffer = None
+        # Let the next handler build the uploaded file object.
+        return None
+
+    def upload_interrupted(self):
+        if self.scorer is not None:
+            self.scorer.abort()
+            self.scorer = None
+        self.audio_buffer = None
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    An uploaded file that was written straight to its final location.
+
+    Attributes:
+        stored_path (str): Where the file was written.
+        sha256 (str): Hex SHA-256 digest of the file, computed while it streamed in.
+    """
+
+    def __init__(self, stored_path, sha256, name, content_type, size, charset):
+        super().__init__(
+            open(stored_path, "rb"), name, content_type, size, charset
+        )
+        self.stored_path = stored_path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.stored_path
+
+
+class WriteOnceUploadHandler(FileUploadHandler):
+    """
+    Write the "video", "audio" and "image" parts once, straight to their final location.
+
+    Django's default handlers spool large uploads to a temporary file which
+    save_video_file and friends then copy, writing every byte twice.
+    This handler takes over those fields instead: each chunk is appended
+    to a per-request file under the directory save_* would use, the size
+    limit is enforced as the data arrives and a SHA-256 digest is computed on
+    the way. Other fields go to the next handler as usual.
+
+    The time spent writing each part, not waiting for its bytes, is recorded
+    as the "save" stage.
+
+    When a part exceeds its limit the upload is stopped, the partial file is
+    removed and `request.upload_error` explains why.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.file = None
+        self.stored_path = None
+        self.digest = None
+        self.max_size = None
+        self.save_time = 0.0
+
+    def _discard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.stored_path is not None and os.path.exists(self.stored_path):
+            os.remove(self.stored_path)
+        self.stored_path = None
+
+    def _reject(self, message):
+        self._discard()
+        self.request.upload_error = message
+        raise StopUpload(connection_reset=False)
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        if field_name not in STORED_UPLOAD_FIELDS:
+            return
+
+        directory, prefix, extension, self.max_size = STORED_UPLOAD_FIELDS[field_name]
+        if field_name == "audio":
+            extension = audio_upload_extension(self.request)
+        if self.content_length is not None and self.content_length > self.max_size:
+            self._reject(f"{field_name} exceeds {self.max_size} bytes")
+
+        start = time.perf_counter()
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        board_token = self.request.headers.get("X-Token", "unknown")
+        self.stored_path = os.path.join(
+            directory, f"{prefix}-{board_token}-{uuid4().hex[:8]}{extension}"
+        )
+        self.file = open(self.stored_path, "wb")
+        self.digest = hashlib.sha256()
+        self.save_time = time.perf_counter() - start
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.file is None:
+            return raw_data
+        if start + len(raw_data) > self.max_size:
+            self._reject(f"{self.field_name} exceeds {self.max_size} bytes")
+        start = time.perf_counter()
+        self.file.write(raw_data)
+        self.digest.update(raw_data)
+        self.save_time += time.perf_counter() - start
+        return None
+
+    def file_complete(self, file_size):
+        if self.file is None:
+            return None
+        start = time.perf_counter()
+        self.file.close()
+        self.file = None
+        observe("save", self.save_time + time.perf_counter() - start)
+        uploaded = StoredUploadedFile(
+            self.stored_path,
+            self.digest.hexdigest(),
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+        )
+        self.stored_path = None
+        return uploaded
+
+    def upload_interrupted(self):
+        self._discard()
+
+
+def audio_upload_format(request):
+    """
+    The audio format announced by an upload's X-Audio-Format header.
+
+    Args:
+        request (HttpRequest): The incoming request.
+
+    Returns:
+        str: The format, lowercased; "wav" if the header is missing.
+    """
+    return request.headers.get("X-Audio-Format", "wav").strip().lower() or "wav"
+
+
+def audio_upload_extension(request):
+    """
+    File extension for the audio part of an upload.
+
+    Args:
+        request (HttpRequest): The incoming request.
+
+    Returns:
+        str: The extension, ".wav" for unknown formats.
+    """
+    return AUDIO_UPLOAD_FORMATS.get(audio_upload_format(request), ".wav")
+
+
+def install_upload_handlers(request):
+    """
+    Install the upload handlers used by the upload route.
+
+    An IncrementalUploadHandler goes first if INCREMENTAL_UPLOADS is enabled,
+    followed by a WriteOnceUploadHandler in front of Django's defaults. Must
+    be called before request.POST or request.FILES is accessed.
+
+    Args:
+        request (HttpRequest): The incoming request.
+    """
+    handlers = [WriteOnceUploadHandler(request)]
+    if INCREMENTAL_UPLOADS:
+        handlers.insert(0, IncrementalUploadHandler(request))
+    request.upload_handlers = handlers + list(request.upload_handlers)
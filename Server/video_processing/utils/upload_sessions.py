@@ -0,0 +1,329 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from uuid import uuid4
+
+from .upload_handlers import AUDIO_UPLOAD_FORMATS, STORED_UPLOAD_FIELDS
+
+# Resumable upload sessions let a client send its parts in chunks while it is
+# still recording. UPLOAD_SESSION_DIR holds one directory per open session,
+# sessions untouched for UPLOAD_SESSION_TTL seconds are removed, and
+# UPLOAD_CHUNK_MAX_BYTES caps the size of one chunk request.
+UPLOAD_SESSION_DIR = os.getenv("UPLOAD_SESSION_DIR", "sessions")
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", "600"))
+UPLOAD_CHUNK_MAX_BYTES = int(os.getenv("UPLOAD_CHUNK_MAX_BYTES", str(1024 * 1024)))
+
+# Parts a session of each device type must receive before it can complete.
+SESSION_PARTS = {
+    "rpi": ("video", "audio"),
+    "rpi-frame": ("image", "audio"),
+    "android": ("video",),
+}
+
+METADATA_FILE = "session.json"
+
+
+class SessionError(Exception):
+    """
+    A chunk or completion request that does not fit the session's state.
+
+    Attributes:
+        status (int): HTTP status to answer with.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class OffsetMismatch(SessionError):
+    """
+    A chunk that does not start where the stored part ends.
+
+    The client resumes by sending again from `offset`.
+    """
+
+    def __init__(self, part, offset):
+        super().__init__(f"{part} continues at offset {offset}", status=409)
+        self.offset = offset
+
+
+class UploadSession:
+    """
+    An upload whose parts arrive in chunks, stored in its own directory.
+
+    Parts are append-only files, so their size on disk is the offset the
+    next chunk must start at. That keeps the state shared between worker
+    processes and makes a dropped connection harmless: whatever reached the
+    disk counts, and the client resumes from there.
+
+    Args:
+        directory (str): Directory holding the metadata and the parts.
+        metadata (dict): Board token, device type, audio format and creation time.
+    """
+
+    def __init__(self, directory, metadata):
+        self.directory = directory
+        self.metadata_path = os.path.join(directory, METADATA_FILE)
+        self.id = os.path.basename(directory)
+        self.board_token = metadata["board_token"]
+        self.device_type = metadata["device_type"]
+        self.audio_format = metadata.get("audio_format", "wav")
+        self.created_at = metadata.get("created_at", 0.0)
+
+    @property
+    def parts(self):
+        return SESSION_PARTS[self.device_type]
+
+    def _extension(self, part):
+        if part == "audio":
+            return AUDIO_UPLOAD_FORMATS[self.audio_format]
+        return STORED_UPLOAD_FIELDS[part][2]
+
+    def part_path(self, part):
+        return os.path.join(self.directory, part + self._extension(part))
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        """
+        Hold the session lock: shared while appending, so parts can grow in
+        parallel, and exclusive while completing, so a complete waits for
+        every append in flight and runs only once.
+
+        Raises:
+            SessionError: If the session was completed or removed meanwhile.
+        """
+        try:
+            lock_file = open(self.metadata_path, "rb")
+        except FileNotFoundError:
+            raise SessionError("The upload session no longer exists", 404)
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            # A complete holding the lock before us removes the session.
+            if not os.path.exists(self.metadata_path):
+                raise SessionError("The upload session no longer exists", 404)
+            yield
+
+    def offsets(self):
+        """
+        Bytes received so far per part.
+
+        Returns:
+            dict: Offset by part name.
+        """
+        offsets = {}
+        for part in self.parts:
+            path = self.part_path(part)
+            offsets[part] = os.path.getsize(path) if os.path.exists(path) else 0
+        return offsets
+
+    def append(self, part, offset, stream, length):
+        """
+        Append a chunk to a part.
+
+        Args:
+            part (str): Part name, e.g. "video" or "audio".
+            offset (int): Offset the chunk starts at.
+            stream: File-like object the chunk is read from.
+            length (int): Size of the chunk in bytes.
+
+        Returns:
+            int: The part's size after the chunk.
+
+        Raises:
+            SessionError: If the part is unknown or would exceed its size
+                limit, or the session was completed.
+            OffsetMismatch: If the chunk does not start where the part ends.
+        """
+        if part not in self.parts:
+            raise SessionError(f"Unknown part '{part}' for {self.device_type} sessions")
+        if length > UPLOAD_CHUNK_MAX_BYTES:
+            raise SessionError(f"Chunks are limited to {UPLOAD_CHUNK_MAX_BYTES} bytes", 413)
+        max_size = STORED_UPLOAD_FIELDS[part][3]
+        if offset + length > max_size:
+            raise SessionError(f"{part} exceeds {max_size} bytes", 413)
+
+        with self._locked(), open(self.part_path(part), "ab") as part_file:
+            # Two workers could receive chunks of the same part, e.g. a
+            # retried request racing its original.
+            fcntl.flock(part_file, fcntl.LOCK_EX)
+            size = part_file.seek(0, os.SEEK_END)
+            if size != offset:
+                raise OffsetMismatch(part, size)
+            remaining = length
+            while remaining > 0:
+                data = stream.read(min(remaining, 64 * 1024))
+                if not data:
+                    break
+                part_file.write(data)
+                remaining -= len(data)
+            part_file.flush()
+            return part_file.tell()
+
+    def missing_parts(self):
+        """
+        Parts with no bytes yet.
+        """
+        return [part for part, offset in self.offsets().items() if offset == 0]
+
+    def _check_part(self, part, expected):
+        if not isinstance(expected, dict) or not isinstance(expected.get("size"), int):
+            raise SessionError(f"The final size of {part} is required")
+        path = self.part_path(part)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size != expected["size"]:
+            raise SessionError(
+                f"{part} has {size} bytes, expected {expected['size']}", 409
+            )
+        sha256 = expected.get("sha256")
+        if sha256 is not None:
+            digest = hashlib.sha256()
+            with open(path, "rb") as part_file:
+                for block in iter(lambda: part_file.read(1024 * 1024), b""):
+                    digest.update(block)
+            if digest.hexdigest() != sha256.lower():
+                raise SessionError(f"{part} does not match its sha256", 409)
+
+    def finish(self, expected):
+        """
+        Check the parts against what the client sent, then move them to
+        where regular uploads are stored and remove the session.
+
+        Args:
+            expected (dict): Per part, a dict with its final "size" in bytes
+                and optionally its hex "sha256".
+
+        Returns:
+            dict: Path of each part.
+
+        Raises:
+            SessionError: If a part's size or sha256 is missing or does not
+                match, or the session was completed already.
+        """
+        with self._locked(exclusive=True):
+            for part in self.parts:
+                self._check_part(part, expected.get(part))
+            return self._move_parts()
+
+    def _move_parts(self):
+        paths = {}
+        for part in self.parts:
+            directory, prefix = STORED_UPLOAD_FIELDS[part][:2]
+            os.makedirs(directory, exist_ok=True)
+            paths[part] = os.path.join(
+                directory,
+                f"{prefix}-{self.board_token}-{uuid4().hex[:8]}{self._extension(part)}",
+            )
+            os.replace(self.part_path(part), paths[part])
+        shutil.rmtree(self.directory, ignore_errors=True)
+        return paths
+
+
+class UploadSessionStore:
+    """
+    Create and look up upload sessions kept on disk.
+
+    Args:
+        directory (str): Directory holding one subdirectory per session.
+        ttl (float): Seconds a session may go without a chunk before it is removed.
+    """
+
+    def __init__(self, directory=UPLOAD_SESSION_DIR, ttl=UPLOAD_SESSION_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._last_expiry = 0.0
+        self._lock = threading.Lock()
+
+    def create(self, board_token, device_type, audio_format="wav"):
+        """
+        Open a new session.
+
+        Raises:
+            SessionError: If the device type or audio format is not supported.
+        """
+        if device_type not in SESSION_PARTS:
+            raise SessionError(f"Unsupported device type '{device_type}'")
+        if audio_format not in AUDIO_UPLOAD_FORMATS:
+            raise SessionError(f"Unsupported audio format '{audio_format}'", 415)
+        self.expire()
+
+        directory = os.path.join(self.directory, uuid4().hex)
+        os.makedirs(directory)
+        metadata = {
+            "board_token": board_token,
+            "device_type": device_type,
+            "audio_format": audio_format,
+            "created_at": time.time(),
+        }
+        with open(os.path.join(directory, METADATA_FILE), "w") as metadata_file:
+            json.dump(metadata, metadata_file)
+        return UploadSession(directory, metadata)
+
+    def get(self, session_id, board_token):
+        """
+        Look up an open session of a board.
+
+        Returns:
+            UploadSession: The session, or None if there is no such session
+            for this board token.
+        """
+        if not session_id.isalnum():
+            return None
+        directory = os.path.join(self.directory, session_id)
+        try:
+            with open(os.path.join(directory, METADATA_FILE)) as metadata_file:
+                metadata = json.load(metadata_file)
+        except (OSError, ValueError):
+            return None
+        if metadata.get("board_token") != board_token:
+            return None
+        return UploadSession(directory, metadata)
+
+    def expire(self):
+        """
+        Remove sessions whose files have not changed for `ttl` seconds.
+
+        Runs at most once a minute, as a side effect of creating sessions.
+        """
+        now = time.time()
+        with self._lock:
+            if now - self._last_expiry < 60:
+                return
+            self._last_expiry = now
+        if not os.path.isdir(self.directory):
+            return
+        for session_id in os.listdir(self.directory):
+            directory = os.path.join(self.directory, session_id)
+            try:
+                last_change = max(
+                    os.path.getmtime(os.path.join(directory, name))
+                    for name in os.listdir(directory)
+                )
+            except (OSError, ValueError):
+                last_change = 0.0
+            if now - last_change > self.ttl:
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """
+    Get the process-wide upload session store, creating it on first use.
+
+    Returns:
+        UploadSessionStore: The shared store.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = UploadSessionStore()
+    return _store
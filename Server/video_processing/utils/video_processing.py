@@ -1,19 +1,124 @@
 import os
+import subprocess
+import threading
+import time
+
 import cv2
-from imutils import paths
-from moviepy.editor import VideoFileClip
+import numpy as np
+
+from .focus_metrics import get_focus_metric
+from .image_utils import EncodedImage
+from .metrics import timed
+
+# Frame selection tuning, overridable per deployment through the environment.
+# FRAME_SCORE_WIDTH is the width frames are downscaled to before scoring
+# (0 scores at full resolution), FRAME_STRIDE scores every Nth frame,
+# FRAME_TIME_BUDGET caps the seconds spent decoding (0 disables it) and
+# FRAME_GOOD_ENOUGH stops early once a frame reaches that sharpness (0 disables it).
+# Sharpness is measured on the downscaled frame, and does not scale by a fixed
+# factor with resolution, so tune FRAME_GOOD_ENOUGH at the FRAME_SCORE_WIDTH in use.
+# FOCUS_METRIC names the metric from focus_metrics used to score frames, and
+# FOCUS_BATCH_SIZE is how many frames are stacked per vectorized scoring call.
+FRAME_SCORE_WIDTH = int(os.getenv("FRAME_SCORE_WIDTH", "480"))
+FRAME_STRIDE = int(os.getenv("FRAME_STRIDE", "1"))
+FRAME_TIME_BUDGET = float(os.getenv("FRAME_TIME_BUDGET", "0")) or None
+FRAME_GOOD_ENOUGH = float(os.getenv("FRAME_GOOD_ENOUGH", "0")) or None
+FOCUS_METRIC = os.getenv("FOCUS_METRIC", "laplacian")
+FOCUS_BATCH_SIZE = int(os.getenv("FOCUS_BATCH_SIZE", "4"))
+
+# How frames are pulled out of the video. "full" decodes every frame, "sampled"
+# seeks to FRAME_SAMPLES evenly spaced frames and "keyframes" seeks to the
+# keyframes listed by ffprobe (at most FRAME_SAMPLES of them). Streams that
+# cannot seek, such as the raw H.264 uploaded by the Pi, fall back to "full".
+FRAME_DECODE_MODE = os.getenv("FRAME_DECODE_MODE", "full")
+FRAME_SAMPLES = int(os.getenv("FRAME_SAMPLES", "24"))
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+
+# How audio is pulled out of Android videos. "copy" demuxes the existing track
+# without re-encoding, "speech" transcodes to mono Opus at AUDIO_SAMPLE_RATE
+# and "moviepy" keeps the old MP3 re-encode (MoviePy must be installed).
+AUDIO_EXTRACT_MODE = os.getenv("AUDIO_EXTRACT_MODE", "copy")
+AUDIO_SAMPLE_RATE = int(os.getenv("AUDIO_SAMPLE_RATE", "16000"))
+AUDIO_SPEECH_BITRATE = os.getenv("AUDIO_SPEECH_BITRATE", "24k")
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+
+
+class AudioStream:
+    """
+    A file-like view of speech audio being transcoded by ffmpeg.
 
+    Reading from it returns Ogg/Opus bytes as ffmpeg produces them, so the
+    audio can be handed to the speech-to-text request without touching the
+    disk. `name` gives consumers a filename with the right extension.
 
-def extract_audio(video_file_path):
+    Args:
+        process (subprocess.Popen): The ffmpeg process writing to stdout.
+        name (str): Filename reported to consumers.
     """
-    Extract audio from a video file.
 
-    Args:
-        video_file_path (str): Path to the input video file.
+    def __init__(self, process, name):
+        self.process = process
+        self.name = name
+
+    def read(self, size=-1):
+        return self.process.stdout.read(size)
+
+    def close(self):
+        """
+        Close the pipe and reap ffmpeg.
+
+        Raises:
+            Exception: If ffmpeg failed to transcode the audio.
+        """
+        self.process.stdout.close()
+        returncode = self.process.wait()
+        if returncode != 0:
+            raise Exception(f"ffmpeg exited with status {returncode}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _speech_args():
+    """
+    ffmpeg output arguments for compact speech audio: mono Opus at AUDIO_SAMPLE_RATE.
+    """
+    return [
+        "-ac", "1",
+        "-ar", str(AUDIO_SAMPLE_RATE),
+        "-c:a", "libopus",
+        "-b:a", AUDIO_SPEECH_BITRATE,
+        "-application", "voip",
+    ]
+
+
+def _run_ffmpeg(args):
+    """
+    Run ffmpeg quietly.
 
     Returns:
-        str: Path to the extracted audio file (MP3).
+        bool: True if ffmpeg ran and succeeded, False otherwise.
+    """
+    command = [FFMPEG_BINARY, "-nostdin", "-v", "error", "-y"] + args
+    try:
+        subprocess.run(command, capture_output=True, check=True, timeout=60)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return True
+
+
+def _extract_audio_moviepy(video_file_path):
+    """
+    Re-encode the audio track to MP3 with MoviePy, the original extraction path.
     """
+    try:
+        from moviepy.editor import VideoFileClip
+    except ImportError:
+        raise Exception("Audio extraction failed and MoviePy is not installed")
+
     mp3_file = video_file_path.rsplit(".", 1)[0] + ".mp3"
 
     # Load the video clip
@@ -32,6 +137,74 @@ def extract_audio(video_file_path):
     return mp3_file
 
 
+@timed("audio_extraction")
+def extract_audio(video_file_path, mode=AUDIO_EXTRACT_MODE):
+    """
+    Extract audio from a video file.
+
+    In "copy" mode the existing audio stream is demuxed into an M4A file
+    without re-encoding. In "speech" mode it is transcoded straight to
+    16 kHz mono Ogg/Opus. If copying fails, for example because the track is
+    not AAC, speech transcoding is tried next, and MoviePy is only used as a
+    last resort when ffmpeg cannot do either.
+
+    Args:
+        video_file_path (str): Path to the input video file.
+        mode (str): "copy", "speech" or "moviepy". Defaults to AUDIO_EXTRACT_MODE.
+
+    Returns:
+        str: Path to the extracted audio file.
+
+    Raises:
+        Exception: If the mode is unknown or every extraction path fails.
+    """
+    if mode not in ("copy", "speech", "moviepy"):
+        raise Exception(f"Unknown audio extract mode '{mode}'")
+
+    base_path = video_file_path.rsplit(".", 1)[0]
+
+    if mode == "copy":
+        m4a_file = base_path + ".m4a"
+        if _run_ffmpeg(["-i", video_file_path, "-vn", "-c:a", "copy", m4a_file]):
+            return m4a_file
+
+    if mode in ("copy", "speech"):
+        ogg_file = base_path + ".ogg"
+        if _run_ffmpeg(["-i", video_file_path, "-vn"] + _speech_args() + [ogg_file]):
+            return ogg_file
+
+    return _extract_audio_moviepy(video_file_path)
+
+
+def open_audio_stream(video_file_path):
+    """
+    Start transcoding the audio of a video to speech-grade Ogg/Opus on a pipe.
+
+    Args:
+        video_file_path (str): Path to the input video file.
+
+    Returns:
+        AudioStream: A file-like object to read the audio from. Close it, or
+        use it as a context manager, to reap ffmpeg.
+
+    Raises:
+        Exception: If ffmpeg cannot be started.
+    """
+    command = (
+        [FFMPEG_BINARY, "-nostdin", "-v", "error", "-i", video_file_path, "-vn"]
+        + _speech_args()
+        + ["-f", "ogg", "pipe:1"]
+    )
+    try:
+        process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+    except OSError as e:
+        raise Exception(f"Error starting ffmpeg: {e}")
+    base_name = os.path.basename(video_file_path).rsplit(".", 1)[0]
+    return AudioStream(process, f"{base_name}.ogg")
+
+
 def variance_of_laplacian(image):
     """
     Compute the Laplacian variance of an image.
@@ -48,12 +221,19 @@ def variance_of_laplacian(image):
     return cv2.Laplacian(image, cv2.CV_64F).var()
 
 
-def find_least_blurry_frame(directory):
+def find_least_blurry_frame(
+    directory, metric=FOCUS_METRIC, batch_size=FOCUS_BATCH_SIZE
+):
     """
     Find the least blurry image in a directory of images.
 
+    Consecutive images of the same size are stacked and scored together.
+
     Args:
         directory (str): Path to the directory containing images.
+        metric (str): Name of the focus metric to use. Defaults to FOCUS_METRIC.
+        batch_size (int): Maximum number of images scored per call.
+            Defaults to FOCUS_BATCH_SIZE.
 
     Returns:
         str: Path to the least blurry image.
@@ -61,16 +241,34 @@ def find_least_blurry_frame(directory):
     Raises:
         Exception: If no frames are found in the directory.
     """
-    highest_focus_measure = 0
+    from imutils import paths
+
+    focus_metric = get_focus_metric(metric)
+    highest_focus_measure = -1.0
     least_blurry_image_path = None
+    batch, batch_paths = [], []
+
+    def score_batch():
+        nonlocal highest_focus_measure, least_blurry_image_path
+        scores = focus_metric(np.stack(batch))
+        best = int(np.argmax(scores))
+        if scores[best] > highest_focus_measure:
+            highest_focus_measure = float(scores[best])
+            least_blurry_image_path = batch_paths[best]
+        batch.clear()
+        batch_paths.clear()
 
     for image_path in paths.list_images(directory):
-        image = cv2.imread(image_path)
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        fm = variance_of_laplacian(gray)
-        if fm > highest_focus_measure:
-            highest_focus_measure = fm
-            least_blurry_image_path = image_path
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            continue
+        if batch and (gray.shape != batch[0].shape or len(batch) >= batch_size):
+            score_batch()
+        batch.append(gray)
+        batch_paths.append(image_path)
+
+    if batch:
+        score_batch()
 
     if least_blurry_image_path is None:
         raise Exception("No frames found in the directory")
@@ -78,59 +276,589 @@ def find_least_blurry_frame(directory):
     return least_blurry_image_path
 
 
-def extract_and_find_least_blurry_frame(video_file_path, directory="frames"):
+class BestFrameSelector:
     """
-    Extract frames from a video file and find the least blurry frame.
+    Keep track of the sharpest frame seen so far without touching the disk.
 
-    This function processes the video, saves frames to a directory,
-    finds the least blurry frame, and cleans up other frames.
+    Incoming frames are converted to a downscaled grayscale copy and staged
+    in preallocated batch buffers. Once `batch_size` frames are staged they
+    are scored together by the chosen focus metric, and only the best full
+    resolution frame is kept. Nothing is encoded until `encode` or `save` is
+    called, so the chosen frame is encoded exactly once.
+
+    Args:
+        score_width (int): Width frames are downscaled to before scoring.
+            Frames narrower than this, or a value of 0, are scored as is.
+        good_enough (float): Optional sharpness at which `update` reports
+            that the search can stop early, as scored at `score_width`.
+        metric (str): Name of the focus metric to use.
+        batch_size (int): Number of frames scored per metric call.
+    """
+
+    def __init__(
+        self,
+        score_width=FRAME_SCORE_WIDTH,
+        good_enough=None,
+        metric=FOCUS_METRIC,
+        batch_size=FOCUS_BATCH_SIZE,
+    ):
+        self.score_width = score_width
+        self.good_enough = good_enough
+        self.metric = get_focus_metric(metric)
+        self.batch_size = max(1, batch_size)
+        self.best_score = -1.0
+        self.best_index = None
+        self.frames_scored = 0
+        self._best_frame = None
+        self._frame_shape = None
+        self._small_size = None
+        self._gray = None
+        self._batch_small = None
+        self._batch_frames = None
+        self._batch_indices = []
+
+    def _prepare_buffers(self, frame):
+        """
+        (Re)allocate the staging buffers when the frame geometry changes.
+        """
+        if frame.shape == self._frame_shape:
+            return
+        self.flush()
+
+        height, width = frame.shape[:2]
+        if self.score_width and width > self.score_width:
+            small_height = max(1, round(height * self.score_width / width))
+            self._small_size = (self.score_width, small_height)
+        else:
+            self._small_size = (width, height)
+        self._frame_shape = frame.shape
+        self._gray = np.empty((height, width), dtype=np.uint8)
+        self._batch_small = np.empty(
+            (self.batch_size, self._small_size[1], self._small_size[0]), dtype=np.uint8
+        )
+        self._batch_frames = np.empty(
+            (self.batch_size,) + frame.shape, dtype=frame.dtype
+        )
+
+    def update(self, frame, index):
+        """
+        Stage a frame for scoring, scoring the batch once it is full.
+
+        The frame is copied, so callers are free to reuse their decode buffer.
+
+        Args:
+            frame (numpy.ndarray): BGR or grayscale frame.
+            index (int): Position of the frame in the video.
+
+        Returns:
+            bool: True once the best frame reaches the good enough threshold.
+        """
+        self._prepare_buffers(frame)
+        slot = len(self._batch_indices)
+
+        if frame.ndim == 3:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        else:
+            gray = frame
+        if gray.shape[::-1] == self._small_size:
+            np.copyto(self._batch_small[slot], gray)
+        else:
+            cv2.resize(
+                gray,
+                self._small_size,
+                dst=self._batch_small[slot],
+                interpolation=cv2.INTER_AREA,
+            )
+        np.copyto(self._batch_frames[slot], frame)
+        self._batch_indices.append(index)
+
+        if len(self._batch_indices) >= self.batch_size:
+            self.flush()
+        return self.reached_good_enough()
+
+    def flush(self):
+        """
+        Score any staged frames that have not been scored yet.
+        """
+        count = len(self._batch_indices)
+        if not count:
+            return
+
+        scores = self.metric(self._batch_small[:count])
+        best = int(np.argmax(scores))
+        if scores[best] > self.best_score:
+            if self._best_frame is None or self._best_frame.shape != self._frame_shape:
+                self._best_frame = np.empty_like(self._batch_frames[best])
+            np.copyto(self._best_frame, self._batch_frames[best])
+            self.best_score = float(scores[best])
+            self.best_index = self._batch_indices[best]
+
+        self.frames_scored += count
+        self._batch_indices.clear()
+
+    def reached_good_enough(self):
+        """
+        bool: Whether the best scored frame meets the good enough threshold.
+        """
+        return self.good_enough is not None and self.best_score >= self.good_enough
+
+    @property
+    def best_frame(self):
+        """
+        numpy.ndarray: The sharpest frame scored so far, or None.
+        """
+        return self._best_frame if self.best_index is not None else None
+
+    def encode(self, content_type="image/jpeg"):
+        """
+        Score any staged frames and encode the best one in memory.
+
+        Args:
+            content_type (str): MIME type to encode to. Defaults to "image/jpeg".
+
+        Returns:
+            EncodedImage: The encoded best frame.
+
+        Raises:
+            Exception: If no frame has been scored or encoding fails.
+        """
+        self.flush()
+        if self.best_index is None:
+            raise Exception("No frames found in the video")
+        return EncodedImage.from_frame(self._best_frame, content_type)
+
+    def save(self, path):
+        """
+        Score any staged frames, then encode the best one and write it to disk.
+
+        Args:
+            path (str): Destination path. The extension selects the format.
+
+        Returns:
+            str: The path the frame was written to.
+
+        Raises:
+            Exception: If no frame has been scored or writing fails.
+        """
+        self.flush()
+        if self.best_index is None:
+            raise Exception("No frames found in the video")
+        if not cv2.imwrite(path, self._best_frame):
+            raise Exception("Error writing frame")
+        return path
+
+
+def _sequential_frames(cap, frame_stride):
+    """
+    Decode frames in order, grabbing without retrieving the ones skipped by the stride.
+
+    Yields:
+        tuple: The frame index and the frame. The frame buffer is reused.
+    """
+    frame = None
+    frame_count = 0
+    while True:
+        if frame_count % frame_stride:
+            if not cap.grab():
+                return
+            frame_count += 1
+            continue
+
+        ret, frame = cap.read(frame)
+        if not ret:
+            return
+        yield frame_count, frame
+        frame_count += 1
+
+
+def _seeked_frames(cap, positions, prop):
+    """
+    Seek to each position in turn and decode a single frame there.
+
+    Args:
+        cap (cv2.VideoCapture): An opened, seekable capture.
+        positions (list): Positions to visit, in ascending order.
+        prop (int): cv2.CAP_PROP_POS_FRAMES or cv2.CAP_PROP_POS_MSEC.
+
+    Yields:
+        tuple: The frame index and the frame. The frame buffer is reused.
+    """
+    frame = None
+    for position in positions:
+        if not cap.set(prop, position):
+            return
+        ret, frame = cap.read(frame)
+        if not ret:
+            return
+        yield int(cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1, frame
+
+
+def _evenly_spaced(values, count):
+    """
+    Pick at most `count` evenly spaced items from a sorted list.
+    """
+    if len(values) <= count:
+        return list(values)
+    picks = np.linspace(0, len(values) - 1, count).round().astype(int)
+    return [values[i] for i in sorted(set(picks))]
+
+
+def _can_seek(cap):
+    """
+    Check whether a capture reports a frame count and honours a seek into it.
+
+    Containerless streams such as raw H.264 either report no frame count or
+    land somewhere else after a seek. The capture position is undefined
+    afterwards, so callers should reopen it before decoding.
+    """
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if total <= 1:
+        return False
+    target = total // 2
+    if not cap.set(cv2.CAP_PROP_POS_FRAMES, target):
+        return False
+    return abs(cap.get(cv2.CAP_PROP_POS_FRAMES) - target) <= 1
+
+
+def _keyframe_timestamps(video_file_path):
+    """
+    List the keyframe timestamps of the first video stream using ffprobe.
+
+    Only packet headers are read, nothing is decoded.
 
     Args:
         video_file_path (str): Path to the video file.
-        directory (str): Directory to save extracted frames. Defaults to "frames".
 
     Returns:
-        str: Path to the least blurry frame.
+        list: Keyframe timestamps in milliseconds, or None if they are unknown.
+    """
+    command = [
+        FFPROBE_BINARY,
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        video_file_path,
+    ]
+    try:
+        result = subprocess.run(
+            command, capture_output=True, text=True, timeout=10, check=True
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    timestamps = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            timestamps.append(float(pts_time) * 1000)
+    return sorted(timestamps) or None
+
+
+def _frame_source(video_file_path, decode_mode, frame_stride, samples):
+    """
+    Open a video and pick how its frames will be decoded.
+
+    Args:
+        video_file_path (str): Path to the video file.
+        decode_mode (str): "full", "sampled" or "keyframes".
+        frame_stride (int): Stride used for full decoding.
+        samples (int): Maximum number of frames visited by the sparse modes.
+
+    Returns:
+        tuple: The opened capture and an iterator of (index, frame) pairs.
 
     Raises:
-        Exception: If there's an error opening the video file or no frames are found.
+        Exception: If there's an error opening the video file or the mode is unknown.
     """
+    if decode_mode not in ("full", "sampled", "keyframes"):
+        raise Exception(f"Unknown frame decode mode '{decode_mode}'")
+
     cap = cv2.VideoCapture(video_file_path)
     if not cap.isOpened():
         raise Exception("Error opening video file")
 
+    if decode_mode != "full":
+        if decode_mode == "keyframes":
+            positions = _keyframe_timestamps(video_file_path)
+            prop = cv2.CAP_PROP_POS_MSEC
+        else:
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            positions = list(range(total)) if total > 0 else None
+            prop = cv2.CAP_PROP_POS_FRAMES
+
+        seekable = positions is not None and _can_seek(cap)
+        # The seek probe moved the read position, start again from the beginning.
+        cap.release()
+        cap = cv2.VideoCapture(video_file_path)
+        if seekable:
+            return cap, _seeked_frames(cap, _evenly_spaced(positions, samples), prop)
+
+    return cap, _sequential_frames(cap, frame_stride)
+
+
+def select_least_blurry_frame(
+    video_file_path,
+    frame_stride=FRAME_STRIDE,
+    time_budget=FRAME_TIME_BUDGET,
+    good_enough=FRAME_GOOD_ENOUGH,
+    score_width=FRAME_SCORE_WIDTH,
+    metric=FOCUS_METRIC,
+    batch_size=FOCUS_BATCH_SIZE,
+    decode_mode=FRAME_DECODE_MODE,
+    samples=FRAME_SAMPLES,
+):
+    """
+    Decode a video once and keep its least blurry frame in memory.
+
+    The sharpest frame is tracked by a `BestFrameSelector`, so no frames are
+    written to disk. In the sparse decode modes only a few seeked frames are
+    decoded, unless the stream cannot seek.
+
+    Args:
+        video_file_path (str): Path to the video file.
+        frame_stride (int): Score every Nth frame; skipped frames are grabbed
+            but not retrieved. Defaults to FRAME_STRIDE.
+        time_budget (float): Stop decoding after this many seconds. None
+            decodes the whole video. Defaults to FRAME_TIME_BUDGET.
+        good_enough (float): Stop as soon as a frame is at least this sharp.
+            None disables early exit. Defaults to FRAME_GOOD_ENOUGH.
+        score_width (int): Width frames are downscaled to before scoring.
+            Defaults to FRAME_SCORE_WIDTH.
+        metric (str): Name of the focus metric to use. Defaults to FOCUS_METRIC.
+        batch_size (int): Number of frames scored per metric call.
+            Defaults to FOCUS_BATCH_SIZE.
+        decode_mode (str): "full", "sampled" or "keyframes".
+            Defaults to FRAME_DECODE_MODE.
+        samples (int): Maximum number of frames decoded by the sparse modes.
+            Defaults to FRAME_SAMPLES.
+
+    Returns:
+        BestFrameSelector: The selector holding the least blurry frame.
+
+    Raises:
+        Exception: If there's an error opening the video file or no frames are found.
+    """
+    selector = BestFrameSelector(
+        score_width=score_width,
+        good_enough=good_enough,
+        metric=metric,
+        batch_size=batch_size,
+    )
+    cap, frames = _frame_source(
+        video_file_path, decode_mode, max(1, frame_stride), samples
+    )
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    try:
+        for frame_count, frame in frames:
+            if selector.update(frame, frame_count):
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+    finally:
+        cap.release()
+
+    selector.flush()
+    if selector.best_index is None:
+        raise Exception("No frames found in the video")
+    return selector
+
+
+@timed("frame_selection")
+def extract_least_blurry_image(video_file_path, **options):
+    """
+    Find the least blurry frame of a video and encode it in memory.
+
+    Args:
+        video_file_path (str): Path to the video file.
+        **options: Frame selection options, see `select_least_blurry_frame`.
+
+    Returns:
+        EncodedImage: The least blurry frame, encoded as JPEG.
+
+    Raises:
+        Exception: If there's an error opening the video file or no frames are found.
+    """
+    return select_least_blurry_frame(video_file_path, **options).encode()
+
+
+def extract_and_find_least_blurry_frame(video_file_path, directory="frames", **options):
+    """
+    Find the least blurry frame of a video and save it to a directory.
+
+    Only the chosen frame is written, so no other frames need cleaning up.
+
+    Args:
+        video_file_path (str): Path to the video file.
+        directory (str): Directory to save the chosen frame. Defaults to "frames".
+        **options: Frame selection options, see `select_least_blurry_frame`.
+
+    Returns:
+        str: Path to the least blurry frame.
+
+    Raises:
+        Exception: If there's an error opening the video file or no frames are found.
+    """
+    selector = select_least_blurry_frame(video_file_path, **options)
+
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    highest_focus_measure = 0
-    least_blurry_frame_path = None
-    frame_count = 0
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    video_name = os.path.splitext(os.path.basename(video_file_path))[0]
+    return selector.save(
+        os.path.join(directory, f"frame-{video_name}-{selector.best_index}.jpg")
+    )
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        fm = variance_of_laplacian(gray)
 
-        if fm > highest_focus_measure:
-            highest_focus_measure = fm
-            least_blurry_frame_path = os.path.join(
-                directory, f"frame-{frame_count}.jpg"
-            )
-            cv2.imwrite(least_blurry_frame_path, frame)
+class StreamingFrameScorer:
+    """
+    Score video frames while the video bytes are still arriving.
 
-        frame_count += 1
+    Bytes passed to `feed` are piped into an ffmpeg process that decodes them
+    to PPM frames on stdout, and a reader thread hands every `frame_stride`th
+    frame to a `BestFrameSelector`. By the time the last byte is fed, nearly
+    every frame has been scored and `finish` only waits for the tail.
 
-    cap.release()
+    Containers that cannot be decoded from a pipe, such as MP4 files with
+    their index at the end, produce no frames; `finish` then raises and the
+    caller should fall back to `extract_least_blurry_image` on the saved file.
 
-    if least_blurry_frame_path is None:
-        raise Exception("No frames found in the video")
+    Args:
+        frame_stride (int): Score every Nth decoded frame.
+        **options: Options passed to `BestFrameSelector`.
 
-    # Clean up other frames
-    for file in os.listdir(directory):
-        if file != os.path.basename(least_blurry_frame_path):
-            os.remove(os.path.join(directory, file))
+    Raises:
+        Exception: If ffmpeg cannot be started.
+    """
 
-    return least_blurry_frame_path
+    def __init__(self, frame_stride=FRAME_STRIDE, **options):
+        self.frame_stride = max(1, frame_stride)
+        self.selector = BestFrameSelector(**options)
+        self._done = False
+        self._error = None
+        command = [
+            FFMPEG_BINARY,
+            "-nostdin",
+            "-v", "error",
+            "-i", "pipe:0",
+            "-an",
+            "-f", "image2pipe",
+            "-c:v", "ppm",
+            "pipe:1",
+        ]
+        try:
+            self.process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        except OSError as e:
+            raise Exception(f"Error starting ffmpeg: {e}")
+        self._reader = threading.Thread(target=self._read_frames, daemon=True)
+        self._reader.start()
+
+    def _read_exactly(self, buffer):
+        """
+        Fill a buffer from ffmpeg's stdout.
+
+        Returns:
+            bool: False if the stream ended before the buffer was full.
+        """
+        view = memoryview(buffer)
+        while len(view):
+            count = self.process.stdout.readinto(view)
+            if not count:
+                return False
+            view = view[count:]
+        return True
+
+    def _read_frames(self):
+        """
+        Parse PPM frames from ffmpeg and feed them to the selector.
+        """
+        stdout = self.process.stdout
+        rgb_buffer = None
+        bgr = None
+        frame_count = 0
+        try:
+            while not self.selector.reached_good_enough():
+                magic = stdout.readline()
+                if not magic:
+                    break
+                width, height = map(int, stdout.readline().split())
+                stdout.readline()  # Maximum value, always 255 for rgb24
+
+                if rgb_buffer is None or len(rgb_buffer) != width * height * 3:
+                    rgb_buffer = bytearray(width * height * 3)
+                    bgr = np.empty((height, width, 3), dtype=np.uint8)
+                if not self._read_exactly(rgb_buffer):
+                    break
+
+                if frame_count % self.frame_stride == 0:
+                    rgb = np.frombuffer(rgb_buffer, dtype=np.uint8).reshape(
+                        height, width, 3
+                    )
+                    cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR, dst=bgr)
+                    self.selector.update(bgr, frame_count)
+                frame_count += 1
+
+            if self.selector.reached_good_enough():
+                # No need to decode the rest of the video.
+                self.process.kill()
+        except Exception as e:
+            self._error = e
+        finally:
+            # Keep draining so ffmpeg never blocks on a full pipe.
+            while stdout.read(65536):
+                pass
+
+    def feed(self, chunk):
+        """
+        Pass the next chunk of the video to the decoder.
+
+        Feeding stops silently once the decoder has exited, e.g. after a
+        good enough frame was found or the stream turned out undecodable.
+
+        Args:
+            chunk (bytes): The next bytes of the video.
+        """
+        if self._done:
+            return
+        try:
+            self.process.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            self._done = True
+
+    def abort(self):
+        """
+        Stop decoding and reap ffmpeg, e.g. when the upload is interrupted.
+        """
+        self._done = True
+        self.process.kill()
+        self.process.wait()
+        self._reader.join()
+
+    @timed("frame_selection")
+    def finish(self):
+        """
+        Signal the end of the video and wait for the remaining frames.
+
+        Returns:
+            EncodedImage: The least blurry frame, encoded as JPEG.
+
+        Raises:
+            Exception: If decoding failed or no frames were decoded.
+        """
+        self._done = True
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self._reader.join()
+        self.process.wait()
+
+        if self._error is not None:
+            raise Exception(f"Error scoring streamed frames: {self._error}")
+        return self.selector.encode()
@@ -0,0 +1,103 @@
+import importlib
+import os
+import time
+
+from .Logger import Logger
+
+# Set WARM_UP=0 to skip warming up when the WSGI/ASGI application is loaded.
+# Under `gunicorn --preload` that happens once in the master, before the
+# workers are forked, so they all share the already imported modules.
+WARM_UP = os.getenv("WARM_UP", "1") == "1"
+
+# Modules that are slow to import, in the order they are warmed up. The
+# app's own modules come last, since they import the libraries above.
+WARM_UP_MODULES = [
+    "numpy",
+    "cv2",
+    "httpx",
+    "requests",
+    "anthropic",
+    "firebase_admin",
+    "firebase_admin.firestore",
+    "firebase_admin.storage",
+    "video_processing.utils.video_processing",
+    "video_processing.utils.image_utils",
+    "video_processing.utils.response_cache",
+    "video_processing.utils.api_services",
+    "video_processing.utils.firebase_utils",
+    "video_processing.utils.speech_pipeline",
+]
+
+
+def _exercise_opencv():
+    # The first encode and filter calls initialise OpenCV's codecs and
+    # thread pool, which otherwise lands on the first request.
+    import numpy as np
+
+    from .focus_metrics import get_focus_metric
+    from .image_utils import EncodedImage
+    from .video_processing import FOCUS_METRIC, variance_of_laplacian
+
+    frame = np.zeros((64, 64, 3), dtype=np.uint8)
+    EncodedImage.from_frame(frame).decode()
+    variance_of_laplacian(frame[:, :, 0])
+    get_focus_metric(FOCUS_METRIC)(frame[:, :, 0])
+
+
+def _connect():
+    from ..config.firebase_config import get_bucket, get_db
+    from .api_services import get_anthropic_client, get_http_session
+    from .storage_uploader import get_storage_uploader
+
+    get_db()
+    get_bucket()
+    get_storage_uploader()
+    get_http_session()
+    get_anthropic_client()
+
+
+def warm_up(connect=False):
+    """
+    Do the app's one-off start-up work ahead of the first request.
+
+    Imports the slow modules and runs OpenCV once. None of this opens a
+    socket, and the only thread started is the log writer (with LOG_ASYNC),
+    which forked workers replace with their own, so it is safe before
+    forking workers.
+
+    With `connect`, the Firebase and provider clients are created as well.
+    Their connections and gRPC channels do not survive a fork, so only pass
+    it in the process that will serve requests.
+
+    Args:
+        connect (bool): Also create the Firebase and provider clients.
+
+    Returns:
+        dict: Seconds spent on each step, keyed by module or step name.
+    """
+    # Usually the process's first logger, which fixes where the server logs.
+    logger = Logger(log_to_file=True)
+    timings = {}
+    for module in WARM_UP_MODULES:
+        start_time = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.warning(f"Skipping warm-up of {module}: {e}")
+            continue
+        timings[module] = time.perf_counter() - start_time
+
+    steps = [("opencv", _exercise_opencv)]
+    if connect:
+        steps.append(("clients", _connect))
+    for name, step in steps:
+        start_time = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {e}")
+            continue
+        timings[name] = time.perf_counter() - start_time
+
+    logger.info("Warm-up done", stage="warm_up", duration=sum(timings.values()))
+    return timings
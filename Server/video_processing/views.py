@@ -1,104 +1,233 @@
+import asyncio
+import contextvars
+import functools
+import json
 import os
 import time
-import threading
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future
+from uuid import uuid4
 
-from django.http import StreamingHttpResponse, HttpResponse
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse, HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
-from .config.firebase_config import firestore
+from .config.firebase_config import server_timestamp
+# Only what is light to import. OpenCV, the provider clients, the caches and
+# Firebase are imported by the views that use them, on their first request.
 from .utils import (
     save_audio_file,
+    save_image_file,
     save_video_file,
-    convert_speech_to_text,
-    upload_image_to_storage,
-    image_to_text,
-    convert_text_to_speech,
-    add_query_to_board,
     get_time,
-    extract_and_find_least_blurry_frame,
-    extract_audio,
+    install_upload_handlers,
+    AUDIO_UPLOAD_FORMATS,
+    audio_upload_format,
+    audio_upload_extension,
+    get_executor,
+    get_io_executor,
+    run_in_executor,
+    run_in_io_executor,
+    STREAM_SPEECH,
+    SpeechPipeline,
+    AsyncSpeechPipeline,
+    register_job,
+    get_job_queue,
+    QueueFull,
+    observe,
+    render_metrics,
+    job_queue_stats,
+    get_session_store,
+    SessionError,
+    OffsetMismatch,
+    UPLOAD_CHUNK_MAX_BYTES,
 )
 from .utils.Logger import Logger
 
+# Upload variants, set by the X-Device-Type header. "rpi" and "android" send
+# a video; "rpi-frame" is a Pi that picked its sharpest frame while
+# recording and sends only that JPEG with the audio.
+DEVICE_TYPES = ["rpi", "rpi-frame", "android"]
 
-@csrf_exempt
-def unified_upload_video(request):
-    """
-    Unified view function to handle video upload from both RPi and Android devices.
 
-    This function determines the device type based on a header and processes
-    the upload accordingly, handling audio extraction or separate audio files.
+def _parse_upload(request, logger):
     """
-    logger = Logger(log_to_file=True)
+    Validate an upload request and parse its files.
+
+    Shared by the sync and async views. Parsing reads the request body, so the
+    async view runs this in a thread.
+
+    Args:
+        request (HttpRequest): The incoming request.
+        logger (Logger): The logger instance for logging events.
 
+    Returns:
+        tuple: An error HttpResponse, or None together with the board token,
+        device type, video file (the frame image for "rpi-frame") and audio
+        file (None for Android).
+    """
     # Validate request method
     if request.method != "POST":
         logger.warning("Invalid request method")
-        return HttpResponse({"error": "Invalid request method"}, status=405)
+        return HttpResponse({"error": "Invalid request method"}, status=405), None
 
     # Check for board token in headers
     board_token = request.headers.get("X-Token")
     if not board_token:
         logger.error("Token is required")
-        return HttpResponse({"message": "Token is required"}, status=400)
+        return HttpResponse({"message": "Token is required"}, status=400), None
 
     # Determine device type from header
     device_type = request.headers.get("X-Device-Type", "").lower()
-    if device_type not in ["rpi", "android"]:
+    if device_type not in DEVICE_TYPES:
         logger.error("Invalid or missing X-Device-Type header")
-        return HttpResponse(
-            {"message": "Invalid or missing X-Device-Type header"}, status=400
+        return (
+            HttpResponse(
+                {"message": "Invalid or missing X-Device-Type header"}, status=400
+            ),
+            None,
         )
 
-    # Validate presence of video file
-    video_file = request.FILES.get("video")
+    # Check the audio format the Pi announced, before any of it is stored
+    if device_type != "android" and audio_upload_format(request) not in AUDIO_UPLOAD_FORMATS:
+        logger.error(f"Unsupported X-Audio-Format {audio_upload_format(request)}")
+        response = HttpResponse({"message": "Unsupported X-Audio-Format"}, status=415)
+        response["X-Accept-Audio-Format"] = ", ".join(AUDIO_UPLOAD_FORMATS)
+        return response, None
+
+    # Write parts once to their final location, and start scoring frames and
+    # transcribing while the upload streams in if enabled
+    install_upload_handlers(request)
+
+    # Validate presence of the video file, or of the frame the Pi picked itself
+    media_field = "image" if device_type == "rpi-frame" else "video"
+    video_file = request.FILES.get(media_field)
+    upload_error = getattr(request, "upload_error", None)
+    if upload_error:
+        logger.error(f"Upload rejected: {upload_error}")
+        return HttpResponse({"message": "Upload too large"}, status=413), None
     if not video_file:
-        logger.error("Video file is required")
-        return HttpResponse({"message": "Video file is required"}, status=400)
+        message = f"{media_field.capitalize()} file is required"
+        logger.error(message)
+        return HttpResponse({"message": message}, status=400), None
 
     # For RPi, check for separate audio file
-    if device_type == "rpi":
+    audio_file = None
+    if device_type != "android":
         audio_file = request.FILES.get("audio")
         if not audio_file:
             logger.error("Audio file is required for RPi uploads")
-            return HttpResponse(
-                {"message": "Audio file is required for RPi uploads"}, status=400
+            return (
+                HttpResponse(
+                    {"message": "Audio file is required for RPi uploads"}, status=400
+                ),
+                None,
             )
 
+    return None, (board_token, device_type, video_file, audio_file)
+
+
+@csrf_exempt
+def unified_upload_video(request):
+    """
+    Unified view function to handle video upload from both RPi and Android devices.
+
+    This function determines the device type based on a header and processes
+    the upload accordingly, handling audio extraction or separate audio files.
+    A Pi that picked its own frame ("rpi-frame") skips frame selection.
+    """
+    from .utils import extract_audio
+
+    logger = Logger(log_to_file=True)
+    logger.bind(
+        request_id=uuid4().hex[:12], board_token=request.headers.get("X-Token", "")
+    )
+
+    error_response, upload = _parse_upload(request, logger)
+    if error_response is not None:
+        return error_response
+    board_token, device_type, video_file, audio_file = upload
+
     start_time = time.time()
-    logger.info(f"Received upload from {device_type} - Timer started at {start_time}")
+    logger.info("Received upload", device=device_type)
 
     try:
-        # Save video file
-        video_file_path = save_video_file(video_file, board_token)
-        logger.info(f"Video file saved, Time taken: {get_time(start_time)}")
+        video_file_path, frame_future = save_media_file(
+            request, device_type, video_file, board_token, logger, start_time
+        )
 
         # Process audio based on device type
         if device_type == "android":
             audio_file_path = extract_audio(video_file_path)
             logger.info(
-                f"Audio extracted from video, Time taken: {get_time(start_time)}"
+                "Audio extracted from video",
+                stage="audio_extraction",
+                duration=get_time(start_time),
             )
         else:  # RPi
-            audio_file_path = save_audio_file(audio_file, board_token)
-            logger.info(f"Audio file saved, Time taken: {get_time(start_time)}")
+            audio_file_path = save_audio_file(
+                audio_file, board_token, extension=audio_upload_extension(request)
+            )
+            logger.info("Audio file saved", stage="save", duration=get_time(start_time))
 
-        # Process files to extract information
-        least_blurry_frame, transcript, vision_response = process_files(
-            video_file_path, audio_file_path, logger, start_time
+        return respond_to_upload(
+            board_token,
+            video_file_path,
+            audio_file_path,
+            logger,
+            start_time,
+            frame_future=frame_future,
+            transcript_future=getattr(request, "transcript_future", None),
         )
+    except Exception as e:
+        logger.error(f"Error in unified_upload_video: {e}")
+        return HttpResponse({"message": "An error occurred"}, status=500)
 
-        # Convert the vision response to speech
-        audio_stream = convert_text_to_speech(vision_response, board_token)
 
-        # Prepare the streaming response
-        response = StreamingHttpResponse(audio_stream, content_type="audio/mpeg")
+def respond_to_upload(
+    board_token,
+    video_file_path,
+    audio_file_path,
+    logger,
+    start_time,
+    frame_future=None,
+    transcript_future=None,
+):
+    """
+    Answer a saved upload with the spoken vision response.
+
+    Shared by the upload view and completed upload sessions. The image and
+    query are saved by a background job once the response is known.
+
+    Args:
+        board_token (str): The board token for identification.
+        video_file_path (str): Path to the saved video (or frame image).
+        audio_file_path (str): Path to the audio file (extracted or uploaded).
+        logger (Logger): The logger instance for logging events.
+        start_time (float): The start time of the overall process.
+        frame_future (Future): Optional best frame, already known or being scored.
+        transcript_future (Future): Optional transcript started during the upload.
+
+    Returns:
+        StreamingHttpResponse: The MP3 speech of the response.
+    """
+    from .utils import convert_text_to_speech, stream_image_to_text
 
-        # Start a background thread for saving image and query
-        threading.Thread(
-            target=save_image_and_query,
-            args=(
+    if STREAM_SPEECH:
+        least_blurry_frame, transcript = select_frame_and_transcribe(
+            video_file_path,
+            audio_file_path,
+            logger,
+            start_time,
+            frame_future=frame_future,
+            transcript_future=transcript_future,
+        )
+        vision_image = fit_vision_image(least_blurry_frame, logger)
+
+        def save_when_complete(vision_response):
+            logger.info(
+                "Vision response generated", stage="vision", duration=get_time(start_time)
+            )
+            queue_save_image_and_query(
                 least_blurry_frame,
                 board_token,
                 transcript,
@@ -106,51 +235,502 @@ def unified_upload_video(request):
                 video_file_path,
                 audio_file_path,
                 logger,
+            )
+
+        # Speak each sentence of the vision response as soon as it is complete,
+        # timing the speech per response rather than per sentence
+        speech = SpeechPipeline(
+            stream_image_to_text(vision_image, transcript, board_token=board_token),
+            convert_text_to_speech.__wrapped__,
+            on_complete=save_when_complete,
+            on_first_audio=lambda: logger.info(
+                "First audio streamed", stage="tts_first_byte", duration=get_time(start_time)
+            ),
+            on_error=functools.partial(
+                discard_upload, least_blurry_frame, video_file_path, audio_file_path, logger
             ),
-        ).start()
+        )
+        speech.wait_until_ready()
+        logger.info("First sentence sent to TTS", duration=get_time(start_time))
+        observe("request", get_time(start_time))
+        return StreamingHttpResponse(speech, content_type="audio/mpeg")
 
-        return response
-    except Exception as e:
-        logger.error(f"Error in unified_upload_video: {e}")
-        return HttpResponse({"message": "An error occurred"}, status=500)
+    # Process files to extract information
+    least_blurry_frame, transcript, vision_response = process_files(
+        video_file_path,
+        audio_file_path,
+        logger,
+        start_time,
+        frame_future=frame_future,
+        transcript_future=transcript_future,
+        board_token=board_token,
+    )
+
+    # Convert the vision response to speech
+    audio_stream = convert_text_to_speech(vision_response)
+
+    # Prepare the streaming response
+    response = StreamingHttpResponse(audio_stream, content_type="audio/mpeg")
+
+    # Queue saving the image and query as a background job
+    queue_save_image_and_query(
+        least_blurry_frame,
+        board_token,
+        transcript,
+        vision_response,
+        video_file_path,
+        audio_file_path,
+        logger,
+    )
+
+    observe("request", get_time(start_time))
+    return response
+
+
+def save_media_file(request, device_type, video_file, board_token, logger, start_time):
+    """
+    Save the uploaded video, or the frame the Pi picked itself.
+
+    A "rpi-frame" upload carries the Pi's sharpest frame as a JPEG instead
+    of a video, so frame selection is skipped: the returned future already
+    holds that frame. Its file takes the video's place and is removed with
+    the other temporary files.
+
+    Args:
+        request (HttpRequest): The incoming request.
+        device_type (str): The X-Device-Type of the upload.
+        video_file (UploadedFile): The uploaded video, or the frame image.
+        board_token (str): The board token for identification.
+        logger (Logger): The logger instance for logging events.
+        start_time (float): The start time of the overall process.
+
+    Returns:
+        tuple: Path to the saved file, and a Future of the best frame if it
+        is already known (preselected, or scored during the upload) or None.
+    """
+    if device_type == "rpi-frame":
+        image_file_path = save_image_file(video_file, board_token)
+        logger.info("Frame image saved", stage="save", duration=get_time(start_time))
+        return image_file_path, preselected_frame(image_file_path)
+
+    video_file_path = save_video_file(video_file, board_token)
+    logger.info(
+        "Video file saved",
+        stage="save",
+        duration=get_time(start_time),
+        sha256=getattr(video_file, "sha256", None),
+    )
+    return video_file_path, getattr(request, "frame_future", None)
+
+
+def preselected_frame(image_file_path):
+    """
+    Wrap a frame the Pi picked itself in a resolved Future, so frame
+    selection uses it as is.
+    """
+    from .utils import EncodedImage
+
+    frame_future = Future()
+    frame_future.set_result(EncodedImage.from_file(image_file_path))
+    return frame_future
+
+
+def _resolve_or_fallback(future, fallback, *args):
+    """
+    Return the result of a future started during the upload, or compute it
+    from the saved files if there is no such future or it failed.
+    """
+    if future is not None:
+        try:
+            return future.result()
+        except Exception as e:
+            Logger().warning(f"Incremental processing failed, falling back: {e}")
+    return fallback(*args)
+
+
+def select_frame_and_transcribe(
+    video_file_path,
+    audio_file_path,
+    logger,
+    start_time,
+    frame_future=None,
+    transcript_future=None,
+):
+    """
+    Extract the least blurry frame and transcribe the audio concurrently.
+
+    Work already started while the upload was arriving is reused.
+
+    Args:
+        video_file_path (str): Path to the saved video file.
+        audio_file_path (str): Path to the audio file (extracted or uploaded).
+        logger (Logger): The logger instance for logging events.
+        start_time (float): The start time of the overall process.
+        frame_future (Future): Optional best frame scored during the upload.
+        transcript_future (Future): Optional transcript started during the upload.
+
+    Returns:
+        tuple: The least blurry frame (EncodedImage) and transcript.
+    """
+    from .utils import convert_speech_to_text, extract_least_blurry_image
+
+    # Only the frame selection takes a thread of the CPU pool. The
+    # transcription is a network call, made from this thread meanwhile.
+    scored_during_upload = frame_future is not None
+    if not scored_during_upload:
+        frame_future = get_executor().submit(extract_least_blurry_image, video_file_path)
+
+    transcript = _resolve_or_fallback(
+        transcript_future, convert_speech_to_text, audio_file_path
+    )
+    logger.info("Transcript made", stage="stt", duration=get_time(start_time))
+
+    if scored_during_upload:
+        least_blurry_frame = _resolve_or_fallback(
+            frame_future,
+            lambda path: get_executor().submit(extract_least_blurry_image, path).result(),
+            video_file_path,
+        )
+    else:
+        least_blurry_frame = frame_future.result()
+    logger.info("Least blurry frame found", stage="frame_selection", duration=get_time(start_time))
 
+    return least_blurry_frame, transcript
 
-def process_files(video_file_path, audio_file_path, logger, start_time):
+
+def process_files(
+    video_file_path,
+    audio_file_path,
+    logger,
+    start_time,
+    frame_future=None,
+    transcript_future=None,
+    board_token=None,
+):
     """
     Process the video and audio files concurrently.
 
-    This function extracts the least blurry frame from the video,
-    converts speech to text, and generates a vision response.
+    This function extracts the least blurry frame from the video as an
+    in-memory image, converts speech to text, and generates a vision response.
+    Work already started while the upload was arriving is reused.
 
     Args:
         video_file_path (str): Path to the saved video file.
         audio_file_path (str): Path to the audio file (extracted or uploaded).
         logger (Logger): The logger instance for logging events.
         start_time (float): The start time of the overall process.
+        frame_future (Future): Optional best frame scored during the upload.
+        transcript_future (Future): Optional transcript started during the upload.
+        board_token (str): The board asking, so only its cached answers are reused.
 
     Returns:
-        tuple: The least blurry frame, transcript, and vision response.
+        tuple: The least blurry frame (EncodedImage), transcript, and vision response.
     """
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        # Extract least blurry frame from video
-        future_frame = executor.submit(
-            extract_and_find_least_blurry_frame, video_file_path
+    from .utils import image_to_text
+
+    least_blurry_frame, transcript = select_frame_and_transcribe(
+        video_file_path,
+        audio_file_path,
+        logger,
+        start_time,
+        frame_future=frame_future,
+        transcript_future=transcript_future,
+    )
+
+    # Generate vision response based on the frame and transcript
+    vision_image = fit_vision_image(least_blurry_frame, logger)
+    vision_response = image_to_text(vision_image, transcript, board_token=board_token)
+    logger.info("Vision response generated", stage="vision", duration=get_time(start_time))
+
+    return least_blurry_frame, transcript, vision_response
+
+
+def fit_vision_image(least_blurry_frame, logger):
+    """
+    Shrink the frame to the vision payload budget; storage keeps the original.
+
+    Args:
+        least_blurry_frame (EncodedImage): The selected frame.
+        logger (Logger): The logger instance for logging events.
+
+    Returns:
+        EncodedImage: The image to send to the vision model.
+    """
+    from .utils import fit_to_budget
+
+    resize_start = time.time()
+    vision_image = fit_to_budget(least_blurry_frame)
+    logger.info(
+        f"Vision image fitted to budget, {least_blurry_frame.size} -> "
+        f"{vision_image.size} bytes "
+        f"({least_blurry_frame.size - vision_image.size} saved) "
+        f"in {get_time(resize_start):.3f}s"
+    )
+    return vision_image
+
+
+@csrf_exempt
+async def unified_upload_video_async(request):
+    """
+    Async version of `unified_upload_video` for ASGI deployments.
+
+    Provider calls are awaited with async HTTP clients instead of holding a
+    worker thread, and CPU-bound stages run in the shared executor. Frame
+    selection and the audio path (saving or extraction, then transcription)
+    run concurrently with asyncio.gather.
+    """
+    from .utils import (
+        extract_least_blurry_image,
+        extract_audio,
+        convert_speech_to_text_async,
+        convert_text_to_speech_async,
+        image_to_text_async,
+        stream_image_to_text_async,
+    )
+
+    logger = Logger(log_to_file=True)
+    logger.bind(
+        request_id=uuid4().hex[:12], board_token=request.headers.get("X-Token", "")
+    )
+
+    error_response, upload = await sync_to_async(
+        _parse_upload, thread_sensitive=False
+    )(request, logger)
+    if error_response is not None:
+        return error_response
+    board_token, device_type, video_file, audio_file = upload
+
+    start_time = time.time()
+    logger.info("Received upload", device=device_type)
+
+    try:
+        video_file_path, frame_future = await run_in_io_executor(
+            save_media_file, request, device_type, video_file, board_token, logger, start_time
         )
 
-        # Convert speech to text
-        future_transcript = executor.submit(convert_speech_to_text, audio_file_path)
+        async def select_frame():
+            least_blurry_frame = None
+            if frame_future is not None:
+                try:
+                    least_blurry_frame = await asyncio.wrap_future(frame_future)
+                except Exception as e:
+                    logger.warning(f"Incremental processing failed, falling back: {e}")
+            if least_blurry_frame is None:
+                least_blurry_frame = await run_in_executor(
+                    extract_least_blurry_image, video_file_path
+                )
+            logger.info(
+                "Least blurry frame found", stage="frame_selection", duration=get_time(start_time)
+            )
+            return least_blurry_frame
 
-        least_blurry_frame = future_frame.result()
-        logger.info(f"Least blurry frame found, Time taken: {get_time(start_time)}")
+        async def transcribe():
+            # Process audio based on device type
+            if device_type == "android":
+                audio_file_path = await run_in_executor(extract_audio, video_file_path)
+                logger.info(
+                    "Audio extracted from video",
+                    stage="audio_extraction",
+                    duration=get_time(start_time),
+                )
+            else:  # RPi
+                audio_file_path = await run_in_io_executor(
+                    save_audio_file,
+                    audio_file,
+                    board_token,
+                    extension=audio_upload_extension(request),
+                )
+                logger.info("Audio file saved", stage="save", duration=get_time(start_time))
 
-        transcript = future_transcript.result()
-        logger.info(f"Transcript made, Time taken: {get_time(start_time)}")
+            transcript = None
+            transcript_future = getattr(request, "transcript_future", None)
+            if transcript_future is not None:
+                try:
+                    transcript = await asyncio.wrap_future(transcript_future)
+                except Exception as e:
+                    logger.warning(f"Incremental processing failed, falling back: {e}")
+            if transcript is None:
+                transcript = await convert_speech_to_text_async(audio_file_path)
+            logger.info("Transcript made", stage="stt", duration=get_time(start_time))
+            return audio_file_path, transcript
+
+        least_blurry_frame, (audio_file_path, transcript) = await asyncio.gather(
+            select_frame(), transcribe()
+        )
+
+        vision_image = await run_in_executor(
+            fit_vision_image, least_blurry_frame, logger
+        )
+
+        if STREAM_SPEECH:
+
+            def save_when_complete(vision_response):
+                logger.info(
+                    "Vision response generated", stage="vision", duration=get_time(start_time)
+                )
+                # Queueing may block on a full queue, so keep it off the event loop
+                get_io_executor().submit(
+                    queue_save_image_and_query,
+                    least_blurry_frame,
+                    board_token,
+                    transcript,
+                    vision_response,
+                    video_file_path,
+                    audio_file_path,
+                    logger,
+                )
+
+            def discard_when_failed(error):
+                get_io_executor().submit(
+                    discard_upload,
+                    least_blurry_frame,
+                    video_file_path,
+                    audio_file_path,
+                    logger,
+                    error,
+                )
+
+            # Speak each sentence of the vision response as soon as it is complete,
+            # timing the speech per response rather than per sentence
+            speech = AsyncSpeechPipeline(
+                stream_image_to_text_async(vision_image, transcript, board_token=board_token),
+                convert_text_to_speech_async.__wrapped__,
+                on_complete=save_when_complete,
+                on_first_audio=lambda: logger.info(
+                    "First audio streamed", stage="tts_first_byte", duration=get_time(start_time)
+                ),
+                on_error=discard_when_failed,
+            )
+            await speech.wait_until_ready()
+            logger.info("First sentence sent to TTS", duration=get_time(start_time))
+            observe("request", get_time(start_time))
+            return StreamingHttpResponse(speech, content_type="audio/mpeg")
 
         # Generate vision response based on the frame and transcript
-        vision_response = image_to_text(least_blurry_frame, transcript)
-        logger.info(f"Vision response generated, Time taken: {get_time(start_time)}")
+        vision_response = await image_to_text_async(
+            vision_image, transcript, board_token=board_token
+        )
+        logger.info("Vision response generated", stage="vision", duration=get_time(start_time))
+
+        # Stream the speech for the vision response as it is synthesised
+        response = StreamingHttpResponse(
+            convert_text_to_speech_async(vision_response),
+            content_type="audio/mpeg",
+        )
+
+        # Queue saving the image and query as a background job
+        await run_in_io_executor(
+            queue_save_image_and_query,
+            least_blurry_frame,
+            board_token,
+            transcript,
+            vision_response,
+            video_file_path,
+            audio_file_path,
+            logger,
+        )
+
+        observe("request", get_time(start_time))
+        return response
+    except Exception as e:
+        logger.error(f"Error in unified_upload_video_async: {e}")
+        return HttpResponse({"message": "An error occurred"}, status=500)
+
+def queue_save_image_and_query(
+    least_blurry_frame,
+    board_token,
+    transcript,
+    vision_response,
+    video_file_path,
+    audio_file_path,
+    logger,
+):
+    """
+    Queue `save_image_and_query` as a durable background job.
+
+    The frame is stored with the job, and the query ID is chosen now so a job
+    replayed after a crash saves the same query document again. If the job
+    queue rejects the job, the query is dropped and the temporary files are
+    removed.
+
+    Args:
+        least_blurry_frame (EncodedImage): The least blurry frame, encoded in memory.
+        board_token (str): The board token for identification.
+        transcript (str): The generated transcript from audio.
+        vision_response (str): The generated vision response.
+        video_file_path (str): Path to the temporary video file.
+        audio_file_path (str): Path to the temporary audio file.
+        logger (Logger): The logger instance for logging events.
+    """
+    from .utils import generate_query_id
+
+    payload = {
+        "board_token": board_token,
+        "transcript": transcript,
+        "vision_response": vision_response,
+        "video_file_path": video_file_path,
+        "audio_file_path": audio_file_path,
+        "content_type": least_blurry_frame.content_type,
+        "query_id": generate_query_id(),
+    }
+    try:
+        get_job_queue().submit("save_image_and_query", payload, least_blurry_frame.data)
+    except QueueFull as e:
+        logger.error(f"Query from {board_token} not saved: {e}")
+        _remove_files(video_file_path, audio_file_path)
+    finally:
+        least_blurry_frame.cleanup()
+
+
+def discard_upload(least_blurry_frame, video_file_path, audio_file_path, logger, error):
+    """
+    Release an upload whose vision response failed while it was streamed.
+
+    There is no query to save, so the failure is logged and the temporary
+    files are removed.
+
+    Args:
+        least_blurry_frame (EncodedImage): The least blurry frame, encoded in memory.
+        video_file_path (str): Path to the temporary video file.
+        audio_file_path (str): Path to the temporary audio file.
+        logger (Logger): The logger instance for logging events.
+        error (Exception): Why the vision response failed, or None if it was cancelled.
+    """
+    try:
+        logger.error(f"Vision response failed, query not saved: {error or 'cancelled'}")
+    finally:
+        _remove_files(video_file_path, audio_file_path)
+        least_blurry_frame.cleanup()
+
+
+def _remove_files(*file_paths):
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def _remove_job_files(payload, data):
+    # The query could not be saved; still remove its temporary files.
+    _remove_files(payload["video_file_path"], payload["audio_file_path"])
+
+
+@register_job("save_image_and_query", on_failure=_remove_job_files)
+def _save_image_and_query_job(payload, data):
+    from .utils import EncodedImage
+
+    # The job stays open until the query's batch is committed.
+    return save_image_and_query(
+        EncodedImage(data, payload["content_type"]),
+        payload["board_token"],
+        payload["transcript"],
+        payload["vision_response"],
+        payload["video_file_path"],
+        payload["audio_file_path"],
+        Logger(),
+        query_id=payload["query_id"],
+        raise_errors=True,
+    )
 
-    return least_blurry_frame, transcript, vision_response
 
 def save_image_and_query(
     least_blurry_frame,
@@ -160,42 +740,302 @@ def save_image_and_query(
     video_file_path,
     audio_file_path,
     logger,
+    query_id=None,
+    raise_errors=False,
 ):
     """
     Save the processed image and query to storage and database.
 
-    This function runs as a background task to upload the image,
+    This function runs as a background job to upload the image,
     save the query, and clean up temporary files.
 
     Args:
-        least_blurry_frame (str): Path to the least blurry frame image.
+        least_blurry_frame (EncodedImage): The least blurry frame, encoded in memory.
         board_token (str): The board token for identification.
         transcript (str): The generated transcript from audio.
         vision_response (str): The generated vision response.
         video_file_path (str): Path to the temporary video file.
         audio_file_path (str): Path to the temporary audio file.
         logger (Logger): The logger instance for logging events.
+        query_id (str): ID to store the query under. Generated if omitted.
+        raise_errors (bool): Re-raise errors after logging them, so a job can be retried.
+
+    Returns:
+        Future: Resolves once the query is written to the database, see
+        `queue_query_for_board`. None if saving failed before that.
     """
+    from .utils import upload_image_to_storage, queue_query_for_board
+
+    start_time = time.time()
     try:
         # Upload the least blurry frame to storage
         image_url = upload_image_to_storage(least_blurry_frame, board_token)
-        logger.info(f"Image uploaded, Time taken: {get_time(time.time())}")
+        logger.info("Image uploaded", stage="storage_upload", duration=get_time(start_time))
 
-        # Save the query to the board
-        add_query_to_board(
+        # Save the query to the board, batched in the background if enabled
+        saved = queue_query_for_board(
             board_token,
             {
                 "prompt": transcript,
                 "response": vision_response,
-                "created_at": firestore.SERVER_TIMESTAMP,
+                "created_at": server_timestamp(),
                 "image_url": image_url,
             },
+            query_id,
         )
-        logger.info(f"Query saved, Time taken: {get_time(time.time())}")
 
-        # Clean up temporary files
-        for file_path in [video_file_path, audio_file_path, least_blurry_frame]:
-            os.remove(file_path)
+        def log_saved(future):
+            # Only once the write is committed; dropped writes are logged by the writer.
+            if future.exception() is None:
+                logger.info("Query saved", stage="firestore_write", duration=get_time(start_time))
+
+        # Run in the writer's thread, with this request's log context.
+        saved.add_done_callback(functools.partial(contextvars.copy_context().run, log_saved))
+
+        # Clean up temporary files, which a replayed job may have removed already
+        for file_path in [video_file_path, audio_file_path]:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        least_blurry_frame.cleanup()
         logger.info("Temporary files removed")
+        return saved
     except Exception as e:
         logger.error(f"Error in saving image and query: {e}")
+        if raise_errors:
+            raise
+
+
+def _session_request(request, session_id, logger):
+    """
+    Look up the upload session a request refers to.
+
+    Returns:
+        tuple: An error HttpResponse, or None together with the session.
+    """
+    board_token = request.headers.get("X-Token")
+    if not board_token:
+        logger.error("Token is required")
+        return HttpResponse({"message": "Token is required"}, status=400), None
+    session = get_session_store().get(session_id, board_token)
+    if session is None:
+        logger.warning(f"Unknown upload session {session_id}")
+        return HttpResponse({"message": "Upload session not found"}, status=404), None
+    return None, session
+
+
+@csrf_exempt
+def create_upload_session(request):
+    """
+    Open a resumable upload session.
+
+    Takes the same X-Token, X-Device-Type and X-Audio-Format headers as an
+    upload. The client then appends its parts in chunks while it is still
+    recording, and completes the session once the button is released, so
+    the server only waits for the last chunk instead of the whole upload.
+
+    Returns:
+        JsonResponse: The session ID and the largest chunk accepted, with
+        status 201.
+    """
+    logger = Logger(log_to_file=True)
+    logger.bind(
+        request_id=uuid4().hex[:12], board_token=request.headers.get("X-Token", "")
+    )
+
+    if request.method != "POST":
+        logger.warning("Invalid request method")
+        return HttpResponse({"error": "Invalid request method"}, status=405)
+
+    board_token = request.headers.get("X-Token")
+    if not board_token:
+        logger.error("Token is required")
+        return HttpResponse({"message": "Token is required"}, status=400)
+
+    device_type = request.headers.get("X-Device-Type", "").lower()
+    try:
+        session = get_session_store().create(
+            board_token, device_type, audio_upload_format(request)
+        )
+    except SessionError as e:
+        logger.error(f"Upload session rejected: {e}")
+        response = HttpResponse({"message": str(e)}, status=e.status)
+        if e.status == 415:
+            response["X-Accept-Audio-Format"] = ", ".join(AUDIO_UPLOAD_FORMATS)
+        return response
+
+    logger.info("Upload session opened", device=device_type, session_id=session.id)
+    return JsonResponse(
+        {"session_id": session.id, "chunk_size": UPLOAD_CHUNK_MAX_BYTES}, status=201
+    )
+
+
+@csrf_exempt
+def upload_session_status(request, session_id):
+    """
+    Report how many bytes of each part a session holds, so a client that
+    lost its connection knows where to resume.
+
+    Returns:
+        JsonResponse: The offset of each part.
+    """
+    logger = Logger(log_to_file=True)
+    logger.bind(
+        request_id=uuid4().hex[:12],
+        board_token=request.headers.get("X-Token", ""),
+        session_id=session_id,
+    )
+
+    error_response, session = _session_request(request, session_id, logger)
+    if error_response is not None:
+        return error_response
+    return JsonResponse({"session_id": session.id, "offsets": session.offsets()})
+
+
+@csrf_exempt
+def upload_session_part(request, session_id, part):
+    """
+    Append a chunk to one part of an upload session.
+
+    The X-Upload-Offset header says where in the part the chunk starts. It
+    must match the bytes stored so far; otherwise the answer is 409 with the
+    offset to resume from, so a retried chunk is never stored twice.
+
+    Returns:
+        JsonResponse: The part and its offset after the chunk.
+    """
+    logger = Logger(log_to_file=True)
+    logger.bind(
+        request_id=uuid4().hex[:12],
+        board_token=request.headers.get("X-Token", ""),
+        session_id=session_id,
+    )
+
+    if request.method != "PUT":
+        logger.warning("Invalid request method")
+        return HttpResponse({"error": "Invalid request method"}, status=405)
+
+    error_response, session = _session_request(request, session_id, logger)
+    if error_response is not None:
+        return error_response
+
+    try:
+        offset = int(request.headers.get("X-Upload-Offset", ""))
+        length = int(request.headers.get("Content-Length", ""))
+    except ValueError:
+        return HttpResponse(
+            {"message": "X-Upload-Offset and Content-Length are required"}, status=400
+        )
+
+    try:
+        # Read the body as a stream, so chunks are not limited by
+        # DATA_UPLOAD_MAX_MEMORY_SIZE and never held in memory whole
+        new_offset = session.append(part, offset, request, length)
+    except OffsetMismatch as e:
+        logger.warning(f"Upload session {session_id}: {e}")
+        response = JsonResponse({"part": part, "offset": e.offset}, status=409)
+        response["X-Upload-Offset"] = str(e.offset)
+        return response
+    except SessionError as e:
+        logger.error(f"Upload session {session_id}: {e}")
+        return HttpResponse({"message": str(e)}, status=e.status)
+
+    return JsonResponse({"part": part, "offset": new_offset})
+
+
+@csrf_exempt
+def complete_upload_session(request, session_id):
+    """
+    Complete an upload session and answer it like a regular upload.
+
+    The JSON body gives the final size, and optionally the sha256, of each
+    part: {"parts": {"audio": {"size": 1234, "sha256": "..."}, ...}}. Parts
+    that do not match are rejected with 409. Otherwise they are moved to
+    where regular uploads are stored, then processed by `respond_to_upload`.
+
+    Returns:
+        StreamingHttpResponse: The MP3 speech of the response.
+    """
+    from .utils import extract_audio
+
+    logger = Logger(log_to_file=True)
+    logger.bind(
+        request_id=uuid4().hex[:12],
+        board_token=request.headers.get("X-Token", ""),
+        session_id=session_id,
+    )
+
+    if request.method != "POST":
+        logger.warning("Invalid request method")
+        return HttpResponse({"error": "Invalid request method"}, status=405)
+
+    error_response, session = _session_request(request, session_id, logger)
+    if error_response is not None:
+        return error_response
+
+    missing_parts = session.missing_parts()
+    if missing_parts:
+        message = f"Missing parts: {', '.join(missing_parts)}"
+        logger.error(message)
+        return HttpResponse({"message": message}, status=400)
+
+    try:
+        expected = json.loads(request.body or b"{}").get("parts") or {}
+    except (ValueError, AttributeError):
+        return HttpResponse({"message": "Invalid JSON body"}, status=400)
+
+    start_time = time.time()
+    logger.info(
+        "Completing upload session", device=session.device_type, session_id=session.id
+    )
+
+    try:
+        paths = session.finish(expected)
+        logger.info("Session parts saved", stage="save", duration=get_time(start_time))
+
+        frame_future = None
+        if session.device_type == "rpi-frame":
+            video_file_path = paths["image"]
+            frame_future = preselected_frame(video_file_path)
+        else:
+            video_file_path = paths["video"]
+
+        if session.device_type == "android":
+            audio_file_path = extract_audio(video_file_path)
+            logger.info(
+                "Audio extracted from video",
+                stage="audio_extraction",
+                duration=get_time(start_time),
+            )
+        else:
+            audio_file_path = paths["audio"]
+
+        return respond_to_upload(
+            session.board_token,
+            video_file_path,
+            audio_file_path,
+            logger,
+            start_time,
+            frame_future=frame_future,
+        )
+    except SessionError as e:
+        logger.error(f"Upload session {session_id} not completed: {e}")
+        return HttpResponse({"message": str(e)}, status=e.status)
+    except Exception as e:
+        logger.error(f"Error in complete_upload_session: {e}")
+        return HttpResponse({"message": "An error occurred"}, status=500)
+
+
+def metrics(request):
+    """
+    Expose stage latencies, cache, job queue and storage counters for Prometheus.
+    """
+    from .utils import cache_stats, storage_stats
+
+    page = render_metrics(
+        {
+            "cache": cache_stats(),
+            "jobs": {"default": job_queue_stats()},
+            "storage": {"default": storage_stats()},
+        }
+    )
+    return HttpResponse(page, content_type="text/plain; version=0.0.4")